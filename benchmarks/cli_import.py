@@ -0,0 +1,65 @@
+# -*- coding: utf8 -*-
+"""Benchmark of cold start of `youtiao`, failing when it exceeds its budget
+
+Each case runs in a fresh interpreter. Times are medians over the bare interpreter start, and the heavy
+dependencies of subcommands must not be imported::
+
+    python benchmarks/cli_import.py --runs 10 --import-budget 100 --help-budget 150
+"""
+
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+import click
+
+
+# imported only by the subcommands using them
+HEAVY_MODULES = ('docker', 'grpc_tools', 'requests', 'jinja2')
+CASES = [
+    ('import youtiao', 'import youtiao'),
+    ('youtiao --help', "from youtiao import cli; cli(['--help'], prog_name='youtiao', standalone_mode=False)"),
+]
+# prints heavy modules imported by a case to stderr
+CHECK_MODULES = "\nimport sys; print(' '.join(m for m in {!r} if m in sys.modules), file=sys.stderr)".format(
+    HEAVY_MODULES)
+
+
+def run_python(code: str) -> str:
+    """Run code in a fresh interpreter, returns its error output"""
+    return subprocess.run([sys.executable, '-c', code], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          check=True, universal_newlines=True).stderr
+
+
+def median_seconds(code: str, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = perf_counter()
+        run_python(code)
+        times.append(perf_counter() - start)
+    return statistics.median(times)
+
+
+@click.command()
+@click.option('--runs', type=int, default=10, help='number of runs of each case')
+@click.option('--import-budget', type=float, default=100, help='max milliseconds of `import youtiao`')
+@click.option('--help-budget', type=float, default=150, help='max milliseconds of `youtiao --help`')
+def main(runs, import_budget, help_budget):
+    bare = median_seconds('pass', runs)
+    click.secho('Bare interpreter: {:.1f} ms'.format(bare * 1e3))
+    passed = True
+    for (name, code), budget in zip(CASES, (import_budget, help_budget)):
+        seconds = median_seconds(code, runs) - bare
+        heavy = run_python(code + CHECK_MODULES).split()
+        ok = seconds * 1e3 <= budget and not heavy
+        passed &= ok
+        click.secho('{:<16}{:>8.1f} ms (budget {:.0f} ms){}'.format(
+            name, seconds * 1e3, budget, ', imports ' + ' '.join(heavy) if heavy else ''),
+            fg=None if ok else 'red')
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
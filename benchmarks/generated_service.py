@@ -0,0 +1,52 @@
+# -*- coding: utf8 -*-
+"""Service generated from templates, for benchmarks of generated code"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+base_path = Path(__file__).parent.resolve()
+# repository root, to run without installing youtiao
+sys.path.insert(0, os.path.dirname(base_path))
+
+from youtiao.commands.boilerplate import SERVICE_MODES, generate_project
+
+
+APP_NAME = 'benchsvc'
+# config sections of databases not run for benchmarks, in-memory fake redis is used without `redis`
+DATABASE_SECTIONS = ('mysql', 'postgre', 'redis', 'sqlite')
+
+
+def generate_service(mode: str) -> str:
+    """Generate service into a temporary directory removed at exit, and put it on import path
+
+    The service loads its default config without database sections, and its proto modules are
+    importable as generated gRPC code expects.
+
+    Args:
+        mode (str): service type, `http` or `grpc`
+
+    Returns:
+        name of service package
+    """
+    tmp_dir = tempfile.mkdtemp(prefix='youtiao-bench-')
+    atexit.register(shutil.rmtree, tmp_dir, True)
+    generate_project('python', tmp_dir, APP_NAME, SERVICE_MODES[mode])
+    project_path = os.path.join(tmp_dir, APP_NAME)
+    config_path = os.path.join(project_path, 'config', 'default.yaml')
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    for section in DATABASE_SECTIONS:
+        config.pop(section, None)
+    config_path = os.path.join(tmp_dir, 'bench.yaml')
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(config, f)
+    os.environ['{}_CONFIG_PATH'.format(APP_NAME.upper())] = config_path
+    sys.path.insert(0, project_path)
+    sys.path.append(os.path.join(project_path, APP_NAME, 'proto'))
+    return APP_NAME
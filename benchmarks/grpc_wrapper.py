@@ -0,0 +1,92 @@
+# -*- coding: utf8 -*-
+"""Microbenchmark of per-RPC overhead of `grpc_wrapper` of generated gRPC service
+
+    python benchmarks/grpc_wrapper.py --fields 200 --depth 3 --number 2000
+"""
+
+import importlib
+import json
+import logging
+import os
+import timeit
+
+import click
+from google.protobuf.struct_pb2 import Struct
+
+from generated_service import generate_service
+
+
+class Context(object):
+    """Stub of grpc.ServicerContext"""
+
+    def set_code(self, code):
+        pass
+
+    def set_details(self, details):
+        pass
+
+
+def make_request(fields: int, depth: int) -> Struct:
+    """Message with `fields` fields on each of `depth` nested levels"""
+    req = Struct()
+    node = req
+    for level in range(depth + 1):
+        for i in range(fields):
+            node['field{}'.format(i)] = 'value {}'.format(i)
+        node = node.get_or_create_struct('nested{}'.format(level))
+    return req
+
+
+@click.command()
+@click.option('--fields', type=int, default=200, help='number of fields on each level of request')
+@click.option('--depth', type=int, default=3, help='number of nested levels of request')
+@click.option('--number', type=int, default=2000, help='number of calls of each case')
+def main(fields, depth, number):
+    app_name = generate_service('grpc')
+    app = importlib.import_module(app_name)
+    grpc_wrapper = importlib.import_module('{}.Grpc'.format(app_name)).grpc_wrapper
+    pb2dict = importlib.import_module('{}.utils'.format(app_name)).pb2dict
+    Null = importlib.import_module('{0}.proto.{0}_pb2'.format(app_name)).Null
+
+    class BenchAPI(object):
+
+        def Echo(self, req, ctx):
+            return Null()
+
+        def EagerEcho(self, req, ctx):
+            # request serialized on every call as the wrapper used to do
+            json.dumps(pb2dict(req))
+            return Null()
+
+    # keep log formatting but discard output
+    handlers = logging.getLogger().handlers
+    for handler in handlers:
+        handler.setStream(open(os.devnull, 'w'))
+    # levels of logger and handlers from config
+    logger = app.logger
+    logger_level, handler_levels = logger.level, [handler.level for handler in handlers]
+
+    req = make_request(fields, depth)
+    ctx = Context()
+    api = BenchAPI()
+    wrapped = grpc_wrapper(BenchAPI)()
+    click.secho('request of {} bytes'.format(req.ByteSize()))
+
+    cases = [
+        ('handler only', None, lambda: api.Echo(req, ctx)),
+        ('wrapper, config levels', None, lambda: wrapped.Echo(req, ctx)),
+        ('wrapper, INFO level', logging.INFO, lambda: wrapped.Echo(req, ctx)),
+        ('wrapper, DEBUG output', logging.DEBUG, lambda: wrapped.Echo(req, ctx)),
+        ('eager serialization', None, lambda: wrapped.EagerEcho(req, ctx)),
+    ]
+    for name, level, call in cases:
+        # DEBUG output needs both logger and handlers at DEBUG
+        logger.setLevel(level or logger_level)
+        for handler, handler_level in zip(handlers, handler_levels):
+            handler.setLevel(min(level, handler_level) if level == logging.DEBUG else handler_level)
+        seconds = min(timeit.repeat(call, number=number, repeat=3))
+        click.secho('{:<24}{:>10.1f} us per call'.format(name, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
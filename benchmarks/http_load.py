@@ -0,0 +1,96 @@
+# -*- coding: utf8 -*-
+"""Load test of HTTP server of generated service, reporting requests per second and latency
+
+Compare development server with gevent WSGI server of a service generated with `youtiao init`.
+Start the service from its project folder, with `app.debug: True` in config for development server::
+
+    python start.py
+
+then load it from this repository::
+
+    python benchmarks/http_load.py --concurrency 50 --duration 10
+"""
+
+import http.client
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+import click
+
+
+class Worker(threading.Thread):
+    """Send requests one after another until deadline"""
+
+    def __init__(self, url: str, deadline: float, keepalive: bool=True):
+        super(Worker, self).__init__(daemon=True)
+        self.url = urlsplit(url)
+        self.deadline = deadline
+        self.keepalive = keepalive
+        self.latencies = []
+        self.errors = 0
+        self.conn = None
+
+    def connect(self):
+        if self.url.scheme == 'https':
+            # load test of self-signed certificates
+            return http.client.HTTPSConnection(self.url.netloc, timeout=10,
+                                               context=ssl._create_unverified_context())
+        return http.client.HTTPConnection(self.url.netloc, timeout=10)
+
+    def run(self):
+        path = self.url.path + ('?' + self.url.query if self.url.query else '')
+        headers = {} if self.keepalive else {'Connection': 'close'}
+        while time.time() < self.deadline:
+            st = time.time()
+            try:
+                if self.conn is None:
+                    self.conn = self.connect()
+                self.conn.request('GET', path, headers=headers)
+                res = self.conn.getresponse()
+                res.read()
+                if res.status >= 500:
+                    self.errors += 1
+                if res.will_close or not self.keepalive:
+                    self.conn.close()
+                    self.conn = None
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                if self.conn is not None:
+                    self.conn.close()
+                self.conn = None
+                continue
+            self.latencies.append(time.time() - st)
+
+
+@click.command()
+@click.option('--url', default='http://127.0.0.1:8686/api/ping',
+              help='URL requested with GET, ping API on default port of generated service by default')
+@click.option('--concurrency', type=int, default=50, help='number of concurrent connections')
+@click.option('--duration', type=float, default=10, help='seconds of load test')
+@click.option('--keepalive/--no-keepalive', default=True, help='reuse connection or open one for each request')
+def main(url, concurrency, duration, keepalive):
+    """Load test of HTTP server"""
+    deadline = time.time() + duration
+    workers = [Worker(url, deadline, keepalive) for _ in range(concurrency)]
+    st = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.time() - st
+
+    latencies = sorted(l for worker in workers for l in worker.latencies)
+    errors = sum(worker.errors for worker in workers)
+    click.secho('{} requests in {:.1f}s, {} errors'.format(len(latencies), seconds, errors))
+    if latencies:
+        click.secho('{:.0f} requests per second'.format(len(latencies) / seconds))
+        click.secho('latency p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+            latencies[len(latencies) // 2] * 1e3,
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3,
+            latencies[-1] * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf8 -*-
+"""Microbenchmark of `pb2dict` of generated services on wide and deep messages
+
+    python benchmarks/pb2dict.py --fields 30 --depth 20 --number 100
+"""
+
+import importlib
+import timeit
+from collections.abc import Iterable, Mapping
+
+import click
+from google.protobuf.descriptor_pb2 import DescriptorProto, FieldDescriptorProto, FileDescriptorProto
+from google.protobuf.json_format import MessageToDict
+from google.protobuf.message import Message as PbMessage
+from google.protobuf.struct_pb2 import Struct
+
+from generated_service import generate_service
+
+
+def legacy_pb2dict(msg):
+    """Previous implementation, walking fields by reflection on every call"""
+    rtn = {}
+    for field in msg.DESCRIPTOR.fields:
+        value = getattr(msg, field.name)
+        if isinstance(value, PbMessage):
+            rtn[field.name] = legacy_pb2dict(value)
+        elif isinstance(value, Mapping):
+            rtn[field.name] = dict((k, legacy_pb2dict(v)) for k, v in value.items())
+        elif isinstance(value, Iterable) and not isinstance(value, str):
+            rtn[field.name] = [legacy_pb2dict(el) for el in value]
+        else:
+            rtn[field.name] = value
+    return rtn
+
+
+def make_wide(fields: int) -> FileDescriptorProto:
+    """Message with `fields` messages of `fields` fields each"""
+    msg = FileDescriptorProto(name='bench.proto', package='bench')
+    for i in range(fields):
+        message_type = msg.message_type.add(name='Message{}'.format(i))
+        for j in range(fields):
+            message_type.field.add(name='field{}'.format(j), number=j + 1,
+                                   type=FieldDescriptorProto.TYPE_STRING,
+                                   label=FieldDescriptorProto.LABEL_OPTIONAL)
+    return msg
+
+
+def make_deep(depth: int) -> DescriptorProto:
+    """Message type nested `depth` levels"""
+    msg = DescriptorProto(name='Level0')
+    node = msg
+    for level in range(1, depth + 1):
+        node = node.nested_type.add(name='Level{}'.format(level))
+    return msg
+
+
+def make_struct(fields: int, depth: int) -> Struct:
+    """Struct with `fields` values on each of `depth` nested levels"""
+    msg = Struct()
+    node = msg
+    for level in range(depth + 1):
+        for i in range(fields):
+            node['field{}'.format(i)] = 'value {}'.format(i)
+        node = node.get_or_create_struct('nested{}'.format(level))
+    return msg
+
+
+@click.command()
+@click.option('--fields', type=int, default=30, help='number of fields of wide messages')
+@click.option('--depth', type=int, default=20, help='number of nested levels of deep messages')
+@click.option('--number', type=int, default=100, help='number of calls of each case')
+def main(fields, depth, number):
+    """Compare pb2dict with previous implementation and MessageToDict"""
+    pb2dict = importlib.import_module('{}.utils'.format(generate_service('grpc'))).pb2dict
+    messages = [
+        ('wide', make_wide(fields)),
+        ('deep', make_deep(depth)),
+        ('struct', make_struct(fields, depth)),
+    ]
+    converters = [
+        ('pb2dict', pb2dict),
+        ('legacy pb2dict', legacy_pb2dict),
+        ('MessageToDict', lambda msg: MessageToDict(msg, preserving_proto_field_name=True)),
+    ]
+    for msg_name, msg in messages:
+        assert pb2dict(msg) == legacy_pb2dict(msg)
+        click.secho('{} message of {} bytes'.format(msg_name, msg.ByteSize()))
+        for name, convert in converters:
+            seconds = min(timeit.repeat(lambda: convert(msg), number=number, repeat=3))
+            click.secho('    {:<20}{:>10.1f} us per call'.format(name, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf8 -*-
+"""Benchmark deploying many rancher services, asyncio client against thread pool
+
+Run against in-memory fake rancher server::
+
+    python benchmarks/rancher_async.py --services 200 --transition-seconds 1
+"""
+
+import asyncio
+import os
+import sys
+import threading
+from pathlib import Path
+from time import monotonic
+
+import click
+
+base_path = Path(__file__).parent.resolve()
+# repository root, to run without installing youtiao
+sys.path.insert(0, os.path.dirname(base_path))
+
+from tests.fake_rancher import THREAD_NAME, FakeRancher, FakeRancherServer
+from youtiao.commands.rancher import DeployStatus, deploy_services
+from youtiao.utils.rancher import RancherClient
+from youtiao.utils.rancher_async import AsyncRancherClient, deploy_service
+
+
+class QuietStatus(DeployStatus):
+    """Status table not printed"""
+
+    def set(self, key: str, state: str, detail: str='') -> None:
+        pass
+
+
+async def deploy_async(endpoint_url: str, stack_name: str, service_names: list) -> int:
+    """Deploy services concurrently on one event loop
+
+    Returns:
+        number of services deployed
+    """
+    async with AsyncRancherClient(endpoint_url, 'key', 'secret', pool_size=100) as rancher_cli:
+        environment_id = await rancher_cli.environment_id()
+        results = await asyncio.gather(
+            *[deploy_service(rancher_cli, environment_id, stack_name, name) for name in service_names],
+            return_exceptions=True)
+    return sum(1 for r in results if not isinstance(r, Exception))
+
+
+class ClientThreads(object):
+    """Peak number of threads of clients, sampled in a thread until stopped"""
+
+    def __init__(self, interval: float=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def count(self) -> int:
+        """Threads other than this sampler and threads of fake server"""
+        return sum(1 for t in threading.enumerate() if t is not self._thread and t.name != THREAD_NAME)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, self.count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stopped.set()
+        self._thread.join()
+
+
+def deploy_threads(endpoint_url: str, stack_name: str, service_names: list, parallel: int) -> int:
+    """Deploy services concurrently in a thread pool
+
+    Returns:
+        number of services deployed
+    """
+    rancher_cli = RancherClient(endpoint_url, 'key', 'secret', pool_size=parallel)
+    environment_id = rancher_cli.environment_id()
+    targets = [{'stack': stack_name, 'service': name, 'group': 0, 'depends_on': []} for name in service_names]
+    results = deploy_services(rancher_cli, environment_id, targets, parallel, QuietStatus(service_names))
+    return sum(1 for state in results.values() if state == 'active')
+
+
+@click.command()
+@click.option('--services', 'count', type=int, default=200, help='number of services deployed at once')
+@click.option('--parallel', type=int, default=50, help='max number of threads of thread pool deploy')
+@click.option('--transition-seconds', type=float, default=1.0, help='seconds for service to reach next state')
+def main(count, parallel, transition_seconds):
+    rancher = FakeRancher(transition_seconds)
+    project = rancher.add_project('Default')
+    stack = rancher.add_stack(project['id'], 'default')
+    names = ['web{}'.format(i) for i in range(count)]
+    for name in names:
+        rancher.add_service(project['id'], stack['id'], name)
+    server = FakeRancherServer(rancher)
+    server.start()
+    try:
+        for mode in ('asyncio', 'threads'):
+            rancher.request_count = 0
+            start = monotonic()
+            with ClientThreads() as threads:
+                if mode == 'asyncio':
+                    deployed = asyncio.run(deploy_async(server.endpoint_url, 'default', names))
+                else:
+                    deployed = deploy_threads(server.endpoint_url, 'default', names, parallel)
+            click.secho('{:>8}: {}/{} services in {:.2f}s, {} requests, {} client threads at most'.format(
+                mode, deployed, count, monotonic() - start, rancher.request_count, threads.peak))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# -*- coding: utf8 -*-
+"""Benchmark waiting for rancher service upgrade, event stream against polling
+
+Run against in-memory fake rancher server::
+
+    python benchmarks/rancher_upgrade.py --rounds 5 --transition-seconds 0.5
+"""
+
+import os
+import sys
+from pathlib import Path
+from time import monotonic
+
+import click
+
+base_path = Path(__file__).parent.resolve()
+# repository root, to run without installing youtiao
+sys.path.insert(0, os.path.dirname(base_path))
+
+from tests.fake_rancher import FakeRancher, FakeRancherServer
+from youtiao.utils.rancher import RancherClient
+
+
+def upgrade_once(client: RancherClient, environment_id: str, service_id: str) -> float:
+    """Upgrade service and wait for completion
+
+    Returns:
+        seconds spent
+    """
+    start = monotonic()
+    client.service_upgrade(environment_id, service_id)
+    client.service_finish_upgrade(environment_id, service_id)
+    return monotonic() - start
+
+
+@click.command()
+@click.option('--rounds', type=int, default=5, help='number of upgrades of each mode')
+@click.option('--transition-seconds', type=float, default=0.5, help='seconds for service to reach next state')
+def main(rounds, transition_seconds):
+    rancher = FakeRancher(transition_seconds)
+    project = rancher.add_project('Default')
+    stack = rancher.add_stack(project['id'], 'default')
+    service = rancher.add_service(project['id'], stack['id'], 'web')
+    server = FakeRancherServer(rancher)
+    server.start()
+    # two state transitions per upgrade
+    click.secho('Ideal: {:.3f}s per upgrade'.format(2 * transition_seconds))
+    try:
+        for event_stream in (True, False):
+            client = RancherClient(server.endpoint_url, 'key', 'secret', event_stream)
+            rancher.request_count = 0
+            seconds = [upgrade_once(client, project['id'], service['id']) for _ in range(rounds)]
+            click.secho('{:>12}: {:.3f}s per upgrade, {:.1f} requests per upgrade'.format(
+                'event stream' if event_stream else 'polling', sum(seconds) / rounds,
+                rancher.request_count / rounds))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
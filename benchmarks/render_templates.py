@@ -0,0 +1,90 @@
+# -*- coding: utf8 -*-
+"""Benchmark of rendering py/grpc and py/http templates, shared Jinja environment against per-file one
+
+Cases:
+    per-file environment: new Environment and FileSystemLoader for each template, as `render` used to do
+    shared, cold: shared environment of a fresh run with an empty bytecode cache
+    shared, bytecode cache: shared environment of a fresh run, templates loaded from bytecode cache on disk
+    shared, in memory: shared environment reused within a run, templates compiled once
+
+    python benchmarks/render_templates.py --runs 20
+"""
+
+import os
+import statistics
+import tempfile
+from time import perf_counter
+
+import click
+import jinja2
+
+from youtiao.commands.boilerplate import TEMPLATE_DIR
+from youtiao.commands.boilerplate import utils
+from youtiao.commands.boilerplate.utils import iter_templates
+
+
+CONTEXT = {'app_name': 'bench'}
+TEMPLATE_BASES = [TEMPLATE_DIR[('python', 'grpc')], TEMPLATE_DIR[('python', 'http')]]
+
+
+def render_per_file() -> int:
+    count = 0
+    for template_base in TEMPLATE_BASES:
+        for template_path in iter_templates(template_base):
+            dir_name, template_name = os.path.split(template_path)
+            jinja2.Environment(
+                loader=jinja2.FileSystemLoader(dir_name)
+            ).get_template(template_name).render(CONTEXT)
+            count += 1
+    return count
+
+
+def render_shared() -> int:
+    count = 0
+    for template_base in TEMPLATE_BASES:
+        for _ in utils.iter_render(template_base, CONTEXT):
+            count += 1
+    return count
+
+
+def fresh_run(cache_dir: str) -> None:
+    """Forget environments as a new run of cli does, use bytecode cache under `cache_dir`"""
+    utils.template_environment.cache_clear()
+    utils.JINJA_CACHE_DIR = cache_dir
+
+
+def measure(func, runs: int, setup=None) -> float:
+    times = []
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    return statistics.median(times)
+
+
+@click.command()
+@click.option('--runs', type=int, default=20, help='number of renders of all templates in each case')
+def main(runs):
+    click.secho('{} templates per render'.format(render_per_file()))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        def cold():
+            # new empty directory on each run
+            fresh_run(tempfile.mkdtemp(dir=cache_dir))
+
+        results = [('per-file environment', measure(render_per_file, runs))]
+        results.append(('shared, cold', measure(render_shared, runs, cold)))
+        fresh_run(cache_dir)
+        render_shared()
+        results.append(('shared, bytecode cache', measure(render_shared, runs, lambda: fresh_run(cache_dir))))
+        results.append(('shared, in memory', measure(render_shared, runs)))
+
+    baseline = results[0][1]
+    for name, seconds in results:
+        click.secho('{:<24}{:>8.1f} ms per render  x{:.1f}'.format(name, seconds * 1e3, baseline / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf8 -*-
+"""Multithreaded benchmark of snowflake ID generator of generated services, checking uniqueness of IDs
+
+    python benchmarks/snowflake.py --threads 8 --number 100000 --batch 100
+"""
+
+import importlib
+import sys
+import threading
+import time
+
+import click
+
+from generated_service import generate_service
+
+
+class LegacySnowFlakeGenerator(object):
+    """Previous generator without lock, sleeping and recursing on sequence overload"""
+
+    def __init__(self, dc, worker):
+        self.node_id = ((dc & 0x03) << 8) | (worker & 0xff)
+        self.last_timestamp = 550281600000
+        self.sequence = 0
+
+    def get_next_id(self):
+        curr_time = int(time.time() * 1000)
+        if curr_time > self.last_timestamp:
+            self.sequence = 0
+            self.last_timestamp = curr_time
+        self.sequence += 1
+        if self.sequence > 4095:
+            time.sleep(0.001)
+            return self.get_next_id()
+        return ((curr_time - 550281600000) << 22) | (self.node_id << 12) | self.sequence
+
+
+def run_threads(threads: int, number: int, generate) -> list:
+    """Call `generate` in each thread until `number` IDs are generated by the thread"""
+    results = [None] * threads
+
+    def work(i):
+        ids = []
+        while len(ids) < number:
+            ids.extend(generate())
+        results[i] = ids
+
+    workers = [threading.Thread(target=work, args=(i, )) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return [i for ids in results for i in ids]
+
+
+@click.command()
+@click.option('--threads', type=int, default=8, help='number of threads')
+@click.option('--number', type=int, default=100000, help='number of IDs generated by each thread')
+@click.option('--batch', type=int, default=100, help='number of IDs of each `next_ids` call')
+@click.option('--switch-interval', type=float,
+              help='seconds of thread switch interval, interpreter default if not given, '
+                   'smaller such as 1e-5 to expose races')
+def main(threads, number, batch, switch_interval):
+    """Throughput and uniqueness of snowflake IDs generated by threads"""
+    snowflake = importlib.import_module('{}.utils.snowflake'.format(generate_service('grpc')))
+    DC_N, SnowFlakeGenerator = snowflake.DC_N, snowflake.SnowFlakeGenerator
+    if switch_interval is not None:
+        sys.setswitchinterval(switch_interval)
+    click.secho('switch interval {:g}s'.format(sys.getswitchinterval()))
+
+    def fresh_generator():
+        SnowFlakeGenerator.clear_instance()
+        return SnowFlakeGenerator(DC_N, 1)
+
+    legacy = LegacySnowFlakeGenerator(DC_N, 1)
+    cases = [
+        ('legacy get_next_id', lambda: [legacy.get_next_id()]),
+        ('get_next_id', lambda g=fresh_generator(): [g.get_next_id()]),
+        ('next_ids({})'.format(batch), lambda g=fresh_generator(): g.next_ids(batch)),
+    ]
+    for name, generate in cases:
+        st = time.time()
+        ids = run_threads(threads, number, generate)
+        seconds = time.time() - st
+        click.secho('{:<24}{:>12.0f} IDs/s {:>10} duplicated'.format(name, len(ids) / seconds, len(ids) - len(set(ids))))
+
+
+if __name__ == '__main__':
+    main()
@@ -91,6 +91,9 @@ setup(
         'docker',
         'requests',
     ],
+    extras_require={
+        'async': ['aiohttp'],
+    },
     entry_points={
         'console_scripts': [
             'youtiao=youtiao:cli',
@@ -0,0 +1,44 @@
+# -*- coding: utf8 -*-
+
+import importlib
+import sys
+
+import pytest
+
+from youtiao.commands.boilerplate import SERVICE_MODES, generate_project
+
+
+# requirements of generated services imported by tests
+APP_REQUIREMENTS = ('raven', 'redis', 'yaml')
+
+
+def generated_app(tmp_path_factory, name: str, mode: str):
+    """Generate service from templates and import its package, loading its default config"""
+    for module in APP_REQUIREMENTS:
+        pytest.importorskip(module)
+    project_dir = tmp_path_factory.mktemp('project')
+    generate_project('python', str(project_dir), name, SERVICE_MODES[mode])
+    project_path = str(project_dir.joinpath(name))
+    sys.path.insert(0, project_path)
+    return importlib.import_module(name)
+
+
+@pytest.fixture(scope='session')
+def grpc_app(tmp_path_factory):
+    """Package of a gRPC service generated from templates"""
+    pytest.importorskip('grpc')
+    return generated_app(tmp_path_factory, 'grpcsvc', 'grpc')
+
+
+@pytest.fixture(scope='session')
+def http_app(tmp_path_factory):
+    """Package of a HTTP service generated from templates"""
+    return generated_app(tmp_path_factory, 'httpsvc', 'http')
+
+
+@pytest.fixture
+def fake_redis():
+    """Factory of fakeredis clients sharing one in-memory server"""
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    return lambda: fakeredis.FakeStrictRedis(server=server)
@@ -0,0 +1,351 @@
+# -*- coding: utf8 -*-
+"""In-memory fake of rancher (v1.6) API (v2.0 beta) for offline testing and benchmarking
+
+Run a fake server with one service in stack `default` from the repository root::
+
+    python -m tests.fake_rancher --port 8080 --service default/web
+
+then deploy with ``youtiao rancher_deploy --rancher-url http://127.0.0.1:8080/v2-beta ...``.
+"""
+
+import base64
+import hashlib
+import itertools
+import json
+import queue
+import random
+import re
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict, List
+from urllib.parse import parse_qsl, urlsplit
+
+import click
+
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+# query parameters which are not resource field filters
+LIST_PARAMS = {'limit', 'marker', 'sort', 'order', 'eventNames'}
+# queued to subscribers to drop their connection without close frame
+DROP = object()
+# name of all threads of fake server, told apart from threads of clients in the same process
+THREAD_NAME = 'fake-rancher'
+
+
+class FakeRancher(object):
+    """Projects, stacks and services of fake rancher server
+
+    Service upgrade goes through the same states as rancher: `upgrading` → `upgraded` after
+    `transition_seconds`, then `finishing-upgrade` → `active` after finish upgrade action.
+    """
+
+    def __init__(self, transition_seconds: float=1.0, page_size: int=100, latency_seconds: float=0,
+                 error_rate: float=0):
+        """
+        Args:
+            transition_seconds (float): seconds for service to reach next state
+            page_size (int): default and max number of resources returned in a page
+            latency_seconds (float): delay of each response
+            error_rate (float): ratio of GET requests failed with 502 Bad Gateway
+        """
+        self.transition_seconds = transition_seconds
+        self.page_size = page_size
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.resources = {'projects': [], 'stacks': [], 'services': []}  # type: Dict[str, List[Dict]]
+        self.subscribers = []  # type: List[queue.Queue]
+        self.request_count = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_project(self, name: str) -> Dict:
+        project = {'id': '1a{}'.format(next(self._ids)), 'type': 'project', 'name': name, 'state': 'active'}
+        self.resources['projects'].append(project)
+        return project
+
+    def add_stack(self, project_id: str, name: str) -> Dict:
+        stack = {'id': '1st{}'.format(next(self._ids)), 'type': 'stack', 'name': name,
+                 'accountId': project_id, 'state': 'active'}
+        self.resources['stacks'].append(stack)
+        return stack
+
+    def add_service(self, project_id: str, stack_id: str, name: str) -> Dict:
+        service = {
+            'id': '1s{}'.format(next(self._ids)),
+            'type': 'service',
+            'name': name,
+            'accountId': project_id,
+            'stackId': stack_id,
+            'state': 'active',
+            'launchConfig': {'imageUuid': 'docker:{}:latest'.format(name)},
+            'secondaryLaunchConfigs': [],
+        }
+        self.resources['services'].append(service)
+        return service
+
+    def find(self, collection: str, project_id: str=None, filters: Dict=None) -> List[Dict]:
+        filters = filters or {}
+        return [r for r in self.resources[collection]
+                if (project_id is None or r.get('accountId', r['id']) == project_id)
+                and all(str(r.get(k)) == v for k, v in filters.items())]
+
+    def set_state(self, service: Dict, state: str) -> None:
+        with self._lock:
+            service['state'] = state
+            event = json.dumps({
+                'name': 'resource.change',
+                'resourceType': 'service',
+                'resourceId': service['id'],
+                'data': {'resource': service},
+            })
+            for subscriber in self.subscribers:
+                subscriber.put(event)
+
+    def drop_subscribers(self) -> None:
+        """Drop websocket connections of event subscribers, as a proxy or a restarted server does"""
+        with self._lock:
+            for subscriber in self.subscribers:
+                subscriber.put(DROP)
+
+    def _transition(self, service: Dict, state: str, next_state: str) -> None:
+        self.set_state(service, state)
+        timer = threading.Timer(self.transition_seconds, self.set_state, args=(service, next_state))
+        timer.name = THREAD_NAME
+        timer.daemon = True
+        timer.start()
+
+    def action(self, service: Dict, action: str) -> Dict:
+        """Run service action
+
+        Raises:
+            ValueError: action is not allowed in current service state
+        """
+        if action == 'upgrade' and service['state'] == 'active':
+            self._transition(service, 'upgrading', 'upgraded')
+        elif action == 'finishupgrade' and service['state'] == 'upgraded':
+            self._transition(service, 'finishing-upgrade', 'active')
+        else:
+            raise ValueError('Action {} not allowed in state of {}'.format(action, service['state']))
+        return service
+
+
+class FakeRancherHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, avoid delayed ACK on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        threading.current_thread().name = THREAD_NAME
+        super().setup()
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def rancher(self) -> FakeRancher:
+        return self.server.rancher
+
+    def send_json(self, data: Dict, status: int=200) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status: int, message: str) -> None:
+        self.send_json({'type': 'error', 'status': status, 'message': message}, status)
+
+    def route(self):
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        # ignore API version prefix such as /v2-beta
+        parts = [p for p in url.path.split('/') if p and not re.match(r'^v\d', p)]
+        return parts, params
+
+    def do_GET(self):
+        self.rancher.request_count += 1
+        parts, params = self.route()
+        if len(parts) == 3 and parts[0] == 'projects' and parts[2] == 'subscribe':
+            return self.subscribe()
+        time.sleep(self.rancher.latency_seconds)
+        if random.random() < self.rancher.error_rate:
+            return self.send_error_json(502, 'Bad Gateway')
+        if parts == ['projects']:
+            return self.send_list('projects', None, params)
+        if len(parts) == 3 and parts[0] == 'projects' and parts[2] in ('stacks', 'services'):
+            return self.send_list(parts[2], parts[1], params)
+        if len(parts) == 4 and parts[0] == 'projects' and parts[2] == 'services':
+            services = self.rancher.find('services', parts[1], {'id': parts[3]})
+            if not services:
+                return self.send_error_json(404, 'Service {} not found'.format(parts[3]))
+            return self.send_json(services[0])
+        self.send_error_json(404, 'Not found')
+
+    def do_POST(self):
+        self.rancher.request_count += 1
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        time.sleep(self.rancher.latency_seconds)
+        parts, params = self.route()
+        if len(parts) != 4 or parts[0] != 'projects' or parts[2] != 'services':
+            return self.send_error_json(404, 'Not found')
+        services = self.rancher.find('services', parts[1], {'id': parts[3]})
+        if not services:
+            return self.send_error_json(404, 'Service {} not found'.format(parts[3]))
+        try:
+            self.send_json(self.rancher.action(services[0], params.get('action')))
+        except ValueError as e:
+            self.send_error_json(422, str(e))
+
+    def send_list(self, collection: str, project_id: str, params: Dict) -> None:
+        filters = {k: v for k, v in params.items() if k not in LIST_PARAMS}
+        resources = self.rancher.find(collection, project_id, filters)
+        limit = min(int(params.get('limit', self.rancher.page_size)), self.rancher.page_size)
+        start = int(params.get('marker', 0))
+        page = resources[start:start + limit]
+        next_url = None
+        if start + limit < len(resources):
+            next_params = dict(params, marker=str(start + limit))
+            next_url = 'http://{}:{}{}?{}'.format(
+                self.server.server_address[0], self.server.server_address[1], urlsplit(self.path).path,
+                '&'.join('{}={}'.format(k, v) for k, v in next_params.items()))
+        self.send_json({
+            'type': 'collection',
+            'resourceType': collection[:-1],
+            'data': page,
+            'pagination': {'limit': limit, 'next': next_url, 'partial': next_url is not None},
+        })
+
+    def subscribe(self) -> None:
+        """Push resource change events through websocket until client disconnects"""
+        key = self.headers.get('Sec-WebSocket-Key')
+        if not key:
+            return self.send_error_json(400, 'Websocket upgrade required')
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept)
+        self.end_headers()
+        self.wfile.flush()
+
+        events = queue.Queue()
+        self.rancher.subscribers.append(events)
+        threading.Thread(target=self.read_frames, args=(events,), name=THREAD_NAME, daemon=True).start()
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=5)
+                except queue.Empty:
+                    event = json.dumps({'name': 'ping'})
+                if event is None:
+                    # reply close frame
+                    self.send_frame(b'', opcode=0x8)
+                    break
+                if event is DROP:
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    break
+                self.send_frame(event.encode())
+        except OSError:
+            pass
+        finally:
+            self.rancher.subscribers.remove(events)
+            self.close_connection = True
+
+    def read_frames(self, events: queue.Queue) -> None:
+        """Discard frames sent by client, stop pushing events when client closes connection"""
+        try:
+            while True:
+                header = self.rfile.read(2)
+                if len(header) < 2:
+                    break
+                opcode, length = header[0] & 0x0f, header[1] & 0x7f
+                if length == 126:
+                    length, = struct.unpack('!H', self.rfile.read(2))
+                elif length == 127:
+                    length, = struct.unpack('!Q', self.rfile.read(8))
+                # client frames are masked
+                self.rfile.read(length + 4)
+                if opcode == 0x8:
+                    break
+        except OSError:
+            pass
+        events.put(None)
+
+    def send_frame(self, payload: bytes, opcode: int=0x1) -> None:
+        # unmasked final frame
+        if len(payload) < 126:
+            header = struct.pack('!BB', 0x80 | opcode, len(payload))
+        elif len(payload) < 1 << 16:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, len(payload))
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, len(payload))
+        self.wfile.write(header + payload)
+        self.wfile.flush()
+
+
+class FakeRancherServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server of fake rancher API"""
+
+    daemon_threads = True
+    # accept bursts of concurrent clients
+    request_queue_size = 1024
+
+    def __init__(self, rancher: FakeRancher=None, host: str='127.0.0.1', port: int=0):
+        """
+        Args:
+            rancher (FakeRancher): fake rancher state, a new one is created if not given
+            host (str): listen address
+            port (int): listen port, random free port if 0
+        """
+        super().__init__((host, port), FakeRancherHandler)
+        self.rancher = rancher or FakeRancher()
+
+    @property
+    def endpoint_url(self) -> str:
+        return 'http://{}:{}/v2-beta'.format(*self.server_address[:2])
+
+    def start(self) -> threading.Thread:
+        """Serve in a daemon thread"""
+        thread = threading.Thread(target=self.serve_forever, name=THREAD_NAME, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', help='listen address')
+@click.option('--port', type=int, default=8080, help='listen port')
+@click.option('--environment', default='Default', help='environment name')
+@click.option('--service', 'services', multiple=True, default=['default/web'],
+              help='service as STACK/SERVICE, can be repeated')
+@click.option('--transition-seconds', type=float, default=1.0, help='seconds for service to reach next state')
+@click.option('--latency-seconds', type=float, default=0, help='delay of each response')
+@click.option('--error-rate', type=float, default=0, help='ratio of GET requests failed with 502 Bad Gateway')
+def main(host, port, environment, services, transition_seconds, latency_seconds, error_rate):
+    """Run fake rancher API server"""
+    rancher = FakeRancher(transition_seconds, latency_seconds=latency_seconds, error_rate=error_rate)
+    project = rancher.add_project(environment)
+    stacks = {}
+    for service in services:
+        stack_name, service_name = service.split('/', 1)
+        if stack_name not in stacks:
+            stacks[stack_name] = rancher.add_stack(project['id'], stack_name)
+        rancher.add_service(project['id'], stacks[stack_name]['id'], service_name)
+    server = FakeRancherServer(rancher, host, port)
+    click.secho('Fake rancher API on {}'.format(server.endpoint_url), bold=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
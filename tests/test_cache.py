@@ -0,0 +1,152 @@
+# -*- coding: utf8 -*-
+"""Read-through cache of generated services against fakeredis"""
+
+import asyncio
+import importlib
+import socket
+import threading
+import time
+
+import pytest
+
+
+DELAY = 0.2  # seconds of each call of cached function
+THREADS = 20
+
+
+@pytest.fixture(params=['grpc_app', 'http_app'])
+def cache(request):
+    app = request.getfixturevalue(request.param)
+    return importlib.import_module('{}.utils.cache'.format(app.__name__))
+
+
+def run_threads(func, *args) -> list:
+    """Call `func` in threads at once, returns results or raised errors"""
+    results = [None] * THREADS
+
+    def work(i):
+        try:
+            results[i] = func(*args)
+        except Exception as e:
+            results[i] = e
+
+    workers = [threading.Thread(target=work, args=(i, )) for i in range(THREADS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def slow(calls):
+    def slow(x):
+        calls.append(x)
+        time.sleep(DELAY)
+        return {'x': x}
+
+    return slow
+
+
+def test_concurrent_misses_call_once(cache, fake_redis, slow, calls):
+    fn = cache.cached(60, key_prefix='test', cli=fake_redis())(slow)
+    assert run_threads(fn, 1) == [{'x': 1}] * THREADS
+    assert calls == [1]
+    assert fn(1) == {'x': 1} and calls == [1]
+
+
+def test_refill_of_other_process(cache, fake_redis, slow, calls):
+    cli = fake_redis()
+    fn = cache.cached(60, key_prefix='test', cli=cli)(slow)
+    cli.set(fn.cache_key(1) + ':lock', 'other process', px=10000)
+    threading.Timer(DELAY * 2, cli.set, (fn.cache_key(1), b'{"x":"other"}')).start()
+    waiting = threading.Thread(target=lambda: calls.append(('waited', fn(1))))
+    waiting.start()
+    # other keys not blocked by the wait
+    start = time.monotonic()
+    fn(2)
+    assert time.monotonic() - start < DELAY * 1.5
+    waiting.join()
+    assert ('waited', {'x': 'other'}) in calls and 1 not in calls
+
+    # lock released without value, taken over
+    cli.set(fn.cache_key(3) + ':lock', 'other process', px=10000)
+    threading.Timer(DELAY, cli.delete, (fn.cache_key(3) + ':lock', )).start()
+    assert fn(3) == {'x': 3} and 3 in calls
+
+
+def test_error_raised_to_waiting_callers(cache, fake_redis, calls):
+    def fail(x):
+        calls.append(x)
+        time.sleep(DELAY)
+        raise ValueError(x)
+
+    fn = cache.cached(60, key_prefix='test', cli=fake_redis())(fail)
+    results = run_threads(fn, 1)
+    assert calls == [1]
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_local_tier(cache, fake_redis, slow, calls):
+    cli = fake_redis()
+    fn = cache.cached(60, key_prefix='test', local_size=2, local_ttl=DELAY, cli=cli)(slow)
+    fn(1)
+    cli.delete(fn.cache_key(1))
+    assert fn(1) == {'x': 1} and len(calls) == 1
+    time.sleep(DELAY)
+    fn(1)
+    assert len(calls) == 2
+    fn.invalidate(1)
+    fn(1)
+    assert len(calls) == 3
+
+
+def test_unreachable_redis_bypassed(cache, slow, calls):
+    from redis import StrictRedis
+    from redis.backoff import NoBackoff
+    from redis.retry import Retry
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    # fail at once without retries of client
+    cli = StrictRedis(port=port, socket_connect_timeout=1, retry=Retry(NoBackoff(), 0))
+    fn = cache.cached(60, key_prefix='test', cli=cli)(slow)
+    start = time.monotonic()
+    assert run_threads(fn, 1) == [{'x': 1}] * THREADS
+    assert len(calls) == THREADS
+    # called in parallel, not one after another
+    assert time.monotonic() - start < DELAY * 3
+
+
+def test_concurrent_coroutine_misses_call_once(grpc_app, calls):
+    cache = importlib.import_module('{}.utils.cache'.format(grpc_app.__name__))
+    aioredis = pytest.importorskip('fakeredis.aioredis')
+
+    async def aslow(x):
+        calls.append(x)
+        await asyncio.sleep(DELAY)
+        return [x]
+
+    async def run():
+        fn = cache.cached(60, key_prefix='test', cli=aioredis.FakeRedis())(aslow)
+        results = await asyncio.gather(*[fn(1) for _ in range(THREADS)])
+        await fn.invalidate(1)
+        return results
+
+    assert asyncio.run(run()) == [[1]] * THREADS
+    assert calls == [1]
+
+
+def test_coroutine_refused_by_http_cache(http_app, fake_redis):
+    cache = importlib.import_module('{}.utils.cache'.format(http_app.__name__))
+
+    async def coroutine():
+        pass
+
+    with pytest.raises(TypeError):
+        cache.cached(60, cli=fake_redis())(coroutine)
@@ -0,0 +1,43 @@
+# -*- coding: utf8 -*-
+"""Command line group with lazily imported subcommands"""
+
+import subprocess
+import sys
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from youtiao import cli
+
+
+@pytest.mark.parametrize('name', sorted(cli.lazy_commands))
+def test_lazy_short_help_matches_docstring(name):
+    """Short help registered with the lazy command is the first line of the command docstring"""
+    import_path, short_help = cli.lazy_commands[name]
+    try:
+        command = cli.get_command(click.Context(cli), name)
+    except ImportError as e:
+        pytest.skip('{} not importable: {}'.format(import_path, e))
+    assert short_help == command.help.strip().splitlines()[0].strip()
+
+
+def test_group_help_does_not_import_commands():
+    script = '\n'.join([
+        'import sys',
+        'from click.testing import CliRunner',
+        'from youtiao import cli',
+        'result = CliRunner().invoke(cli, ["--help"])',
+        'assert result.exit_code == 0, result.output',
+        'print(sorted(m for m in sys.modules if m.startswith("youtiao.commands.")))',
+    ])
+    output = subprocess.check_output([sys.executable, '-c', script], universal_newlines=True)
+    assert output.strip() == '[]'
+
+
+def test_group_help_lists_commands():
+    result = CliRunner().invoke(cli, ['--help'])
+    assert result.exit_code == 0
+    for name, (_, short_help) in cli.lazy_commands.items():
+        assert name in result.output
+        assert short_help in result.output
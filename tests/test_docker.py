@@ -0,0 +1,74 @@
+# -*- coding: utf8 -*-
+"""Pruning of old docker images"""
+
+import pytest
+
+pytest.importorskip('docker')
+
+from youtiao.commands.docker import prune_images, prune_summary
+
+
+class FakeAPI(object):
+    """Stub of docker APIClient listing and removing images"""
+
+    def __init__(self, images):
+        self.images_list = images
+
+    def images(self, name=None):
+        return [img for img in self.images_list
+                if any(ref.rsplit(':', 1)[0] == name for ref in img['RepoTags'])]
+
+    def remove_image(self, ref, force=False):
+        for img in self.images_list:
+            if ref in img['RepoTags']:
+                img['RepoTags'].remove(ref)
+                if img['RepoTags']:
+                    return [{'Untagged': ref}]
+                self.images_list.remove(img)
+                return [{'Untagged': ref}, {'Deleted': img['Id']}]
+        return []
+
+
+class FakeDocker(object):
+
+    def __init__(self, images):
+        self.api = FakeAPI(images)
+
+
+def image(image_id, created, size, shared_size, *tags):
+    return {'Id': image_id, 'Created': created, 'Size': size, 'SharedSize': shared_size, 'RepoTags': list(tags)}
+
+
+def test_prune_shared_size_known():
+    docker_cli = FakeDocker([
+        image('sha256:1', 1, 100, 30, 'app/master:1'),
+        image('sha256:2', 2, 200, 50, 'app/master:2'),
+        image('sha256:3', 3, 300, 0, 'app/master:3', 'other/master:3'),
+        image('sha256:4', 4, 400, 0, 'app/master:4', 'app/master:latest'),
+    ])
+    deleted, reclaimed, exact = prune_images(docker_cli, 'app/master', keep=1)
+    assert (deleted, reclaimed, exact) == (3, 70 + 150, True)
+    # kept in other repository
+    assert [img['Id'] for img in docker_cli.api.images_list] == ['sha256:3', 'sha256:4']
+
+
+def test_prune_shared_size_unknown_is_upper_bound():
+    docker_cli = FakeDocker([
+        image('sha256:1', 1, 100, -1, 'app/master:1'),
+        image('sha256:2', 2, 200, 50, 'app/master:2'),
+        image('sha256:3', 3, 300, -1, 'app/master:3'),
+    ])
+    deleted, reclaimed, exact = prune_images(docker_cli, 'app/master', keep=1)
+    assert (deleted, reclaimed, exact) == (2, 100 + 150, False)
+    assert prune_summary(deleted, reclaimed, exact) == 'Deleted 2 old image(s), reclaimed at most 0.0 MB'
+    assert prune_summary(1, 2e6, True) == 'Deleted 1 old image(s), reclaimed 2.0 MB'
+
+
+def test_prune_protected_and_nothing_stale():
+    docker_cli = FakeDocker([
+        image('sha256:1', 1, 100, -1, 'app/master:1'),
+        image('sha256:2', 2, 200, -1, 'app/master:2'),
+    ])
+    assert prune_images(docker_cli, 'app/master', keep=1, protect=['app/master:1']) == (1, 200, False)
+    assert [img['Id'] for img in docker_cli.api.images_list] == ['sha256:1']
+    assert prune_images(docker_cli, 'app/master', keep=1) == (0, 0, True)
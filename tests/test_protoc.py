@@ -0,0 +1,38 @@
+# -*- coding: utf8 -*-
+"""Compilation of .proto files"""
+
+import pytest
+
+pytest.importorskip('grpc_tools')
+
+from youtiao.commands.protoc import proto_compile
+from youtiao.utils.grpc import ProtoCache, protoc
+
+
+def test_command_compiles_with_library():
+    assert proto_compile is protoc
+
+
+def test_protoc_cache(tmp_path):
+    proto_path = tmp_path.joinpath('hello.proto')
+    proto_path.write_text('syntax = "proto3";\nimport "google/protobuf/empty.proto";\nmessage A {}\n')
+    cache = ProtoCache(str(tmp_path.joinpath('cache.json')))
+    assert protoc(proto_path, tmp_path, cache) == 0
+    assert tmp_path.joinpath('hello_pb2.py').is_file() and tmp_path.joinpath('hello_pb2_grpc.py').is_file()
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert protoc(proto_path, tmp_path, cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    output = tmp_path.joinpath('hello_pb2.py').read_text()
+    proto_path.write_text('syntax = "proto3";\nmessage A {}\nmessage B {}\n')
+    assert protoc(proto_path, tmp_path, cache) == 0
+    assert tmp_path.joinpath('hello_pb2.py').read_text() != output
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_protoc_errors(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        protoc(tmp_path.joinpath('missing.proto'), tmp_path)
+    proto_path = tmp_path.joinpath('broken.proto')
+    proto_path.write_text('syntax = "proto3";\nmessage {}\n')
+    assert protoc(proto_path, tmp_path) != 0
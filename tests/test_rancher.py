@@ -0,0 +1,75 @@
+# -*- coding: utf8 -*-
+"""Service upgrade of RancherClient against fake rancher server"""
+
+import threading
+from time import monotonic
+
+import pytest
+
+from tests.fake_rancher import FakeRancher, FakeRancherServer
+from youtiao.utils import rancher as rancher_module
+from youtiao.utils.rancher import RancherClient
+
+
+TRANSITION_SECONDS = 0.3
+
+
+@pytest.fixture
+def server():
+    rancher = FakeRancher(TRANSITION_SECONDS)
+    project = rancher.add_project('Default')
+    stack = rancher.add_stack(project['id'], 'default')
+    rancher.add_service(project['id'], stack['id'], 'web')
+    server = FakeRancherServer(rancher)
+    server.start()
+    yield server
+    server.stop()
+
+
+def upgrade(server: FakeRancherServer, event_stream: bool, during_upgrade=None):
+    """Upgrade the service and wait for completion
+
+    Returns:
+        final service info, seconds spent and number of polls of service
+    """
+    rancher = server.rancher
+    client = RancherClient(server.endpoint_url, 'key', 'secret', event_stream)
+    polls = []
+    service = client.service
+    client.service = lambda *args: polls.append(args) or service(*args)
+    environment_id, service_id = rancher.resources['projects'][0]['id'], rancher.resources['services'][0]['id']
+    start = monotonic()
+    client.service_upgrade(environment_id, service_id)
+    if during_upgrade is not None:
+        threading.Timer(TRANSITION_SECONDS / 3, during_upgrade).start()
+    data = client.service_finish_upgrade(environment_id, service_id)
+    return data, monotonic() - start, len(polls)
+
+
+def test_upgrade_with_event_stream(server):
+    data, seconds, polls = upgrade(server, True)
+    assert data['state'] == 'active'
+    # each transition noticed once it happens, state read once before each wait and no polling
+    assert seconds < 2 * TRANSITION_SECONDS + 0.2
+    assert polls == 3
+
+
+def test_upgrade_dropped_event_stream_polled(server):
+    data, seconds, polls = upgrade(server, True, server.rancher.drop_subscribers)
+    assert data['state'] == 'active'
+    # polled with backoff after socket dropped
+    assert 3 < polls < 15
+    assert seconds < 2 * TRANSITION_SECONDS + 2
+
+
+def test_upgrade_polling(server):
+    data, _, polls = upgrade(server, False)
+    assert data['state'] == 'active'
+    assert 3 < polls < 15
+
+
+def test_upgrade_polling_without_websocket(server, monkeypatch):
+    monkeypatch.setattr(rancher_module, 'websocket', None)
+    data, _, polls = upgrade(server, True)
+    assert data['state'] == 'active'
+    assert polls > 3
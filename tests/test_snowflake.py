@@ -0,0 +1,57 @@
+# -*- coding: utf8 -*-
+"""Snowflake ID generator of generated services"""
+
+import importlib
+import sys
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def snowflake(grpc_app, fake_redis, monkeypatch):
+    """Snowflake module leasing worker IDs on fakeredis, reset after test"""
+    snowflake = importlib.import_module('{}.utils.snowflake'.format(grpc_app.__name__))
+    monkeypatch.setattr(snowflake, 'redis_cli', fake_redis())
+    snowflake._reset_generator()
+    yield snowflake
+    if snowflake.worker_lease is not None:
+        snowflake.worker_lease.release()
+    snowflake._reset_generator()
+
+
+def test_public_generator_name(snowflake):
+    generator = snowflake.snowflake_generator
+    assert generator is snowflake.get_snowflake_generator()
+    assert (generator.get_next_id() >> 12) & 0xff == snowflake.worker_lease.worker_id
+    with pytest.raises(AttributeError):
+        snowflake.missing_name
+
+
+@pytest.fixture
+def fast_switch():
+    """Switch threads often to expose races"""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.mark.parametrize('batch', [1, 100])
+def test_ids_unique_across_threads(snowflake, fast_switch, batch):
+    generator = snowflake.get_snowflake_generator()
+    results = [[] for _ in range(8)]
+
+    def work(ids):
+        while len(ids) < 20000:
+            ids.extend(generator.next_ids(batch) if batch > 1 else [generator.get_next_id()])
+
+    threads = [threading.Thread(target=work, args=(ids, )) for ids in results]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ids = [i for ids in results for i in ids]
+    assert len(set(ids)) == len(ids)
+    for ids in results:
+        assert ids == sorted(ids)
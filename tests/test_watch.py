@@ -0,0 +1,97 @@
+# -*- coding: utf8 -*-
+"""File watchers and watch mode of `youtiao protoc`"""
+
+import os
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+from youtiao.utils.watch import InotifyWatcher, PollingWatcher
+
+
+@pytest.fixture(params=['inotify', 'polling'])
+def make_watcher(request):
+    if request.param == 'inotify':
+        if not sys.platform.startswith('linux'):
+            pytest.skip('inotify is only available on Linux')
+        return lambda path: InotifyWatcher([path], '.proto')
+    return lambda path: PollingWatcher([path], '.proto', interval=0.05)
+
+
+def poll_all(watcher, timeout: float=1) -> set:
+    """Changes until nothing changes for a while"""
+    changed = watcher.poll(timeout)
+    more = changed
+    while more:
+        more = watcher.poll(0.2)
+        changed |= more
+    return changed
+
+
+def test_file_written(make_watcher, tmp_path):
+    watcher = make_watcher(str(tmp_path))
+    try:
+        tmp_path.joinpath('a.proto').write_text('')
+        tmp_path.joinpath('a.txt').write_text('')
+        assert poll_all(watcher) == {str(tmp_path.joinpath('a.proto'))}
+    finally:
+        watcher.close()
+
+
+def test_files_of_new_directory(make_watcher, tmp_path):
+    watcher = make_watcher(str(tmp_path))
+    try:
+        # `mkdir -p` and copy, files may be written before the new directories are watched
+        nested = tmp_path.joinpath('a', 'b')
+        nested.mkdir(parents=True)
+        nested.joinpath('b.proto').write_text('')
+        tmp_path.joinpath('a', 'a.proto').write_text('')
+        assert poll_all(watcher) == {str(nested.joinpath('b.proto')), str(tmp_path.joinpath('a', 'a.proto'))}
+    finally:
+        watcher.close()
+
+
+def test_files_of_moved_in_directory(make_watcher, tmp_path):
+    watched, outside = tmp_path.joinpath('watched'), tmp_path.joinpath('outside')
+    watched.mkdir()
+    outside.joinpath('c').mkdir(parents=True)
+    outside.joinpath('c', 'c.proto').write_text('')
+    watcher = make_watcher(str(watched))
+    try:
+        os.rename(str(outside), str(watched.joinpath('moved')))
+        assert poll_all(watcher) == {str(watched.joinpath('moved', 'c', 'c.proto'))}
+        # and watched since
+        watched.joinpath('moved', 'c', 'd.proto').write_text('')
+        assert poll_all(watcher) == {str(watched.joinpath('moved', 'c', 'd.proto'))}
+    finally:
+        watcher.close()
+
+
+def test_protoc_watch_survives_errors(tmp_path, monkeypatch):
+    pytest.importorskip('grpc_tools')
+    from youtiao.commands import protoc as protoc_module
+
+    proto_path = tmp_path.joinpath('a.proto')
+    proto_path.write_text('syntax = "proto3";\nmessage A {}\n')
+    calls = []
+
+    def watch_changes(watcher, debounce):
+        calls.append(watcher)
+        if len(calls) > 1:
+            raise KeyboardInterrupt
+        yield {str(proto_path)}
+        raise OSError(28, 'inotify_add_watch failed')
+
+    def proto_dependents(changed, proto_files, include_paths):
+        raise FileNotFoundError(2, 'No such file', str(proto_path))
+
+    monkeypatch.setattr(protoc_module, 'watch_changes', watch_changes)
+    monkeypatch.setattr(protoc_module, 'proto_dependents', proto_dependents)
+    result = CliRunner().invoke(protoc_module.protoc, ['--proto-path', str(proto_path), '--no-cache', '--watch',
+                                                       '--workers', '1'])
+    assert result.exit_code == 0, result.output
+    assert 'Failed to recompile changes' in result.output
+    assert 'Failed to watch changes' in result.output
+    assert 'Stop watching' in result.output
+    assert len(calls) == 2
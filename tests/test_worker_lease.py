@@ -0,0 +1,136 @@
+# -*- coding: utf8 -*-
+"""Worker ID leases of generated services against fakeredis"""
+
+import importlib
+import threading
+import time
+
+import pytest
+
+
+PREFIX = 'test:pid:0'
+
+
+@pytest.fixture
+def worker_lease(grpc_app):
+    return importlib.import_module('{}.utils.worker_lease'.format(grpc_app.__name__))
+
+
+@pytest.fixture
+def new_lease(worker_lease, fake_redis):
+    """Factory of leases, each with its own client as in separate processes, released after test"""
+    leases = []
+
+    def new(max_id=255, ttl=60, heartbeat=None, on_change=None):
+        lease = worker_lease.WorkerIdLease(fake_redis(), PREFIX, max_id, ttl, heartbeat, on_change)
+        leases.append(lease)
+        return lease
+
+    yield new
+    for lease in leases:
+        lease.release()
+
+
+def wait_until(predicate, timeout: float) -> float:
+    """Seconds until predicate holds, fails after timeout"""
+    start = time.monotonic()
+    while not predicate():
+        assert time.monotonic() - start < timeout, 'not true within {}s'.format(timeout)
+        time.sleep(0.005)
+    return time.monotonic() - start
+
+
+def test_concurrent_leases_unique(new_lease):
+    leases = [new_lease(max_id=63) for _ in range(64)]
+    ids = []
+    threads = [threading.Thread(target=lambda part: ids.extend(lease.acquire() for lease in part),
+                                args=(leases[i::8], )) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(ids) == list(range(64))
+    with pytest.raises(RuntimeError):
+        new_lease(max_id=63).acquire()
+
+
+def test_heartbeat_renews(new_lease, fake_redis):
+    lease = new_lease(ttl=0.3)
+    lease.acquire()
+    time.sleep(0.6)
+    assert fake_redis().get(lease.key) == lease.token.encode()
+
+
+def test_release(new_lease, fake_redis):
+    lease = new_lease(max_id=0)
+    lease.acquire()
+    lease.release()
+    assert fake_redis().get('{}:0'.format(PREFIX)) is None
+    assert new_lease(max_id=0).acquire() == 0
+
+
+def test_renew_reclaims_expired_not_taken(new_lease, fake_redis):
+    cli = fake_redis()
+    lease = new_lease()
+    lease.acquire()
+    key = lease.key
+    cli.delete(key)
+    assert lease.renew() and cli.get(key) == lease.token.encode()
+    cli.set(key, 'another holder')
+    assert not lease.renew() and lease.lost
+    lease.release()
+    assert cli.get(key) == b'another holder'
+
+
+def test_lost_lease_replaced_at_once(new_lease, fake_redis):
+    changes = []
+    lease = new_lease(heartbeat=0.3, on_change=changes.append)
+    lost_id = lease.acquire()
+    fake_redis().set(lease.key, 'another holder')
+    # detected by first heartbeat and replaced in the same one, not by the next heartbeat
+    assert wait_until(lambda: changes, 1) < 0.45
+    assert not lease.lost
+    assert changes == [lease.worker_id] and lease.worker_id != lost_id
+    assert fake_redis().get(lease.key) == lease.token.encode()
+
+
+def test_lost_lease_replacement_retried(new_lease, fake_redis):
+    cli = fake_redis()
+    changes = []
+    lease = new_lease(max_id=1, heartbeat=1, on_change=changes.append)
+    lost_id = lease.acquire()
+    free_id = 1 - lost_id
+    cli.set('{}:{}'.format(PREFIX, free_id), 'another holder')
+    cli.set(lease.key, 'another holder')
+    wait_until(lambda: lease.lost, 2)
+    # no free ID, retried until one is freed
+    time.sleep(0.2)
+    assert lease.lost and not changes
+    cli.delete('{}:{}'.format(PREFIX, free_id))
+    # retries back off far below heartbeat
+    assert wait_until(lambda: changes, 1) < 0.5
+    assert changes == [free_id] and not lease.lost
+
+
+def test_snowflake_generator_replaced(grpc_app, fake_redis, monkeypatch):
+    snowflake = importlib.import_module('{}.utils.snowflake'.format(grpc_app.__name__))
+    cli = fake_redis()
+    monkeypatch.setattr(snowflake, 'redis_cli', cli)
+    monkeypatch.setattr(snowflake, 'LEASE_TTL', 0.9)
+    snowflake._reset_generator()
+    try:
+        generator = snowflake.get_snowflake_generator()
+        lease = snowflake.worker_lease
+        lost_id = lease.worker_id
+        cli.set(lease.key, 'another holder')
+        assert not lease.renew()
+        with pytest.raises(RuntimeError):
+            snowflake.gen_snowflake_id()
+        wait_until(lambda: not lease.lost, 1)
+        assert snowflake.get_snowflake_generator() is not generator
+        worker_id = (snowflake.gen_snowflake_id() >> 12) & 0xff
+        assert worker_id == lease.worker_id != lost_id
+    finally:
+        if snowflake.worker_lease is not None:
+            snowflake.worker_lease.release()
+        snowflake._reset_generator()
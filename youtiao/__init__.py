@@ -2,22 +2,27 @@
 
 import click
 
-from youtiao.commands.protoc import protoc
-from youtiao.commands.rancher import deploy
-from youtiao.commands.docker import build
-from youtiao.commands.boilerplate import init_project
+from youtiao.commands import LazyGroup
 
 
-@click.group()
+@click.group(cls=LazyGroup)
 def cli():
     """Micro Service Toolkit"""
     pass
 
 
-cli.add_command(protoc)
-cli.add_command(deploy, name='rancher_deploy')
-cli.add_command(build, name='build_image')
-cli.add_command(init_project, name='init')
+# command modules are imported only when the command is invoked
+cli.add_lazy_command('youtiao.commands.protoc:protoc', 'protoc',
+                     'Shortcut of grpc_tools.protoc to compile .proto file.')
+cli.add_lazy_command('youtiao.commands.rancher:deploy', 'rancher_deploy',
+                     'Deploy using rancher (v1.6) API (v2.0 beta)')
+cli.add_lazy_command('youtiao.commands.docker:build', 'build_image', 'Build docker image')
+cli.add_lazy_command('youtiao.commands.docker:build_many', 'build_images',
+                     'Build and push several docker images concurrently')
+cli.add_lazy_command('youtiao.commands.docker:prune', 'prune_images', 'Delete old docker images of repositories')
+cli.add_lazy_command('youtiao.commands.boilerplate:init_project', 'init', 'Generate Python service boilerplate')
+cli.add_lazy_command('youtiao.commands.boilerplate:upgrade_project', 'upgrade',
+                     'Apply template changes to generated projects')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,56 @@
+# -*- coding: utf8 -*-
+
+from importlib import import_module
+from typing import Dict, List, Tuple
+
+import click
+
+
+class LazyGroup(click.Group):
+    """Command group which imports subcommand modules only when invoked
+
+    Subcommands are registered by name with the import path of the click command
+    (``package.module:attribute``) and the short help displayed in group help page,
+    so that listing commands does not import heavy dependencies (docker, grpc_tools...).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(LazyGroup, self).__init__(*args, **kwargs)
+        # command name => (import path, short help)
+        self.lazy_commands = {}  # type: Dict[str, Tuple[str, str]]
+
+    def add_lazy_command(self, import_path: str, name: str, short_help: str='') -> None:
+        """Register subcommand without importing it
+
+        Args:
+            import_path (str): import path of click command in form of `package.module:attribute`
+            name (str): subcommand name
+            short_help (str): short help shown in group help page
+        """
+        if ':' not in import_path:
+            raise ValueError('Invalid command import path {}'.format(import_path))
+        self.lazy_commands[name] = (import_path, short_help)
+
+    def list_commands(self, ctx) -> List[str]:
+        return sorted(set(super(LazyGroup, self).list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name: str):
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            import_path, _ = self.lazy_commands[cmd_name]
+            module_path, attr = import_path.split(':', 1)
+            self.add_command(getattr(import_module(module_path), attr), name=cmd_name)
+        return super(LazyGroup, self).get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx, formatter) -> None:
+        rows = []
+        for cmd_name in self.list_commands(ctx):
+            if cmd_name in self.lazy_commands:
+                rows.append((cmd_name, self.lazy_commands[cmd_name][1]))
+                continue
+            cmd = self.commands[cmd_name]
+            if getattr(cmd, 'hidden', False):
+                continue
+            rows.append((cmd_name, cmd.short_help or ''))
+        if rows:
+            with formatter.section('Commands'):
+                formatter.write_dl(rows)
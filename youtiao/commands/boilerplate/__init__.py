@@ -1,19 +1,46 @@
 # -*- coding: utf8 -*-
 
+import json
 import os
 import shutil
-from pathlib import Path
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, Iterator, List, Tuple
 
 import click
 
 from youtiao import templates
-from youtiao.commands.boilerplate.utils import render_templates
-from youtiao.commands.protoc import proto_compile
+from youtiao.commands.boilerplate.utils import (
+    PROJECT_MANIFEST_FILENAME,
+    content_hash,
+    dump_project_manifest,
+    iter_render,
+    iter_templates,
+    read_project_manifest,
+    render,
+    write_project_manifest,
+    write_tar,
+    write_zip,
+)
 
 SERVICE_TYPES = {
     '1': 'HTTP server',
     '2': 'gGRPC server',
 }
+# service type names accepted in manifest
+SERVICE_MODES = {
+    'http': '1',
+    'grpc': '2',
+}
+SERVICE_MODE_NAMES = {v: k for k, v in SERVICE_MODES.items()}
+# tar archive formats and compression
+ARCHIVE_COMPRESSIONS = {
+    'tar': '',
+    'tar.gz': 'gz',
+    'tar.bz2': 'bz2',
+    'tar.xz': 'xz',
+}
 TEMPLATE_PATH = os.path.dirname(templates.__file__)
 TEMPLATE_DIR = {
     ('python', 'http'): os.path.join(TEMPLATE_PATH, 'py', 'http'),
@@ -21,13 +48,259 @@ TEMPLATE_DIR = {
 }
 
 
+def project_file(template_name: str, name: str, template_suffix: str='.tpl') -> str:
+    """Relative path in generated project of file rendered from template
+
+    Args:
+        template_name (str): template path relative to template directory
+        name (str): service name
+        template_suffix (str): template filename suffix
+
+    Returns:
+        relative file path in project folder
+    """
+    parts = list(PurePosixPath(template_name[:-len(template_suffix)]).parts)
+    if parts[0] == 'app':
+        parts[0] = name
+        if parts[1:] == ['proto', 'app.proto']:
+            parts[-1] = '{}.proto'.format(name)
+    return os.path.join(*parts)
+
+
+def iter_project_files(language: str, name: str, mode: str, compile_proto: bool=True) -> Iterator[Tuple[str, bytes]]:
+    """Render all files of service boilerplate in memory
+
+    Rendered files are yielded at their final path in project, followed by compiled proto
+    files of gRPC service and by the project manifest used by upgrade.
+
+    Args:
+        language (str): programming language
+        name (str): service name
+        mode (str): service type, `1` for HTTP and `2` for gRPC
+        compile_proto (bool): compile proto file of gRPC service
+
+    Returns:
+        Iterator of relative file path in project folder and file content
+    """
+    if language != 'python' or mode not in SERVICE_MODE_NAMES:
+        raise Exception('Programming language {} or servie type {} not supported'.format(language, mode))
+    template_dir = TEMPLATE_DIR[(language, SERVICE_MODE_NAMES[mode])]
+    render_context = {
+        'app_name': name,
+    }
+
+    files = {}
+    proto_files = []
+    for template_path, rendered_str in iter_render(template_dir, render_context):
+        template_name = Path(template_path).relative_to(template_dir).as_posix()
+        rel_path = project_file(template_name, name)
+        content = rendered_str.encode()
+        files[rel_path] = {
+            'template': template_name,
+            'template_hash': content_hash(Path(template_path).read_bytes()),
+            'output_hash': content_hash(content),
+        }
+        if rel_path.endswith('.proto'):
+            proto_files.append((rel_path, content))
+        yield rel_path, content
+
+    if compile_proto and proto_files:
+        # grpc_tools is only needed for gRPC service
+        from youtiao.commands.protoc import proto_compile
+        for rel_path, content in proto_files:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                proto_path = os.path.join(tmp_dir, os.path.basename(rel_path))
+                Path(proto_path).write_bytes(content)
+                if proto_compile(proto_path, tmp_dir) != 0:
+                    raise Exception('Failed to compile proto file of {}'.format(name))
+                for output in sorted(Path(tmp_dir).glob('*_pb2*.py')):
+                    yield os.path.join(os.path.dirname(rel_path), output.name), output.read_bytes()
+
+    yield PROJECT_MANIFEST_FILENAME, dump_project_manifest({
+        'language': language,
+        'mode': mode,
+        'context': render_context,
+        'files': files,
+    })
+
+
+def iter_generate_project(language: str, project_dir: str, name: str, mode: str) -> Iterator[Path]:
+    """Generate service boilerplate, project folder is removed if any exception is raised
+
+    Args:
+        language (str): programming language
+        project_dir (str): absolute path of directory where project folder is created
+        name (str): service name, also name of project folder
+        mode (str): service type, `1` for HTTP and `2` for gRPC
+
+    Returns:
+        Iterator of created file path
+
+    Raises:
+        FileExistsError: project folder already existed
+    """
+    project_path = Path(project_dir).joinpath(name)
+    if project_path.exists():
+        raise FileExistsError('Folder {} already existed'.format(project_path))
+
+    try:
+        for rel_path, content in iter_project_files(language, name, mode):
+            dst_path = project_path.joinpath(rel_path)
+            dst_path.parent.mkdir(parents=True, exist_ok=True)
+            dst_path.write_bytes(content)
+            yield dst_path
+    except BaseException:
+        shutil.rmtree(str(project_path), ignore_errors=True)
+        raise
+
+
+def generate_project(language: str, project_dir: str, name: str, mode: str) -> List[str]:
+    """Generate service boilerplate, see `iter_generate_project`
+
+    Returns:
+        list of created file paths
+    """
+    return [str(p) for p in iter_generate_project(language, project_dir, name, mode)]
+
+
+def load_manifest(manifest_path: str) -> List[Dict[str, str]]:
+    """Load services from manifest file
+
+    Manifest is a json or yaml file of service list, or of a mapping with key `services`.
+    Each service has a `name`, a `mode` (`http`/`grpc` or `1`/`2`) and optional `language`
+    and `project_dir`.
+
+    Args:
+        manifest_path (str): manifest file path
+
+    Returns:
+        list of services with keys `language`, `project_dir`, `name` and `mode`
+    """
+    with open(manifest_path) as f:
+        if manifest_path.endswith('.json'):
+            manifest = json.load(f)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise click.UsageError('PyYAML is required to load yaml manifest, use json manifest instead')
+            manifest = yaml.safe_load(f)
+    if isinstance(manifest, dict):
+        manifest = manifest.get('services')
+    if not isinstance(manifest, list):
+        raise click.UsageError('Manifest must be a list of services')
+
+    services = []
+    for service in manifest:
+        name = service.get('name')
+        mode = SERVICE_MODES.get(str(service.get('mode')).lower(), str(service.get('mode')))
+        if not name:
+            raise click.UsageError('Service name is missing in manifest')
+        if mode not in SERVICE_TYPES:
+            raise click.UsageError('Invalid service type {} of {}'.format(service.get('mode'), name))
+        services.append({
+            'language': service.get('language', 'python'),
+            'project_dir': service.get('project_dir'),
+            'name': name,
+            'mode': mode,
+        })
+    return services
+
+
+def init_projects(services: List[Dict[str, str]], project_dir: str, workers: int=None) -> None:
+    """Generate services boilerplate in a process pool and report progress when each service finishes
+
+    Args:
+        services (list): services loaded by `load_manifest`
+        project_dir (str): default directory where project folders are created
+        workers (int): max number of processes
+    """
+    project_paths = set()
+    for service in services:
+        service['project_dir'] = os.path.abspath(service['project_dir'] or project_dir)
+        project_path = os.path.join(service['project_dir'], service['name'])
+        if project_path in project_paths:
+            raise click.UsageError('Duplicated service {} in manifest'.format(project_path))
+        project_paths.add(project_path)
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(generate_project, s['language'], s['project_dir'], s['name'], s['mode']): s
+                   for s in services}
+        for i, future in enumerate(as_completed(futures), 1):
+            service = futures[future]
+            try:
+                created_files = future.result()
+            except Exception as e:
+                failed.append(service['name'])
+                click.secho('[{}/{}] {} failed: {}'.format(i, len(services), service['name'], e), fg='red')
+            else:
+                click.secho('[{}/{}] {} ({}) generated with {} files'.format(
+                    i, len(services), service['name'], SERVICE_TYPES[service['mode']], len(created_files)))
+
+    if failed:
+        click.secho('Failed to generate {}'.format(', '.join(failed)), fg='red')
+        raise click.Abort
+
+
+def write_project_archive(language: str, name: str, mode: str, fileobj: BinaryIO, archive_format: str='tar.gz') -> None:
+    """Stream service boilerplate into archive without writing project files on disk
+
+    Args:
+        language (str): programming language
+        name (str): service name
+        mode (str): service type, `1` for HTTP and `2` for gRPC
+        fileobj (file): writable binary stream
+        archive_format (str): `zip`, `tar`, `tar.gz`, `tar.bz2` or `tar.xz`
+    """
+    files = iter_project_files(language, name, mode)
+    if archive_format == 'zip':
+        write_zip(files, fileobj)
+    elif archive_format in ARCHIVE_COMPRESSIONS:
+        write_tar(files, fileobj, ARCHIVE_COMPRESSIONS[archive_format])
+    else:
+        raise ValueError('Archive format {} not supported'.format(archive_format))
+
+
 @click.command()
 @click.option('--language', type=click.Choice(['python']), default='python', help='programming language')
-@click.option('--project-dir', required=True, type=click.Path(exists=True, file_okay=False, resolve_path=True))
-@click.option('--name', type=str, prompt='Service name ?', help='service name')
-@click.option('--mode', type=click.Choice(['1', '2']), prompt='Service type [1] HTTP [2] gRPC ?', help='service type')
-def init_project(language, project_dir, name, mode):
+@click.option('--project-dir', type=click.Path(exists=True, file_okay=False, resolve_path=True), default=None,
+              help='directory where project folder is created, required unless --archive is given')
+@click.option('--name', type=str, default=None, help='service name')
+@click.option('--mode', type=click.Choice(['1', '2']), default=None, help='service type')
+@click.option('--manifest', type=click.Path(exists=True, dir_okay=False, resolve_path=True), default=None,
+              help='json or yaml file of services to generate without prompt')
+@click.option('--workers', type=int, default=None, help='max number of processes generating services of manifest')
+@click.option('--archive', type=click.Path(dir_okay=False, writable=True, allow_dash=True), default=None,
+              help='write project into .zip, .tar, .tar.gz, .tar.bz2 or .tar.xz archive instead of project dir, '
+                   '`-` for gzipped tar stream on stdout usable as docker build context')
+def init_project(language, project_dir, name, mode, manifest, workers, archive):
     """Generate Python service boilerplate"""
+    if archive is not None:
+        if name is None or mode is None:
+            raise click.UsageError('--name and --mode are required with --archive')
+        archive_format = 'tar.gz'
+        for fmt in ('zip', 'tgz', 'tar', 'tar.gz', 'tar.bz2', 'tar.xz'):
+            if archive.endswith('.' + fmt):
+                archive_format = 'tar.gz' if fmt == 'tgz' else fmt
+        if archive == '-':
+            write_project_archive(language, name, mode, click.get_binary_stream('stdout'), archive_format)
+        else:
+            with open(archive, 'wb') as f:
+                write_project_archive(language, name, mode, f, archive_format)
+            click.secho('Project {} written to {}'.format(name, archive), bold=True)
+        return
+
+    if project_dir is None:
+        raise click.UsageError('Missing option --project-dir')
+    if manifest is not None:
+        init_projects(load_manifest(manifest), project_dir, workers)
+        return
+
+    if name is None:
+        name = click.prompt('Service name ?', type=str)
+    if mode is None:
+        mode = click.prompt('Service type [1] HTTP [2] gRPC ?', type=click.Choice(['1', '2']))
     project_path = os.path.join(project_dir, name)
     if os.path.exists(project_path):
         click.secho('Folder {} already existed'.format(project_path), fg='red')
@@ -39,38 +312,114 @@ def init_project(language, project_dir, name, mode):
     if click.confirm('Confirm project info and continue?', abort=True):
         click.echo('Start to generate project boilerplate...')
 
-    render_context = {
-        'app_name': name,
-    }
-
     try:
-        if language == 'python' and mode == '1':
-            template_dir = TEMPLATE_DIR[('python', 'http')]
-            for rendered_file in render_templates(template_dir, project_path, render_context):
-                click.secho('Create file: {}'.format(str(rendered_file)))
-            # mv dirname
-            shutil.move(os.path.join(project_path, 'app'), os.path.join(project_path, name))
-
-        elif language == 'python' and mode == '2':
-            template_dir = TEMPLATE_DIR[('python', 'grpc')]
-            for rendered_file in render_templates(template_dir, project_path, render_context):
-                click.secho('Create file: {}'.format(str(rendered_file)))
-            # mv dirname
-            shutil.move(os.path.join(project_path, 'app'), os.path.join(project_path, name))
-            # mv proto file
-            shutil.move(os.path.join(project_path, name, 'proto/app.proto'),
-                        os.path.join(project_path, name, 'proto/{}.proto'.format(name)))
-
-            click.secho('Compile proto file')
-            proto_compile(os.path.join(project_path, name, 'proto', '{}.proto'.format(name)),
-                          os.path.join(project_path, name, 'proto'))
-
-        else:
-            raise Exception('Programming language {} or servie type {} not supported'.format(language, mode))
-
+        for rendered_file in iter_generate_project(language, project_dir, name, mode):
+            click.secho('Create file: {}'.format(str(rendered_file)))
     except Exception as e:
         print(e)
         click.secho('Remove project folder', fg='red')
-        shutil.rmtree(project_path)
         raise click.Abort
 
+
+def iter_upgrade_project(project_path: str, dry_run: bool=False) -> Iterator[Tuple[str, str]]:
+    """Apply template changes to generated project
+
+    Only templates changed since generation or last upgrade are rendered. A rendered file
+    overwrites the project file only if the project file was not edited nor deleted by user,
+    otherwise the file is skipped and left untouched.
+
+    Args:
+        project_path (str): absolute path of project folder
+        dry_run (bool): report actions without writing any file
+
+    Returns:
+        Iterator of action (`create`, `update`, `skip`) and file path relative to project folder
+
+    Raises:
+        FileNotFoundError: project was not generated with manifest
+        Exception: proto file failed to compile, manifest is left unchanged so next upgrade compiles it again
+    """
+    manifest = read_project_manifest(project_path)
+    language, mode, context = manifest['language'], manifest['mode'], manifest['context']
+    template_dir = TEMPLATE_DIR[(language, SERVICE_MODE_NAMES[mode])]
+    files = {}
+    proto_changed = False
+
+    for template_path in iter_templates(template_dir):
+        template_name = Path(template_path).relative_to(template_dir).as_posix()
+        rel_path = project_file(template_name, context['app_name'])
+        dst_path = Path(project_path).joinpath(rel_path)
+        template_hash = content_hash(Path(template_path).read_bytes())
+        entry = manifest['files'].get(rel_path)
+        if entry is not None and entry['template_hash'] == template_hash:
+            # template unchanged, nothing to render
+            files[rel_path] = entry
+            continue
+
+        rendered = render(template_path, context, template_dir).encode()
+        output_hash = content_hash(rendered)
+        if dst_path.is_file():
+            current_hash = content_hash(dst_path.read_bytes())
+            if current_hash == output_hash:
+                action = None
+            elif entry is None or current_hash != entry['output_hash']:
+                # edited by user or not generated by template
+                if entry is not None:
+                    files[rel_path] = entry
+                yield 'skip', rel_path
+                continue
+            else:
+                action = 'update'
+        elif entry is not None:
+            # deleted by user
+            files[rel_path] = entry
+            yield 'skip', rel_path
+            continue
+        else:
+            action = 'create'
+
+        if action is not None:
+            if not dry_run:
+                dst_path.parent.mkdir(parents=True, exist_ok=True)
+                dst_path.write_bytes(rendered)
+            yield action, rel_path
+        if rel_path.endswith('.proto') and (entry is None or entry['output_hash'] != output_hash):
+            # also when written by an earlier upgrade which failed to compile it
+            proto_changed = True
+        files[rel_path] = {
+            'template': template_name,
+            'template_hash': template_hash,
+            'output_hash': output_hash,
+        }
+
+    if dry_run:
+        return
+    if proto_changed:
+        from youtiao.commands.protoc import proto_compile
+        proto_dir = os.path.join(project_path, context['app_name'], 'proto')
+        if proto_compile(os.path.join(proto_dir, '{}.proto'.format(context['app_name'])), proto_dir) != 0:
+            raise Exception('Failed to compile proto file of {}'.format(context['app_name']))
+    manifest['files'] = files
+    write_project_manifest(project_path, manifest)
+
+
+@click.command()
+@click.option('--project-path', required=True, multiple=True,
+              type=click.Path(exists=True, file_okay=False, resolve_path=True),
+              help='generated project folder, can be repeated')
+@click.option('--dry-run', is_flag=True, default=False, help='report changes without writing files')
+def upgrade_project(project_path, dry_run):
+    """Apply template changes to generated projects"""
+    for path in project_path:
+        counts = {'create': 0, 'update': 0, 'skip': 0}
+        try:
+            for action, rel_path in iter_upgrade_project(path, dry_run):
+                counts[action] += 1
+                click.secho('{} {}'.format(action.capitalize(), rel_path), fg='yellow' if action == 'skip' else None)
+        except FileNotFoundError:
+            click.secho('Project manifest not found in {}'.format(path), fg='red')
+            raise click.Abort
+        except Exception as e:
+            click.secho('{}: {}'.format(path, e), fg='red')
+            raise click.Abort
+        click.secho('{}: {create} created, {update} updated, {skip} skipped'.format(path, **counts), bold=True)
@@ -1,28 +1,87 @@
 # -*- coding: utf8 -*-
 
+import functools
+import hashlib
+import io
+import json
 import os
 import re
+import tarfile
+import time
+import zipfile
 
-from typing import Dict, Iterator, List, Tuple
-from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple
+from pathlib import Path, PurePath
 
 import jinja2
 
 
-def render(template_path: str, context: Dict[str, str]) -> str:
+PROJECT_MANIFEST_FILENAME = '.youtiao.json'
+JINJA_CACHE_DIR = os.path.join(os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'youtiao', 'jinja2')
+
+
+@functools.lru_cache(maxsize=None)
+def template_environment(template_base: str) -> jinja2.Environment:
+    """Jinja environment shared by all templates under a template root
+
+    Compiled templates are kept in memory and reloaded when the template file mtime changes.
+    Bytecode is also cached on disk, checked against template source checksum, so that
+    templates are not compiled again by next run.
+
+    Args:
+        template_base (str): absolute path of template directory
+
+    Returns:
+        Jinja environment
+    """
+    bytecode_cache = None
+    try:
+        os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(JINJA_CACHE_DIR)
+    except OSError:
+        # cache directory not writable, compile templates in memory only
+        pass
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(template_base),
+        bytecode_cache=bytecode_cache,
+        cache_size=-1,
+    )
+
+
+def render(template_path: str, context: Dict[str, str], template_base: str=None) -> str:
     """Render template
 
     Args:
         template_path (str): template absolute path
         context (dict): variables to be rendered
+        template_base (str): template root sharing Jinja environment, default to template directory
 
     Returns:
         Rendered string
     """
-    dir_name, template_name = os.path.split(template_path)
-    return jinja2.Environment(
-        loader=jinja2.FileSystemLoader(dir_name)
-    ).get_template(template_name).render(context)
+    if template_base is None:
+        template_base, template_name = os.path.split(template_path)
+    else:
+        template_name = Path(template_path).relative_to(template_base).as_posix()
+    return template_environment(str(template_base)).get_template(template_name).render(context)
+
+
+def iter_templates(template_base: str, template_suffix: str='.tpl', exclude_templates: List=[]) -> Iterator[str]:
+    """Find all allowed templates defined by filename pattern under specific directory
+
+    Args:
+        template_base (str): absolute path of template directory
+        template_suffix (str): allowed template filename suffix
+        exclude_templates (list): exclude template filenames
+
+    Returns:
+        Iterator of template file path
+    """
+    for dir_path, dirnames, filenames in os.walk(template_base):
+        for template_name in filenames:
+            if not template_name.endswith(template_suffix) or template_name in exclude_templates:
+                continue
+            yield os.path.join(dir_path, template_name)
 
 
 def iter_render(template_base: str, context: Dict[str, str], template_suffix: str='.tpl',
@@ -38,16 +97,8 @@ def iter_render(template_base: str, context: Dict[str, str], template_suffix: st
     Returns:
         Iterator of template file path and rendered string
     """
-    def walk(path: str) -> Iterator[str]:
-        for dir_path, dirnames, filenames in os.walk(path):
-            for fn in filenames:
-                yield os.path.join(dir_path, fn)
-
-    for fpath in walk(template_base):
-        dir_name, template_name = os.path.split(fpath)
-        if not template_name.endswith(template_suffix) or template_name in exclude_templates:
-            continue
-        yield fpath, render(fpath, context)
+    for fpath in iter_templates(template_base, template_suffix, exclude_templates):
+        yield fpath, render(fpath, context, template_base)
 
 
 def render_templates(template_base: str, dst_base: str, context: Dict[str, str], template_suffix: str='.tpl',
@@ -79,3 +130,75 @@ def render_templates(template_base: str, dst_base: str, context: Dict[str, str],
         Path(dst_path).write_text(rendered_str)
         yield dst_path
 
+
+def content_hash(content: bytes) -> str:
+    """sha256 hex digest of content"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def read_project_manifest(project_path: str) -> Dict:
+    """Read manifest of templates and rendered files recorded in generated project
+
+    Args:
+        project_path (str): absolute path of project folder
+
+    Returns:
+        manifest dict
+
+    Raises:
+        FileNotFoundError: project was not generated with manifest
+    """
+    with Path(project_path).joinpath(PROJECT_MANIFEST_FILENAME).open() as f:
+        return json.load(f)
+
+
+def write_project_manifest(project_path: str, manifest: Dict) -> None:
+    """Write manifest of templates and rendered files into generated project
+
+    Args:
+        project_path (str): absolute path of project folder
+        manifest (dict): manifest dict
+    """
+    Path(project_path).joinpath(PROJECT_MANIFEST_FILENAME).write_bytes(dump_project_manifest(manifest))
+
+
+def dump_project_manifest(manifest: Dict) -> bytes:
+    """Serialize manifest of templates and rendered files
+
+    Args:
+        manifest (dict): manifest dict
+
+    Returns:
+        manifest file content
+    """
+    return (json.dumps(manifest, indent=2, sort_keys=True) + '\n').encode()
+
+
+def write_tar(files: Iterable[Tuple[str, bytes]], fileobj: BinaryIO, compression: str='gz') -> None:
+    """Stream files into tar archive, which can also be used as docker build context
+
+    Args:
+        files (iterable): relative file path and file content
+        fileobj (file): writable binary stream, not necessarily seekable
+        compression (str): `gz`, `bz2`, `xz` or empty string for no compression
+    """
+    mtime = time.time()
+    with tarfile.open(fileobj=fileobj, mode='w|{}'.format(compression)) as tar:
+        for rel_path, content in files:
+            info = tarfile.TarInfo(PurePath(rel_path).as_posix())
+            info.size = len(content)
+            info.mtime = mtime
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(content))
+
+
+def write_zip(files: Iterable[Tuple[str, bytes]], fileobj: BinaryIO) -> None:
+    """Stream files into zip archive
+
+    Args:
+        files (iterable): relative file path and file content
+        fileobj (file): writable binary stream, not necessarily seekable
+    """
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for rel_path, content in files:
+            zf.writestr(PurePath(rel_path).as_posix(), content)
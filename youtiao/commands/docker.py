@@ -1,7 +1,282 @@
 # -*- encoding: utf8 -*-
 
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+
 import click
 import docker
+from docker.utils.build import exclude_paths
+
+# image label of build context hash
+CONTEXT_HASH_LABEL = 'youtiao.context-hash'
+
+
+def build_context_hash(workdir: str) -> str:
+    """Hash docker build context, files excluded by .dockerignore are ignored
+
+    Args:
+        workdir (str): absolute path of build context directory
+
+    Returns:
+        sha256 hex digest of file paths, modes and contents in build context
+    """
+    exclude = []
+    dockerignore = os.path.join(workdir, '.dockerignore')
+    if os.path.exists(dockerignore):
+        # same parsing as docker API client
+        with open(dockerignore) as f:
+            exclude = [l.strip() for l in f.read().splitlines() if l.strip() and not l.strip().startswith('#')]
+
+    h = hashlib.sha256()
+    for rel_path in sorted(exclude_paths(workdir, exclude)):
+        path = os.path.join(workdir, rel_path)
+        st = os.lstat(path)
+        h.update('{}\0{:o}\0'.format(rel_path, st.st_mode).encode())
+        if os.path.islink(path):
+            h.update(os.readlink(path).encode())
+        elif os.path.isfile(path):
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 16), b''):
+                    h.update(chunk)
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class BuildTimer(object):
+    """Collect duration and cache usage of each step from docker build output"""
+
+    step_re = re.compile(r'^Step (\d+)/(\d+) ?: ?(.*)$')
+    image_re = re.compile(r'^Successfully built ([0-9a-f]+)$')
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.step_started_at = None
+        self.steps = []
+        self.image_id = None
+
+    def _end_step(self) -> None:
+        if self.steps and self.steps[-1]['seconds'] is None:
+            self.steps[-1]['seconds'] = round(time.time() - self.step_started_at, 3)
+
+    def feed(self, line: str) -> None:
+        """Parse a line of build output"""
+        line = line.strip()
+        m = self.step_re.match(line)
+        if m:
+            self._end_step()
+            self.step_started_at = time.time()
+            self.steps.append({
+                'step': int(m.group(1)),
+                'instruction': m.group(3),
+                'cached': False,
+                'seconds': None,
+            })
+        elif line == '---> Using cache' and self.steps:
+            self.steps[-1]['cached'] = True
+        else:
+            m = self.image_re.match(line)
+            if m:
+                self.image_id = m.group(1)
+
+    def summary(self) -> Dict:
+        """Build timing summary"""
+        self._end_step()
+        return {
+            'image': self.image_id,
+            'seconds': round(time.time() - self.started_at, 3),
+            'cached_steps': sum(1 for step in self.steps if step['cached']),
+            'steps': self.steps,
+        }
+
+
+def stream_build(docker_cli: docker.DockerClient, workdir: str, tag: str, labels: Dict[str, str]=None,
+                 quiet: bool=False, prefix: str='') -> Tuple[object, Dict]:
+    """Build image and print build output as it happens
+
+    Args:
+        docker_cli (DockerClient): docker client
+        workdir (str): absolute path of build context directory
+        tag (str): full tag of image
+        labels (dict): image labels
+        quiet (bool): do not print build output
+        prefix (str): prefix of printed lines
+
+    Returns:
+        tuple of built image and build timing summary
+
+    Raises:
+        docker.errors.BuildError
+    """
+    timer = BuildTimer()
+    build_log = []
+    for chunk in docker_cli.api.build(path=workdir, tag=tag, rm=True, labels=labels, decode=True):
+        build_log.append(chunk)
+        if 'error' in chunk:
+            raise docker.errors.BuildError(chunk['error'], iter(build_log))
+        stream = chunk.get('stream')
+        if stream:
+            for line in stream.splitlines():
+                if not quiet:
+                    click.echo('{}{}'.format(prefix, line))
+                timer.feed(line)
+        image_id = chunk.get('aux', {}).get('ID')
+        if image_id:
+            timer.image_id = image_id
+    summary = timer.summary()
+    if summary['image'] is None:
+        raise docker.errors.BuildError('Unknown image ID', iter(build_log))
+    image = docker_cli.images.get(summary['image'])
+    summary['image'] = image.id
+    return image, summary
+
+
+def prune_images(docker_cli: docker.DockerClient, repo_name: str, keep: int=1, protect: List[str]=None,
+                 parallel: int=4, prefix: str='') -> Tuple[int, int, bool]:
+    """Delete images of repository except the most recent ones
+
+    Images are listed with a single API call and untagged from the repository concurrently, so
+    that an image also tagged in another repository is kept there.
+
+    Args:
+        docker_cli (DockerClient): docker client
+        repo_name (str): repository name
+        keep (int): number of most recent images to keep
+        protect (list): image references never deleted, counted as most recent
+        parallel (int): max number of concurrent delete requests
+        prefix (str): prefix of printed lines
+
+    Returns:
+        tuple of number of deleted images, reclaimed disk space in bytes from sizes of deleted images, and
+        whether the space is exact. Daemon does not compute size of layers shared with other images when
+        listing images, the whole image size is then counted and the space is an upper bound.
+    """
+    protect = set(protect or [])
+    images = sorted(docker_cli.api.images(name=repo_name),
+                    key=lambda img: (bool(protect & set(img.get('RepoTags') or [])), img['Created']),
+                    reverse=True)
+    stale = [img for img in images[keep:] if not protect & set(img.get('RepoTags') or [])]
+    if not stale:
+        return 0, 0, True
+
+    def remove(img: Dict) -> Tuple[int, bool]:
+        """Untag image from repository, returns its size if it was deleted and whether size is exact"""
+        removed = []
+        for ref in img.get('RepoTags') or []:
+            if ref.rsplit(':', 1)[0] == repo_name:
+                removed.extend(docker_cli.api.remove_image(ref, force=True) or [])
+        click.secho('{}Delete old image of {}'.format(prefix, img['Id']))
+        if not any(item.get('Deleted') == img['Id'] for item in removed):
+            # still tagged in another repository
+            return 0, True
+        # layers shared with other images stay, SharedSize is -1 when not computed by daemon
+        shared_size = img.get('SharedSize', -1)
+        if shared_size < 0:
+            return img.get('Size', 0), False
+        return img.get('Size', 0) - shared_size, True
+
+    deleted = reclaimed = 0
+    exact = True
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = {executor.submit(remove, img): img for img in stale}
+        for future in as_completed(futures):
+            try:
+                size, size_exact = future.result()
+            except docker.errors.APIError as e:
+                click.secho('{}Failed to delete image {}: {}'.format(prefix, futures[future]['Id'], e), fg='red')
+            else:
+                deleted += 1
+                reclaimed += size
+                exact = exact and size_exact
+    return deleted, reclaimed, exact
+
+
+def prune_summary(deleted: int, reclaimed: int, exact: bool) -> str:
+    """Printed summary of deleted images and reclaimed disk space returned by `prune_images`"""
+    return 'Deleted {} old image(s), reclaimed {}{:.1f} MB'.format(deleted, '' if exact else 'at most ',
+                                                                   reclaimed / 1e6)
+
+
+def build_image(docker_cli: docker.DockerClient, project_name: str, commit_ref_name: str, commit_sha: str,
+                workdir: str, registry_url: str=None, reuse_image: bool=True, quiet: bool=False,
+                prefix: str='') -> Tuple[object, str, Dict]:
+    """Build image tagged by commit SHA and latest
+
+    Args:
+        docker_cli (DockerClient): docker client
+        project_name (str): project name
+        commit_ref_name (str): name of git branch or tag
+        commit_sha (str): git commit hash
+        workdir (str): absolute path of build context directory
+        registry_url (str): docker registry URL
+        reuse_image (bool): retag existing image built from identical build context instead of building
+        quiet (bool): do not print build output
+        prefix (str): prefix of printed lines
+
+    Returns:
+        tuple of built image, repository name and build timing summary
+    """
+    repo_name = '{}/{}'.format(project_name.lower(), commit_ref_name)
+    if registry_url is not None:
+        repo_name = '{}/{}'.format(registry_url, repo_name)
+    build_full_tag = '{}:{}'.format(repo_name, commit_sha)
+    context_hash = build_context_hash(workdir)
+    cached_images = []
+    if reuse_image:
+        cached_images = docker_cli.images.list(filters={'label': '{}={}'.format(CONTEXT_HASH_LABEL, context_hash)})
+    if cached_images:
+        new_image = cached_images[0]
+        click.secho('{}Build context unchanged, tag image {} as {}'.format(prefix, new_image.id, build_full_tag))
+        new_image.tag(repo_name, tag=commit_sha)
+        summary = {'image': new_image.id, 'seconds': 0, 'cached_steps': 0, 'steps': [], 'reused': True}
+    else:
+        click.secho('{}Building image {}'.format(prefix, build_full_tag))
+        new_image, summary = stream_build(docker_cli, workdir, build_full_tag,
+                                          labels={CONTEXT_HASH_LABEL: context_hash}, quiet=quiet, prefix=prefix)
+        summary['reused'] = False
+    summary['tag'] = build_full_tag
+    summary['context_hash'] = context_hash
+    # tag as latest
+    new_image.tag(repo_name, tag='latest')
+    click.secho('{}Image built {}'.format(prefix, new_image.id))
+
+    return new_image, repo_name, summary
+
+
+def push_image(docker_cli: docker.DockerClient, repo_name: str, tag: str, prefix: str='') -> None:
+    """Push image to registry and print progress of each layer
+
+    Args:
+        docker_cli (DockerClient): docker client
+        repo_name (str): repository name
+        tag (str): image tag
+        prefix (str): prefix of printed lines
+
+    Raises:
+        docker.errors.APIError
+    """
+    # layer ID => (status, progress percentage printed)
+    layers = {}
+    for chunk in docker_cli.api.push(repo_name, tag=tag, stream=True, decode=True):
+        if 'error' in chunk:
+            raise docker.errors.APIError(chunk['error'])
+        layer_id = chunk.get('id')
+        status = chunk.get('status', '')
+        if not layer_id or layer_id == tag:
+            continue
+        progress = chunk.get('progressDetail') or {}
+        percent = 0
+        if progress.get('total'):
+            percent = 100 * progress.get('current', 0) // progress['total'] // 25 * 25
+        if layers.get(layer_id) != (status, percent):
+            layers[layer_id] = (status, percent)
+            click.echo('{}{}:{} layer {} {}{}'.format(
+                prefix, repo_name, tag, layer_id, status, ' {}%'.format(percent) if progress.get('total') else ''))
+
 
 @click.command()
 @click.option('--project-name', type=str, required=True, help='project name')
@@ -11,27 +286,114 @@ import docker
 @click.option('--commit-sha', type=str, required=True, help='git commit hash')
 @click.option('--workdir', type=click.Path(exists=True, file_okay=False, resolve_path=True), required=True)
 @click.option('--registry-url', type=str, help='Docker registry URL', default=None)
-def build(project_name, commit_ref_name, commit_sha, workdir, registry_url):
+@click.option('--reuse-image/--no-reuse-image', default=True,
+              help='retag existing image built from identical build context instead of building')
+@click.option('--quiet', is_flag=True, default=False, help='do not print build output')
+@click.option('--summary-path', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='write json summary of build step timing into file')
+@click.option('--prune/--no-prune', default=False, help='delete old images of the repository after build')
+@click.option('--keep', type=int, default=1, help='number of most recent images kept by pruning')
+def build(project_name, commit_ref_name, commit_sha, workdir, registry_url, reuse_image, quiet, summary_path,
+          prune, keep):
     """Build docker image"""
-    repo_name = '{}/{}'.format(project_name.lower(), commit_ref_name)
-    if registry_url is not None:
-        repo_name = '{}/{}'.format(registry_url, repo_name)
-    build_full_tag = '{}:{}'.format(repo_name, commit_sha)
     docker_cli = docker.from_env()
-    click.secho('Building image {}'.format(build_full_tag))
-    new_image, _ = docker_cli.images.build(path=workdir, tag=build_full_tag, rm=True)
-    # tag as latest
-    new_image.tag(repo_name, tag='latest')
-    click.secho('Image built {}'.format(new_image.id))
-    image_list = docker_cli.images.list(
-        name=repo_name,
-        filters={'before': build_full_tag},
-        #  all=True
-    )
-    for img in image_list:
-        # delete old images
-        click.secho('Delete old image of {}'.format(img.id))
-        docker_cli.images.remove(image=img.short_id, force=True)
-
+    new_image, repo_name, summary = build_image(docker_cli, project_name, commit_ref_name, commit_sha, workdir,
+                                                registry_url, reuse_image, quiet)
+    if prune:
+        click.secho(prune_summary(*prune_images(docker_cli, repo_name, keep, protect=[summary['tag']])))
+    if summary_path:
+        with open(summary_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+    click.echo(json.dumps(summary))
     return new_image.short_id
 
+
+@click.command()
+@click.option('--service', 'services', type=str, required=True, multiple=True,
+              help='project name and build context directory as NAME=WORKDIR, can be repeated')
+@click.option('--commit-ref-name', type=str, required=True, help='name of git branch or tag')
+@click.option('--commit-sha', type=str, required=True, help='git commit hash')
+@click.option('--registry-url', type=str, help='Docker registry URL', default=None)
+@click.option('--reuse-image/--no-reuse-image', default=True,
+              help='retag existing image built from identical build context instead of building')
+@click.option('--parallel', type=int, default=4, help='max number of concurrent builds and pushes')
+@click.option('--push/--no-push', default=False, help='push commit SHA and latest tags after all images are built')
+@click.option('--quiet', is_flag=True, default=False, help='do not print build output')
+@click.option('--summary-path', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='write json summary of build step timing of all images into file')
+@click.option('--prune/--no-prune', default=False, help='delete old images of the repositories after build')
+@click.option('--keep', type=int, default=1, help='number of most recent images kept by pruning')
+def build_many(services, commit_ref_name, commit_sha, registry_url, reuse_image, parallel, push, quiet,
+               summary_path, prune, keep):
+    """Build and push several docker images concurrently"""
+    workdirs = {}
+    for service in services:
+        name, sep, workdir = service.partition('=')
+        if not sep or not name or not os.path.isdir(workdir):
+            raise click.BadParameter('{} is not NAME=WORKDIR of an existing directory'.format(service),
+                                     param_hint='--service')
+        workdirs[name] = os.path.abspath(workdir)
+
+    def build_service(name: str) -> Tuple[str, Dict]:
+        docker_cli = docker.from_env()
+        _, repo_name, summary = build_image(docker_cli, name, commit_ref_name, commit_sha, workdirs[name],
+                                            registry_url, reuse_image, quiet, prefix='[{}] '.format(name))
+        if prune:
+            prune_images(docker_cli, repo_name, keep, protect=[summary['tag']], prefix='[{}] '.format(name))
+        return repo_name, summary
+
+    def push_service(name: str, repo_name: str) -> None:
+        docker_cli = docker.from_env()
+        for tag in (commit_sha, 'latest'):
+            push_image(docker_cli, repo_name, tag, prefix='[{}] '.format(name))
+
+    summaries = {}
+    repo_names = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = {executor.submit(build_service, name): name for name in workdirs}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                repo_names[name], summaries[name] = future.result()
+            except Exception as e:
+                failed.append(name)
+                click.secho('[{}] Build failed: {}'.format(name, e), fg='red')
+
+        if push and not failed:
+            futures = {executor.submit(push_service, name, repo_name): name for name, repo_name in repo_names.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.append(name)
+                    click.secho('[{}] Push failed: {}'.format(name, e), fg='red')
+                else:
+                    click.secho('[{}] Pushed {}'.format(name, repo_names[name]))
+
+    if summary_path:
+        with open(summary_path, 'w') as f:
+            json.dump(summaries, f, indent=2)
+    click.echo(json.dumps(summaries))
+    if failed:
+        raise click.Abort
+
+
+@click.command()
+@click.option('--repo', 'repos', type=str, required=True, multiple=True,
+              help='image repository name, can be repeated')
+@click.option('--keep', type=int, default=1, help='number of most recent images kept in each repository')
+@click.option('--parallel', type=int, default=4, help='max number of concurrent delete requests')
+def prune(repos, keep, parallel):
+    """Delete old docker images of repositories"""
+    docker_cli = docker.from_env()
+    total_deleted = total_reclaimed = 0
+    total_exact = True
+    for repo_name in repos:
+        deleted, reclaimed, exact = prune_images(docker_cli, repo_name, keep, parallel=parallel,
+                                                 prefix='[{}] '.format(repo_name))
+        total_deleted += deleted
+        total_reclaimed += reclaimed
+        total_exact = total_exact and exact
+    click.secho(prune_summary(total_deleted, total_reclaimed, total_exact))
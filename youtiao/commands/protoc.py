@@ -1,52 +1,200 @@
 # -*- coding: utf8 -*-
 
+import glob
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
 from pkg_resources import resource_filename
 from pathlib import Path
-from typing import Tuple
+from typing import Iterator, List, Tuple
 
 import click
 
-from grpc_tools import _protoc_compiler
+from youtiao.utils.grpc import PROTOC_CACHE_FILENAME, ProtoCache, proto_dependents, proto_groups, proto_outputs, \
+    run_protoc
+# single .proto file compilation, under the name used by commands
+from youtiao.utils.grpc import protoc as proto_compile
+from youtiao.utils.watch import make_watcher, watch_changes
 
 
-def proto_compile(proto_path: str, output_path: str) -> Tuple[Path, Path]:
-    """compile .proto file
+def proto_tree_compile(proto_paths: List[str], proto_root: str, output_path: str, cache: ProtoCache=None,
+                       workers: int=None, executor: Executor=None) -> Iterator[Tuple[List[str], int]]:
+    """compile .proto files in parallel processes
+
+    Files connected by imports are compiled in the same protoc invocation. Groups are then
+    packed into at most `workers` batches compiled in a process pool, because protoc compiler
+    holds the GIL and cannot run in threads.
 
     Args:
-        proto_path (str): proto file path
+        proto_paths (list): proto file paths
+        proto_root (str): root directory of proto files, used as include path
         output_path (str): output files directory
+        cache (ProtoCache): optional cache to skip compilation of unchanged proto files
+        workers (int): max number of compiler processes, default to number of CPUs
+        executor (Executor): optional process pool kept alive by caller, a new pool is
+            created for the compilation if not given
 
     Returns:
-        tuple of paths for pb2 python file and pb2 grpc file
+        Iterator of compiled proto file paths and protoc exit code for each batch
 
     Raises:
         FileNotFoundError
     """
-    proto_path = str(proto_path)
+    proto_root = str(proto_root)
     output_path = str(output_path)
-    if not Path(proto_path).is_file():
-        raise FileNotFoundError('proto file not found')
+    if not Path(proto_root).is_dir():
+        raise FileNotFoundError('proto root dir not found')
     if not Path(output_path).is_dir():
         raise FileNotFoundError('output dir not found')
-    args = [
-        resource_filename('grpc_tools', 'protoc.py'),
-        '-I{}'.format(output_path),
-        '--python_out={}'.format(output_path),
-        '--grpc_python_out={}'.format(output_path),
-        proto_path,
-        '-I{}'.format(resource_filename('grpc_tools', '_proto')),
-    ]
-    return _protoc_compiler.run_main([arg.encode() for arg in args])
+    include_paths = [proto_root, resource_filename('grpc_tools', '_proto')]
+
+    keys = {}
+    if cache is not None:
+        for proto_path in proto_paths:
+            key = cache.key(proto_path, include_paths)
+            if not cache.is_current(proto_path, key):
+                keys[proto_path] = key
+        proto_paths = list(keys)
+    if not proto_paths:
+        return
+
+    # pack groups into balanced batches, largest group first
+    workers = workers or os.cpu_count() or 1
+    groups = sorted(proto_groups(proto_paths, include_paths), key=len, reverse=True)
+    batches = [[] for _ in range(min(workers, len(groups)))]
+    for group in groups:
+        min(batches, key=len).extend(group)
+
+    def compiled(batch: List[str], ret: int) -> Tuple[List[str], int]:
+        if cache is not None and ret == 0:
+            for proto_path in batch:
+                cache.update(proto_path, keys[proto_path], proto_outputs(proto_path, include_paths, output_path))
+        return batch, ret
+
+    if len(batches) == 1:
+        # no need to pay for process pool startup
+        yield compiled(batches[0], run_protoc(batches[0], include_paths, output_path))
+        return
+
+    pool = executor or ProcessPoolExecutor(max_workers=len(batches))
+    try:
+        futures = {pool.submit(run_protoc, batch, include_paths, output_path): batch for batch in batches}
+        for future in as_completed(futures):
+            yield compiled(futures[future], future.result())
+    finally:
+        if executor is None:
+            pool.shutdown()
+
+
+def find_protos(proto_path: str) -> Tuple[List[str], str]:
+    """Find .proto files by file path, directory or glob pattern
+
+    Args:
+        proto_path (str): proto file path, directory searched recursively or glob pattern
+
+    Returns:
+        tuple of sorted absolute proto file paths and their root directory
+    """
+    proto_path = os.path.abspath(proto_path)
+    if os.path.isfile(proto_path):
+        return [proto_path], os.path.dirname(proto_path)
+    if os.path.isdir(proto_path):
+        return sorted(str(p) for p in Path(proto_path).rglob('*.proto')), proto_path
+    # root is the longest leading directory without glob magic
+    root_parts = []
+    for part in Path(proto_path).parts:
+        if glob.has_magic(part):
+            break
+        root_parts.append(part)
+    proto_files = sorted(p for p in glob.glob(proto_path, recursive=True) if os.path.isfile(p))
+    return proto_files, str(Path(*root_parts))
+
+
+def compile_protos(proto_files: List[str], proto_root: str, out: str, proto_cache: ProtoCache=None,
+                   workers: int=None, executor: Executor=None) -> List[str]:
+    """Compile proto files and report progress
+
+    Args:
+        proto_files (list): proto file paths
+        proto_root (str): root directory of proto files, used as include path
+        out (str): output files directory
+        proto_cache (ProtoCache): optional cache to skip compilation of unchanged proto files, saved
+            after compilation
+        workers (int): max number of compiler processes, default to number of CPUs
+        executor (Executor): optional process pool kept alive by caller
+
+    Returns:
+        list of proto file paths failed to compile
+    """
+    failed = []
+    try:
+        for batch, ret in proto_tree_compile(proto_files, proto_root, out, proto_cache, workers, executor):
+            if ret == 0:
+                click.secho('Compiled {} proto file(s)'.format(len(batch)))
+            else:
+                click.secho('Failed to compile {}'.format(', '.join(batch)), fg='red')
+                failed.extend(batch)
+    finally:
+        if proto_cache is not None:
+            proto_cache.save()
+            click.secho('Compile cache: {} hit(s), {} miss(es)'.format(proto_cache.hits, proto_cache.misses))
+            proto_cache.hits = proto_cache.misses = 0
+    return failed
 
 
 @click.command()
-@click.option('--proto-path', required=True, type=click.Path(exists=True, dir_okay=False, resolve_path=True),
-              help='path of protobuf file')
+@click.option('--proto-path', required=True, type=str,
+              help='path of protobuf file, directory of protobuf files or glob pattern')
 @click.option('--out', type=click.Path(exists=True, file_okay=False, resolve_path=True),
               help='output files location', default=None)
-def protoc(proto_path, out):
+@click.option('--cache/--no-cache', default=True, help='skip compiling proto file unchanged since last compile')
+@click.option('--cache-path', type=click.Path(dir_okay=False, resolve_path=True), default=None,
+              help='compile cache file, default to {} in output files location'.format(PROTOC_CACHE_FILENAME))
+@click.option('--workers', type=int, default=None, help='max number of compiler processes, default to CPU count')
+@click.option('--watch', is_flag=True, default=False, help='keep running and recompile proto files on change')
+@click.option('--debounce', type=float, default=0.2, help='seconds to wait for more changes before recompiling')
+def protoc(proto_path, out, cache, cache_path, workers, watch, debounce):
     """Shortcut of grpc_tools.protoc to compile .proto file."""
+    proto_files, proto_root = find_protos(proto_path)
+    if not proto_files:
+        click.secho('No proto file found by {}'.format(proto_path), fg='red')
+        raise click.Abort
     if out is None:
-        out, _ = os.path.split(proto_path)
-    proto_compile(proto_path, out)
+        out = proto_root
+    proto_cache = None
+    if cache:
+        proto_cache = ProtoCache(cache_path or os.path.join(out, PROTOC_CACHE_FILENAME))
+
+    failed = compile_protos(proto_files, proto_root, out, proto_cache, workers)
+    if not watch:
+        if failed:
+            raise click.Abort
+        return
 
+    # keep compiler processes alive between changes
+    executor = ProcessPoolExecutor(max_workers=workers)
+    watcher = make_watcher([proto_root], '.proto')
+    click.secho('Watching {} with {}'.format(proto_root, type(watcher).__name__), bold=True)
+    include_paths = [proto_root, resource_filename('grpc_tools', '_proto')]
+    try:
+        while True:
+            try:
+                for changed in watch_changes(watcher, debounce):
+                    try:
+                        proto_files, _ = find_protos(proto_path)
+                        proto_files = proto_dependents(changed, proto_files, include_paths)
+                        if not proto_files:
+                            continue
+                        click.secho('{} file(s) changed, recompile {} proto file(s)'.format(
+                            len(changed), len(proto_files)))
+                        compile_protos(proto_files, proto_root, out, proto_cache, workers, executor)
+                    except OSError as e:
+                        # e.g. file deleted since changed, recompiled on next change
+                        click.secho('Failed to recompile changes: {}'.format(e), fg='red')
+            except OSError as e:
+                # e.g. watch limit reached by new directory, which is not watched
+                click.secho('Failed to watch changes: {}'.format(e), fg='red')
+    except KeyboardInterrupt:
+        click.secho('Stop watching')
+    finally:
+        watcher.close()
+        executor.shutdown()
@@ -1,176 +1,250 @@
 # -*- coding: utf8 -*-
 
 import json
-from typing import Dict
-from time import sleep
-from copy import deepcopy
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Set, Tuple
+from time import monotonic
 
 import click
-import requests
 
+from youtiao.utils.rancher import RANCHER_CACHE_PATH, IdCache, RancherClient, RequestMetrics
 
-class RancherClient(object):
-    def __init__(self, endpoint_url: str, key: str, secret: str):
-        """
-        Args:
-            endpoint_url (str): rancher server API endpoint URL
-            key (str): rancher account or environment API access key
-            secret (str): rancher account or environment API secret corresponding to the access key
-        """
-        self.endpoint_url = endpoint_url
-        self.s = requests.Session()
-        self.s.auth = (key, secret)
-        # timeout in second for retry
-        self.timeout = 60
-        self.sleep_step = 2
-
-    def environment_id(self, name: str=None) -> str:
-        """
-        Get rancher environement ID. If using account key, return the environment ID specified by `name`.
 
-        Args:
-            name (str): name for the environment requested (only useful for account key)
+DEPLOY_OPTIONS = ('batch_size', 'batch_interval', 'sidekicks', 'start_before_stopping')
+STATE_COLORS = {'active': 'green', 'failed': 'red', 'skipped': 'yellow'}
 
-        Returns:
-            environment ID in string
-        """
-        if not name:
-            r = self.s.get('{}/projects'.format(self.endpoint_url), params={'limit': 1000})
-        else:
-            r = self.s.get('{}/projects'.format(self.endpoint_url), params={'limit': 1000, 'name': name})
-        r.raise_for_status()
-        data = r.json()['data']
-        if data:
-            return data[0]['id']
-        return None
-
-    def service_info(self, environment_id: str, stack_name: str, service_name: str) -> Dict:
-        """
-        Get rancher service info by given environment id and service name.
 
-        Args:
-            environment_id (str): defined environment id in rancher
-            stack_name (str): defined stack name in rancher
-            service_name (str): defined service name in rancher
+class DeployStatus(object):
+    """Status table of concurrent service deploys, redrawn in place on terminal"""
 
-        Returns:
-            service info in json
+    def __init__(self, keys: List[str], live: bool=None):
         """
-        if not environment_id:
-            raise Exception('Empty rancher environment ID')
-        r = self.s.get('{}/projects/{}/stacks'.format(self.endpoint_url, environment_id),
-                       params={'limit': 1000, 'name': stack_name})
-        r.raise_for_status()
-        data = r.json()['data']
-
-        if not data:
-            # stack not found
-            raise Exception('Stack {} not found'.format(stack_name))
-            return None
-
-        stack_info = deepcopy(data[0])
-
-        r = self.s.get('{}/projects/{}/services'.format(self.endpoint_url, environment_id),
-                       params={'name': service_name})
-        r.raise_for_status()
-        data = r.json()['data']
-        if not data:
-            # service not found
-            return None
-        for service_info in data:
-            if service_info['stackId'] == stack_info['id']:
-                return service_info
-        return None
-
-
-    def service_finish_upgrade(self, environment_id: str, service_id: str) -> Dict:
-        """
-        Finish service upgrade when service is in `upgraded` state.
-
         Args:
-            environment_id (str): defined environment id in rancher
-            service_id (str): defined environment id in rancher
-
-        Returns:
-            service info in json
-        """
-        r = self.s.get('{}/projects/{}/services/{}'.format(self.endpoint_url, environment_id, service_id))
-        r.raise_for_status()
-        data = r.json()
-        if data.get('type') == 'error':
-            raise Exception(json.dumps(data))
-        if data['state'] == 'active':
-            return data
-
-        if data['state'] == 'upgrading':
-            retry = 0
-            while data['state'] != 'upgraded':
-                sleep(self.sleep_step)
-                retry += self.sleep_step
-                if retry > self.timeout:
-                    raise Exception('Timeout of rancher finish upgrade service {}'.format(service_id))
-                r = self.s.get('{}/projects/{}/services/{}'.format(self.endpoint_url, environment_id, service_id))
-                r.raise_for_status()
-                data = r.json()
-
-        if data['state'] != 'upgraded':
-            raise Exception('Unable to finish upgrade service in state of {}'.format(data['state']))
-        r = self.s.post('{}/projects/{}/services/{}/'.format(self.endpoint_url, environment_id, service_id),
-                        params={'action': 'finishupgrade'})
-        r.raise_for_status()
-
-        # wait till service finish upgrading
-        retry = 0
-        while data['state'] != 'active':
-            sleep(self.sleep_step)
-            retry += self.sleep_step
-            if retry > self.timeout:
-                raise Exception('Timeout of rancher finish upgrade service {}'.format(service_id))
-            r = self.s.get('{}/projects/{}/services/{}'.format(self.endpoint_url, environment_id, service_id))
-            r.raise_for_status()
-            data = r.json()
-
-        return data
-
-    def service_upgrade(self, environment_id: str, service_id: str, batch_size: int=1,
-                        batch_interval: int=2, sidekicks: bool=False, start_before_stopping: bool=False) -> Dict:
+            keys (list): deploy targets as `stack/service`
+            live (bool): redraw table on each change, default to whether stdout is a terminal
         """
-        Upgrade service
+        self.rows = OrderedDict((key, {'state': 'pending', 'detail': '', 'start': None, 'seconds': 0})
+                                for key in keys)
+        self.live = sys.stdout.isatty() if live is None else live
+        self.lock = threading.Lock()
+        self.drawn_lines = 0
+
+    def set(self, key: str, state: str, detail: str='') -> None:
+        with self.lock:
+            row = self.rows[key]
+            if row['start'] is None and state not in ('pending', 'skipped'):
+                row['start'] = monotonic()
+            if row['start'] is not None:
+                row['seconds'] = monotonic() - row['start']
+            row.update(state=state, detail=detail)
+            if self.live:
+                self.draw()
+            else:
+                click.secho('{} {}{}'.format(key, state, ': {}'.format(detail) if detail else ''),
+                            fg=STATE_COLORS.get(state))
+
+    def lines(self) -> List[str]:
+        width = max(len(key) for key in self.rows)
+        return ['{} {:<12} {:>6.1f}s {}'.format(key.ljust(width), row['state'], row['seconds'], row['detail'])
+                for key, row in self.rows.items()]
+
+    def draw(self) -> None:
+        if self.drawn_lines:
+            # move cursor back to the first line of the table
+            click.echo('\x1b[{}F'.format(self.drawn_lines), nl=False)
+        for line, row in zip(self.lines(), self.rows.values()):
+            click.secho('\x1b[2K' + line, fg=STATE_COLORS.get(row['state']))
+        self.drawn_lines = len(self.rows)
+
+
+def print_metrics(metrics: RequestMetrics) -> None:
+    """Print request metrics table of rancher API endpoints"""
+    rows = metrics.summary()
+    if not rows:
+        return
+    width = max(len(row['endpoint']) for row in rows)
+    click.secho('{} {:>6} {:>6} {:>9} {:>9} {:>9}'.format(
+        'endpoint'.ljust(width), 'count', 'errors', 'mean', 'p95', 'max'), bold=True)
+    for row in rows:
+        click.secho('{} {:>6} {:>6} {:>7.1f}ms {:>7.1f}ms {:>7.1f}ms'.format(
+            row['endpoint'].ljust(width), row['count'], row['errors'], row['mean_ms'], row['p95_ms'],
+            row['max_ms']))
+
+
+def parse_target(target: str, stack: str=None) -> Tuple[str, str]:
+    """Parse deploy target of `STACK/SERVICE`, or `SERVICE` in default stack"""
+    if '/' in target:
+        return tuple(target.split('/', 1))
+    if not stack:
+        raise click.UsageError('Stack of service {} is missing, use --stack or STACK/SERVICE'.format(target))
+    return stack, target
+
+
+def load_deploy_manifest(manifest_path: str) -> List[Dict]:
+    """Load deploy targets from manifest file
+
+    Manifest is a json or yaml file of service list, or of a mapping with key `services`.
+    Each service has `stack` and `service` names (or `service` as `STACK/SERVICE`), optional
+    `group` number, `depends_on` list of `STACK/SERVICE` and deploy options overriding the
+    command line ones.
+
+    Args:
+        manifest_path (str): manifest file path
+
+    Returns:
+        list of deploy targets
+    """
+    with open(manifest_path) as f:
+        if manifest_path.endswith('.json'):
+            manifest = json.load(f)
+        else:
+            try:
+                import yaml
+            except ImportError:
+                raise click.UsageError('PyYAML is required to load yaml manifest, use json manifest instead')
+            manifest = yaml.safe_load(f)
+    if isinstance(manifest, dict):
+        manifest = manifest.get('services')
+    if not isinstance(manifest, list):
+        raise click.UsageError('Manifest must be a list of services')
+
+    targets = []
+    for item in manifest:
+        if not item.get('service'):
+            raise click.UsageError('Service name is missing in manifest')
+        stack, service = parse_target(item['service'], item.get('stack'))
+        target = {
+            'stack': stack,
+            'service': service,
+            'group': int(item.get('group', 0)),
+            'depends_on': [str(d) for d in item.get('depends_on', [])],
+        }
+        target.update({k: item[k] for k in DEPLOY_OPTIONS if k in item})
+        targets.append(target)
+    return targets
+
+
+def deploy_order(targets: List[Dict]) -> Dict[str, Set[str]]:
+    """Targets that must be deployed before each target
+
+    A target depends on its `depends_on` targets and on all targets of lower groups.
+
+    Returns:
+        dict of target key to set of prerequisite keys
+
+    Raises:
+        click.UsageError: unknown, duplicated or circular dependency
+    """
+    keys = ['{}/{}'.format(t['stack'], t['service']) for t in targets]
+    if len(set(keys)) != len(keys):
+        raise click.UsageError('Duplicated service in deploy targets')
+    prerequisites = {}
+    for key, target in zip(keys, targets):
+        unknown = set(target['depends_on']) - set(keys)
+        if unknown:
+            raise click.UsageError('{} depends on unknown service {}'.format(key, ', '.join(sorted(unknown))))
+        prerequisites[key] = set(target['depends_on']) | {
+            k for k, t in zip(keys, targets) if t['group'] < target['group']}
+
+    # detect cycles by removing targets without prerequisites
+    remaining = {k: set(v) for k, v in prerequisites.items()}
+    while remaining:
+        ready = {k for k, v in remaining.items() if not v}
+        if not ready:
+            raise click.UsageError('Circular dependency among {}'.format(', '.join(sorted(remaining))))
+        remaining = {k: v - ready for k, v in remaining.items() if k not in ready}
+    return prerequisites
+
+
+def deploy_service(rancher_cli: RancherClient, env_id: str, stack: str, service: str, batch_size: int=1,
+                   batch_interval: int=2, sidekicks: bool=False, start_before_stopping: bool=False,
+                   report: Callable[[str], None]=None) -> Dict:
+    """Upgrade service and wait till upgrade finished
+
+    Args:
+        rancher_cli (RancherClient): rancher client
+        env_id (str): defined environment id in rancher
+        stack (str): defined stack name in rancher
+        service (str): defined service name in rancher
+        batch_size (int): number of containers to upgrade at once
+        batch_interval (int): interval (in second) between upgrade batches
+        sidekicks (bool): upgrade sidekicks services at the same time
+        start_before_stopping (bool): start new containers before stopping the old ones
+        report (callable): called with deploy state on progress
+
+    Returns:
+        service info in json
+    """
+    report = report or (lambda state: None)
+    report('resolving')
+    service_info = rancher_cli.service_info(env_id, stack, service)
+    if not service_info:
+        raise Exception('Service {} not found in rancher'.format(service))
+    service_id = service_info['id']
+    report('checking')
+    rancher_cli.service_finish_upgrade(env_id, service_id)
+    report('upgrading')
+    rancher_cli.service_upgrade(env_id, service_id, batch_size, batch_interval, sidekicks, start_before_stopping)
+    service_info = rancher_cli.service_finish_upgrade(env_id, service_id)
+    report('active')
+    return service_info
 
-        Args:
-            environment_id (str): defined environment id in rancher
-            service_id (str): defined environment id in rancher
-            batch_size (int): number of containers to upgrade at once
-            batch_interval (int): interval (in second) between upgrade batches
-            sidekicks (bool): upgrade sidekicks services at the same time
-            start_before_stopping (bool): start new containers before stopping the old ones
-
-        Returns:
-            service info in json
-        """
-        r = self.s.get('{}/projects/{}/services/{}'.format(self.endpoint_url, environment_id, service_id))
-        r.raise_for_status()
-        data = r.json()
-        if data.get('type') == 'error':
-            raise Exception(json.dumps(data))
-        if data['state'] != 'active':
-            raise Exception('Service {} in state of {}, cannot upgrade'.format(service_id, data['state']))
-
-        upgrade_input = {'inServiceStrategy': {
-            'batchSize': batch_size,
-            'intervalMillis': batch_interval * 1000,
-            'startFirst': start_before_stopping,
-            'launchConfig': data['launchConfig'],
-            'secondaryLaunchConfigs': [],
-        }}
-        if sidekicks:
-            upgrade_input['inServiceStrategy']['secondaryLaunchConfigs'] = data['secondaryLaunchConfigs']
-
-        r = self.s.post('{}/projects/{}/services/{}/'.format(self.endpoint_url, environment_id, service_id),
-                        params={'action': 'upgrade'}, json=upgrade_input)
-        r.raise_for_status()
-
-        return r.json()
+
+def deploy_services(rancher_cli: RancherClient, env_id: str, targets: List[Dict], parallel: int=10,
+                    status: DeployStatus=None) -> Dict[str, str]:
+    """Deploy services concurrently, each one as soon as its prerequisites are deployed
+
+    Targets depending on a failed target are skipped.
+
+    Args:
+        rancher_cli (RancherClient): rancher client shared by all deploys
+        env_id (str): defined environment id in rancher
+        targets (list): deploy targets with `stack`, `service`, `group`, `depends_on` and deploy options
+        parallel (int): max number of concurrent deploys
+        status (DeployStatus): status table updated on progress
+
+    Returns:
+        dict of target key to final state, `active`, `failed` or `skipped`
+    """
+    prerequisites = deploy_order(targets)
+    pending = OrderedDict(('{}/{}'.format(t['stack'], t['service']), t) for t in targets)
+    status = status or DeployStatus(list(pending), live=False)
+    results = {}
+
+    def report(key: str) -> Callable[[str], None]:
+        return lambda state: status.set(key, state)
+
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        running = {}
+        while pending or running:
+            for key in list(pending):
+                if any(results.get(k) in ('failed', 'skipped') for k in prerequisites[key]):
+                    del pending[key]
+                    results[key] = 'skipped'
+                    status.set(key, 'skipped', 'prerequisite not deployed')
+                elif all(results.get(k) == 'active' for k in prerequisites[key]):
+                    target = pending.pop(key)
+                    options = {k: target[k] for k in DEPLOY_OPTIONS if k in target}
+                    future = executor.submit(deploy_service, rancher_cli, env_id, target['stack'],
+                                             target['service'], report=report(key), **options)
+                    running[future] = key
+            if not running:
+                # only targets skipped in this round remain
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    results[key] = 'failed'
+                    status.set(key, 'failed', str(e))
+                else:
+                    results[key] = 'active'
+    return results
 
 
 @click.command()
@@ -178,36 +252,69 @@ class RancherClient(object):
 @click.option('--rancher-key', required=True, help='rancher account or environment API access key')
 @click.option('--rancher-secret', required=True, help='rancher account or environment API secret corresponding to the access key')
 @click.option('--rancher-env', default=None, help='used to specify environemnt if account key is provided')
-@click.option('--stack', required=True, help='stack name defined in rancher')
-@click.option('--service', required=True, help='service name defined in rancher')
+@click.option('--stack', default=None, help='stack name defined in rancher')
+@click.option('--service', 'services', multiple=True,
+              help='service name defined in rancher, or STACK/SERVICE, can be repeated')
+@click.option('--manifest', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='json or yaml file of services to deploy with groups and dependencies')
+@click.option('--parallel', type=int, default=10, help='max number of concurrent service deploys')
 @click.option('--batch-size', default=1, help='number of containers to upgrade at once')
 @click.option('--batch-interval', default=2, help='interval (in second) between upgrade batches')
 @click.option('--sidekicks/--no-sidekicks', default=False, help='upgrade sidekicks services at the same time')
 @click.option('--start-before-stopping/--no-start-before-stopping', default=False,
               help='start new containers before stopping the old ones')
-def deploy(rancher_url, rancher_key, rancher_secret, rancher_env, stack, service,
-                   batch_size, batch_interval, sidekicks, start_before_stopping):
+@click.option('--event-stream/--no-event-stream', default=True,
+              help='wait for upgrade by subscribing rancher events instead of polling')
+@click.option('--id-cache/--no-id-cache', default=True,
+              help='cache environment, stack and service IDs between runs')
+@click.option('--id-cache-path', type=click.Path(dir_okay=False, resolve_path=True), default=RANCHER_CACHE_PATH,
+              help='ID cache file')
+@click.option('--id-cache-ttl', type=float, default=86400, help='seconds before cached IDs expire')
+@click.option('--request-timeout', type=float, default=30, help='seconds to wait for each rancher API response')
+@click.option('--retries', type=int, default=3,
+              help='max number of retries of rancher API request on connection error or 502/503/504')
+@click.option('--metrics', is_flag=True, default=False, help='print count and latency of rancher API requests')
+def deploy(rancher_url, rancher_key, rancher_secret, rancher_env, stack, services, manifest, parallel,
+           batch_size, batch_interval, sidekicks, start_before_stopping, event_stream, id_cache, id_cache_path,
+           id_cache_ttl, request_timeout, retries, metrics):
     """Deploy using rancher (v1.6) API (v2.0 beta)"""
-    rancher_cli = RancherClient(rancher_url, rancher_key, rancher_secret)
-    env_id = rancher_cli.environment_id(rancher_env)
-    if not env_id:
-        raise click.Abort('Environment {} not found in rancher'.format(rancher_env))
-    service_info = rancher_cli.service_info(env_id, stack, service)
-    if not service_info:
-        click.secho('Service {} not found in rancher'.format(service), fg='red')
+    options = {
+        'batch_size': batch_size,
+        'batch_interval': batch_interval,
+        'sidekicks': sidekicks,
+        'start_before_stopping': start_before_stopping,
+    }
+    targets = []
+    for service in services:
+        target_stack, target_service = parse_target(service, stack)
+        targets.append({'stack': target_stack, 'service': target_service, 'group': 0, 'depends_on': []})
+    if manifest:
+        targets.extend(load_deploy_manifest(manifest))
+    if not targets:
+        raise click.UsageError('No service to deploy, use --service or --manifest')
+    targets = [dict(options, **target) for target in targets]
+
+    ids = IdCache(id_cache_path, id_cache_ttl) if id_cache else None
+    rancher_cli = RancherClient(rancher_url, rancher_key, rancher_secret, event_stream, ids, request_timeout, retries,
+                                pool_size=parallel)
+    start = monotonic()
+    try:
+        env_id = rancher_cli.environment_id(rancher_env)
+        if not env_id:
+            raise click.Abort('Environment {} not found in rancher'.format(rancher_env))
+        status = DeployStatus(['{}/{}'.format(t['stack'], t['service']) for t in targets])
+        results = deploy_services(rancher_cli, env_id, targets, parallel, status)
+    finally:
+        if ids is not None:
+            try:
+                ids.save()
+            except OSError as e:
+                click.secho('Unable to save ID cache: {}'.format(e), fg='yellow')
+        if metrics:
+            print_metrics(rancher_cli.metrics)
+    failed = [key for key, state in results.items() if state != 'active']
+    if failed:
+        click.secho('Failed to deploy {}'.format(', '.join(failed)), fg='red')
         raise click.Abort
-    service_id = service_info['id']
-    click.secho('Check and finish service upgrade')
-    service_info = rancher_cli.service_finish_upgrade(env_id, service_id)
-    click.secho('Service info:')
-    click.secho(json.dumps(service_info))
-
-    # do upgrade
-    rancher_cli.service_upgrade(env_id, service_id, batch_size, batch_interval, sidekicks, start_before_stopping)
-    click.secho('Waiting for upgrade finish')
-    service_info = rancher_cli.service_finish_upgrade(env_id, service_id)
-
-    click.secho('Service {} deploy complete on {}'.format(service_info['name'], rancher_url))
-    return service_info
-
-
+    click.secho('{} service(s) deploy complete on {} in {:.1f}s'.format(
+        len(results), rancher_url, monotonic() - start))
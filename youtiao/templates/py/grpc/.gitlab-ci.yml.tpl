@@ -1,5 +1,5 @@
 variables:
-  PROJECT_LANGUAGE: "python:3.6"
+  PROJECT_LANGUAGE: "python:3.7"
   DOCKER_REGISTRY_URL: "registry.hexcloud.cn"
   # rancher server API endpoint
   # must with http scheme
@@ -1,6 +1,9 @@
 # -*- coding: utf8 -*-
 
+import asyncio
 import functools
+import signal
+import sys
 import threading
 import json
 import time
@@ -22,72 +25,143 @@ from {{ app_name }}.proto.{{ app_name }}_pb2_grpc import {{ app_name }}Servicer
 from {{ app_name }}.proto.{{ app_name }}_pb2 import Null, Pong
 
 
-_ONE_DAY_IN_SECONDS = 60 * 60 * 24
+# seconds for in-flight RPCs to finish when server stops
+STOP_GRACE_SECONDS = 5
+# worker processes of pre-fork mode listen on the same port
+SERVER_OPTIONS = [('grpc.so_reuseport', 1)]
 request_info = threading.local()
 exc_info_format = '{}.{}[{:.3f}][{}][{}]'
+# max number of characters of request message in log
+PAYLOAD_MAX_LENGTH = int(APP_CONFIG.get('logger', {}).get('payload_max_length', 2048))
+# max number of RPCs received but not yet handled by asyncio server
+MAX_PENDING_RPCS = 100000
+# modules of async drivers with task-local sessions
+ASYNC_DB_DRIVERS = ('{{ app_name }}.driver.aio_mysql', '{{ app_name }}.driver.aio_postgre')
+
+
+class LazyPayload(object):
+    """Request message rendered in json only when logged, truncated to `PAYLOAD_MAX_LENGTH`"""
+    __slots__ = ('msg', 'text')
+
+    def __init__(self, msg):
+        self.msg = msg
+        self.text = None
+
+    def __str__(self):
+        if self.text is None:
+            try:
+                text = json.dumps(pb2dict(self.msg))
+            except Exception as e:
+                text = '<{} not serializable: {}>'.format(type(self.msg).__name__, e)
+            if len(text) > PAYLOAD_MAX_LENGTH:
+                text = '{}...<{} characters>'.format(text[:PAYLOAD_MAX_LENGTH], len(text))
+            self.text = text
+        return self.text
+
+
+def log_error(cls, func, e: Exception, seconds: float, msg: LazyPayload, ctx):
+    """Log error of request, map service errors to gRPC status
+
+    Returns:
+        `Null` message for service errors, None for others which should be raised
+    """
+    if isinstance(e, BaseError):
+        # service raised error
+        e_msg = e.jsonify()
+    elif isinstance(e, NotImplementedError):
+        e_msg = GRPC_API_UNDEFINED.jsonify()
+    else:
+        # other error
+        e_msg = e
+    exc_info = exc_info_format.format(cls.__name__, func.__name__, seconds, msg, e_msg)
+    request_info.data = exc_info
+    logger.error(exc_info)
+    if sentry_cli:
+        sentry_cli.captureException()
+    if e_msg is e:
+        return None
+    ctx.set_code(grpc.StatusCode.INTERNAL)
+    ctx.set_details(e_msg)
+    return Null()
+
+
+def log_success(cls, func, seconds: float, msg: LazyPayload) -> None:
+    exc_info = exc_info_format.format(cls.__name__, func.__name__, seconds, '', '')
+    request_info.data = exc_info
+    logger.info(exc_info)
+    # handlers drop DEBUG records before formatting, the payload is rendered only if one outputs them
+    logger.debug('%s.%s payload %s', cls.__name__, func.__name__, msg)
+
+
+def close_sessions() -> None:
+    """Close thread-local DB sessions"""
+    if 'mysql' in APP_CONFIG:
+        from {{ app_name }}.driver.mysql import session as MySQLSession
+        MySQLSession.close()
+    if 'postgre' in APP_CONFIG:
+        from {{ app_name }}.driver.postgre import session as PostgreSession
+        PostgreSession.close()
+    if 'sqlite' in APP_CONFIG:
+        from {{ app_name }}.driver.sqlite import session as SqliteSession
+        SqliteSession.close()
+
+
+async def close_async_sessions() -> None:
+    """Close task-local DB sessions of async drivers in use"""
+    for name in ASYNC_DB_DRIVERS:
+        driver = sys.modules.get(name)
+        if driver is not None:
+            await driver.session.remove()
 
 
 def grpc_wrapper(cls):
-    """Wrap errors and finalize DB sessions"""
+    """Wrap errors and finalize DB sessions
+
+    Coroutine methods are wrapped in coroutines, to be served by asyncio server. They should use
+    async drivers, sessions of which are closed after each request.
+    """
 
     def request_wrapper(func):
         @functools.wraps(func)
         def wrapper(req, ctx):
             st = time.time()
-            msg = json.dumps(pb2dict(req))
+            # serialized only when logged with error or debug level
+            msg = LazyPayload(req)
             try:
                 res = func(req, ctx)
             except Exception as e:
                 # handle exception
-                et = time.time()
-                if isinstance(e, BaseError):
-                    # service raised error
-                    e_msg = e.jsonify()
-                    exc_info = exc_info_format.format(cls.__name__, func.__name__, et - st, msg, e_msg)
-                    request_info.data = exc_info
-                    logger.error(exc_info)
-                    if sentry_cli:
-                        sentry_cli.captureException()
-                    ctx.set_code(grpc.StatusCode.INTERNAL)
-                    ctx.set_details(e_msg)
-                    return Null()
-                elif isinstance(e, NotImplementedError):
-                    e_msg = GRPC_API_UNDEFINED.jsonify()
-                    exc_info = exc_info_format.format(cls.__name__, func.__name__, et - st, msg, e_msg)
-                    request_info.data = exc_info
-                    logger.error(exc_info)
-                    if sentry_cli:
-                        sentry_cli.captureException()
-                    ctx.set_code(grpc.StatusCode.INTERNAL)
-                    ctx.set_details(e_msg)
-                    return Null()
-                else:
-                    # other error
-                    exc_info = exc_info_format.format(cls.__name__, func.__name__, et - st, msg, e)
-                    request_info.data = exc_info
-                    logger.error(exc_info)
-                    if sentry_cli:
-                        sentry_cli.captureException()
+                res = log_error(cls, func, e, time.time() - st, msg, ctx)
+                if res is None:
                     raise
+                return res
             else:
-                et = time.time()
-                exc_info = exc_info_format.format(cls.__name__, func.__name__, et -  st, '', '')
-                request_info.data = exc_info
-                logger.info(exc_info)
+                log_success(cls, func, time.time() - st, msg)
+            finally:
+                close_sessions()
+
+            return res
 
+        @functools.wraps(func)
+        async def async_wrapper(req, ctx):
+            st = time.time()
+            msg = LazyPayload(req)
+            try:
+                res = await func(req, ctx)
+            except Exception as e:
+                res = log_error(cls, func, e, time.time() - st, msg, ctx)
+                if res is None:
+                    raise
+                return res
+            else:
+                log_success(cls, func, time.time() - st, msg)
             finally:
-                if 'mysql' in APP_CONFIG:
-                    from {{ app_name }}.driver.mysql import session as MySQLSession
-                    MySQLSession.close()
-                if 'postgre' in APP_CONFIG:
-                    from {{ app_name }}.driver.postgre import session as PostgreSession
-                    PostgreSession.close()
-                if 'sqlite' in APP_CONFIG:
-                    from {{ app_name }}.driver.sqlite import session as SqliteSession
-                    SqliteSession.close()
+                await close_async_sessions()
 
             return res
 
+        if inspect.iscoroutinefunction(func):
+            return async_wrapper
         return wrapper
 
     class ClassWrapper(object):
@@ -132,33 +206,91 @@ class {{ app_name }}GRPCServer(*api_mixins):
         return Pong(pong='pong from {{ app_name }}')
 
 
-def run(host: str, port: int, max_worker: int, key_path: str=None, cert_path: str=None) -> None:
+def add_port(srv, host: str, port: int, key_path: str=None, cert_path: str=None) -> str:
+    """Listen on port with SSL channel if key and certificate are given
+
+    Returns:
+        wording of channel type
+    """
+    if key_path and cert_path:
+        with open(key_path) as key_file:
+            with open(cert_path) as certificate_file:
+                credentials = grpc.ssl_server_credentials(
+                    [(key_file.read(), certificate_file.read())])
+        srv.add_secure_port('{}:{}'.format(host, port), credentials)
+        return 'with SSL channel'
+    srv.add_insecure_port('{}:{}'.format(host, port))
+    return 'with insecure channel'
+
+
+def async_handlers() -> list:
+    """Names of coroutine handlers defined in API classes"""
+    return sorted(name for api in api_mixins for name, v in vars(api).items() if inspect.iscoroutinefunction(v))
+
+
+def run(host: str, port: int, max_worker: int, key_path: str=None, cert_path: str=None,
+        use_asyncio: bool=False, max_concurrent_rpcs: int=0) -> None:
     """
     Args:
         host (str): hostname
         port (int): port
-        max_worker (int): number of workers
+        max_worker (int): number of workers, serving synchronous handlers only with asyncio server
         key_path (str): optional absolute path of ssl key file for https setting
         cert_path (str): optional absolute path of certificate file for https setting
+        use_asyncio (bool): serve with asyncio server, required by coroutine handlers
+        max_concurrent_rpcs (int): max number of in-flight RPCs of asyncio server, 0 for unlimited
+
+    Raises:
+        RuntimeError: coroutine handlers defined without asyncio server
     """
-    srv = grpc.server(futures.ThreadPoolExecutor(max_workers=max_worker))
+    if use_asyncio:
+        asyncio.run(serve_async(host, port, max_worker, key_path, cert_path, max_concurrent_rpcs))
+        return
+    handlers = async_handlers()
+    if handlers:
+        raise RuntimeError('Coroutine handlers {} require asyncio server'.format(', '.join(handlers)))
+    srv = grpc.server(futures.ThreadPoolExecutor(max_workers=max_worker), options=SERVER_OPTIONS)
     {{ app_name }}_pb2_grpc.add_{{ app_name }}Servicer_to_server({{ app_name }}GRPCServer(), srv)
-    wording = 'with insecure channel'
-    if key_path and cert_path:
-        with open(key_path) as key_file:
-            with open(cert_path) as certificate_file:
-                credentials = grpc.ssl_server_credentials(
-                    [(key_file.read(), certificate_file.read())])
-        srv.add_secure_port('{}:{}'.format(host, port), credentials)
-        wording = 'with SSL channel'
-    else:
-        srv.add_insecure_port('{}:{}'.format(host, port))
+    wording = add_port(srv, host, port, key_path, cert_path)
     srv.start()
     logger.info('{{ app_name }} GRPC server %s started on %i with %i workers!' % (wording, port, max_worker))
-    try:
-        while 1:
-            time.sleep(_ONE_DAY_IN_SECONDS)
-    except KeyboardInterrupt:
-        srv.stop(0)
-        logger.info('{{ app_name }} GRPC server stopped')
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stopping.set())
+    stopping.wait()
+    srv.stop(STOP_GRACE_SECONDS).wait()
+    logger.info('{{ app_name }} GRPC server stopped')
+
+
+async def serve_async(host: str, port: int, max_worker: int, key_path: str=None, cert_path: str=None,
+                      max_concurrent_rpcs: int=0) -> None:
+    """Serve with grpc.aio server until SIGINT or SIGTERM
+
+    Coroutine handlers run on event loop, synchronous handlers run in a pool of `max_worker` threads.
+    """
+    srv = grpc.aio.server(
+        migration_thread_pool=futures.ThreadPoolExecutor(max_workers=max_worker),
+        maximum_concurrent_rpcs=max_concurrent_rpcs or None,
+        # grpc core cancels calls beyond 1000 not yet picked up by event loop
+        options=SERVER_OPTIONS + [
+            ('grpc.server.max_pending_requests', MAX_PENDING_RPCS),
+            ('grpc.server.max_pending_requests_hard_limit', MAX_PENDING_RPCS),
+        ],
+    )
+    {{ app_name }}_pb2_grpc.add_{{ app_name }}Servicer_to_server({{ app_name }}GRPCServer(), srv)
+    wording = add_port(srv, host, port, key_path, cert_path)
+    await srv.start()
+    logger.info('{{ app_name }} GRPC asyncio server %s started on %i with %i workers!' % (wording, port, max_worker))
+
+    loop = asyncio.get_running_loop()
+    stopping = []
+
+    def stop():
+        # keep reference of task until server stops
+        if not stopping:
+            stopping.append(loop.create_task(srv.stop(STOP_GRACE_SECONDS)))
 
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop)
+    await srv.wait_for_termination()
+    logger.info('{{ app_name }} GRPC server stopped')
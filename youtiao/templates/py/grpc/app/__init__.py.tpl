@@ -27,7 +27,7 @@ else:
 if not CONFIG_PATH.is_file():
     raise FileNotFoundError
 with CONFIG_PATH.open() as f:
-    APP_CONFIG = yaml.load(f)
+    APP_CONFIG = yaml.safe_load(f)
 
 # reload config by environment variables
 if os.environ.get('{{ app_name | upper }}_APP_HOST'):
@@ -36,6 +36,12 @@ if os.environ.get('{{ app_name | upper }}_APP_PORT'):
     APP_CONFIG['app']['port'] = os.environ.get('{{ app_name | upper }}_APP_PORT')
 if os.environ.get('{{ app_name | upper }}_APP_MAX_WORKER'):
     APP_CONFIG['app']['max_worker'] = int(os.environ.get('{{ app_name | upper }}_APP_MAX_WORKER'))
+if os.environ.get('{{ app_name | upper }}_APP_ASYNCIO'):
+    APP_CONFIG['app']['asyncio'] = os.environ.get('{{ app_name | upper }}_APP_ASYNCIO').lower() in ('1', 'true', 'yes')
+if os.environ.get('{{ app_name | upper }}_APP_PROCESSES'):
+    APP_CONFIG['app']['processes'] = int(os.environ.get('{{ app_name | upper }}_APP_PROCESSES'))
+if os.environ.get('{{ app_name | upper }}_APP_MAX_CONCURRENT_RPCS'):
+    APP_CONFIG['app']['max_concurrent_rpcs'] = int(os.environ.get('{{ app_name | upper }}_APP_MAX_CONCURRENT_RPCS'))
 if os.environ.get('{{ app_name | upper }}_DATA_CENTER'):
     APP_CONFIG['data_center'] = int(os.environ.get('{{ app_name | upper }}_DATA_CENTER'))
 if os.environ.get('{{ app_name | upper }}_SENTRY_DSN'):
@@ -72,6 +78,8 @@ if os.environ.get('{{ app_name | upper }}_REDIS_PORT'):
     APP_CONFIG['redis']['port'] = os.environ.get('{{ app_name | upper }}_REDIS_PORT')
 if os.environ.get('{{ app_name | upper }}_REDIS_DB'):
     APP_CONFIG['redis']['database'] = os.environ.get('{{ app_name | upper }}_REDIS_DB')
+if os.environ.get('{{ app_name | upper }}_REDIS_MAX_CONNECTIONS'):
+    APP_CONFIG['redis']['max_connections'] = int(os.environ.get('{{ app_name | upper }}_REDIS_MAX_CONNECTIONS'))
 if os.environ.get('{{ app_name | upper }}_SQLITE_USER'):
     APP_CONFIG['sqlite']['user'] = os.environ.get('{{ app_name | upper }}_SQLITE_USER')
 if os.environ.get('{{ app_name | upper }}_SQLITE_PASSWORD'):
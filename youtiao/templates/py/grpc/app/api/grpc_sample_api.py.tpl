@@ -15,4 +15,10 @@ class SampleAPI(GrpcAPI):
     # rpc HelloWorld(<message type>) returns (<return message type>);
     # def HelloWorld(self, req, ctx):
     #     return HelloWorldMessage(wording="hello world!")
+    #
+    # API can also be a coroutine when served with asyncio server (`app.asyncio` config),
+    # using async drivers such as `driver.aio_redis`:
+    # async def HelloWorld(self, req, ctx):
+    #     wording = await redis_cli.get('wording')
+    #     return HelloWorldMessage(wording=wording)
 
@@ -1,6 +1,7 @@
 # -*- coding: utf8 -*-
 
 import functools
+import os
 
 from threading import local
 from sqlalchemy import create_engine
@@ -73,6 +74,18 @@ def db_commit_required(func_):
     return wrapper
 
 
+def make_dsn(scheme: str, user: str, password: str, host: str,
+             port: int, database: str, charset: str='') -> str:
+    """DB URL of SQLAlchemy engine"""
+    default_url = ("{scheme}://{user}:{password}"
+                   "@{host}:{port}/{database}")
+    dsn = default_url.format(scheme=scheme, user=user, password=password,
+                             host=host, port=int(port), database=database)
+    if charset:
+        dsn += '?charset={}'.format(charset)
+    return dsn
+
+
 def make_engine(scheme: str, user: str, password: str, host: str,
                 port: int, database: str, charset: str=''):
     """DB Engine Factory
@@ -95,13 +108,24 @@ def make_engine(scheme: str, user: str, password: str, host: str,
     Returns:
         SQLAlchemy DB engine
     """
-    default_url = ("{scheme}://{user}:{password}"
-                   "@{host}:{port}/{database}")
-    dsn = default_url.format(scheme=scheme, user=user, password=password,
-                             host=host, port=int(port), database=database)
-    if charset:
-        dsn += '?charset={}'.format(charset)
-    return create_engine(dsn, pool_size=10, max_overflow=-1, pool_recycle=1200)
+    dsn = make_dsn(scheme, user, password, host, port, database, charset)
+    engine = create_engine(dsn, pool_size=10, max_overflow=-1, pool_recycle=1200)
+    reset_pool_after_fork(engine)
+    return engine
+
+
+def reset_pool_after_fork(engine) -> None:
+    """Forked process opens its own connections
+
+    Connections inherited from parent process are dropped without being closed, which would close them
+    for parent too.
+
+    Args:
+        engine (object): SQLAlchemy DB engine
+    """
+    def reset_pool():
+        engine.pool = engine.pool.recreate()
+    os.register_at_fork(after_in_child=reset_pool)
 
 
 def make_session(engine):
@@ -0,0 +1,91 @@
+# -*- coding: utf8 -*-
+"""Async DB drivers for coroutine handlers of asyncio server
+
+Requires SQLAlchemy[asyncio]>=1.4 and async DBAPI of database, e.g. aiomysql or asyncpg.
+"""
+
+import functools
+from asyncio import current_task
+from contextvars import ContextVar
+
+from sqlalchemy.ext.asyncio import (
+    AsyncSession,
+    async_scoped_session,
+    create_async_engine,
+)
+from sqlalchemy.orm import sessionmaker
+
+from {{ app_name }}.driver import make_dsn, reset_pool_after_fork
+
+
+# whether a db commit is registered by outer coroutine of current task
+db_commit_registered = ContextVar('db_commit_registered', default=False)
+
+
+def gen_async_commit_deco(db_session):
+    """Session Commit Decorator Factory of coroutines
+
+    Only the outermost decorated coroutine commits, inner ones flush.
+    """
+    def wrap(func_):
+        @functools.wraps(func_)
+        async def wrapper(*args, **kwargs):
+            if db_commit_registered.get():
+                result = await func_(*args, **kwargs)
+                await db_session.flush()
+                return result
+            token = db_commit_registered.set(True)
+            try:
+                result = await func_(*args, **kwargs)
+                await db_session.commit()
+            except Exception:
+                await db_session.rollback()
+                raise
+            finally:
+                db_commit_registered.reset(token)
+            return result
+        return wrapper
+
+    return wrap
+
+
+def make_async_engine(scheme: str, user: str, password: str, host: str,
+                      port: int, database: str, charset: str=''):
+    """Async DB Engine Factory
+
+    Args:
+        schema (str): database system plus async db driver name
+        user (str): db login username
+        password (str): db login password
+        host (str): db host
+        port (int): db port
+        database (str): db namespace
+        charset (str): charset for db session connection
+
+    Returns:
+        SQLAlchemy async DB engine
+    """
+    dsn = make_dsn(scheme, user, password, host, port, database, charset)
+    engine = create_async_engine(dsn, pool_size=10, max_overflow=-1, pool_recycle=1200)
+    reset_pool_after_fork(engine.sync_engine)
+    return engine
+
+
+def make_async_session(engine):
+    """Async DB Session Factory
+    Make task-local session, each RPC of asyncio server runs in its own task.
+
+    Args:
+        engine (object): SQLAlchemy async DB engine
+    Returns:
+        SQLAlchemy async scoped session
+    """
+    return async_scoped_session(
+        sessionmaker(
+            class_=AsyncSession,
+            expire_on_commit=False,
+            autoflush=False,
+            bind=engine,
+        ),
+        scopefunc=current_task,
+    )
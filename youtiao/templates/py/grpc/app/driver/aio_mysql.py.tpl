@@ -0,0 +1,28 @@
+# -*- coding: utf8 -*-
+
+from {{ app_name }}.driver.aio import (
+    make_async_engine,
+    make_async_session,
+    gen_async_commit_deco,
+)
+from {{ app_name }} import APP_CONFIG
+
+
+try:
+    MYSQL_CONFIG = APP_CONFIG['mysql']
+except KeyError:
+    raise KeyError('MySQL config not found')
+try:
+    mysql_user = MYSQL_CONFIG['user']
+    mysql_password = MYSQL_CONFIG['password']
+    mysql_host = MYSQL_CONFIG['host']
+    mysql_port = int(MYSQL_CONFIG['port'])
+    mysql_database = MYSQL_CONFIG['database']
+except KeyError:
+    raise KeyError('MySQL config wrong')
+
+db_scheme = 'mysql+aiomysql'
+engine = make_async_engine(db_scheme, mysql_user, mysql_password, mysql_host, mysql_port, mysql_database, 'utf8')
+session = make_async_session(engine)
+# DB commit decorator of coroutines
+db_commit = gen_async_commit_deco(session)
@@ -0,0 +1,27 @@
+# -*- coding: utf8 -*-
+
+from {{ app_name }}.driver.aio import (
+    make_async_engine,
+    make_async_session,
+    gen_async_commit_deco,
+)
+from {{ app_name }} import APP_CONFIG
+
+try:
+    POSTGRE_CONFIG = APP_CONFIG['postgre']
+except KeyError:
+    raise KeyError('PostgreSQL config not found')
+try:
+    pg_user = POSTGRE_CONFIG['user']
+    pg_password = POSTGRE_CONFIG['password']
+    pg_host = POSTGRE_CONFIG['host']
+    pg_port = int(POSTGRE_CONFIG['port'])
+    pg_database = POSTGRE_CONFIG['database']
+except KeyError:
+    raise KeyError('PostgreSQL config not found')
+
+db_scheme = 'postgresql+asyncpg'
+engine = make_async_engine(db_scheme, pg_user, pg_password, pg_host, pg_port, pg_database)
+session = make_async_session(engine)
+# DB commit decorator of coroutines
+db_commit = gen_async_commit_deco(session)
@@ -0,0 +1,27 @@
+# -*- coding: utf8 -*-
+"""Async redis client for coroutine handlers on a sized connection pool, requires redis>=4.2"""
+
+from {{ app_name }} import APP_CONFIG
+from {{ app_name }} import logger
+
+
+try:
+    REDIS_CONFIG = APP_CONFIG['redis']
+    redis_config = {}
+    redis_config['host'] = REDIS_CONFIG.get('host', '')
+    redis_config['port'] = int(REDIS_CONFIG.get('port', 0))
+    redis_config['db'] = int(REDIS_CONFIG.get('database', 0))
+    if REDIS_CONFIG.get('password'):
+        redis_config['password'] = REDIS_CONFIG['password']
+    redis_config['max_connections'] = int(REDIS_CONFIG.get('max_connections') or 50)
+    redis_config['timeout'] = float(REDIS_CONFIG.get('pool_timeout') or 5)
+    redis_config['socket_timeout'] = float(REDIS_CONFIG.get('socket_timeout') or 5)
+    redis_config['socket_connect_timeout'] = float(REDIS_CONFIG.get('socket_timeout') or 5)
+
+    from redis.asyncio import BlockingConnectionPool, StrictRedis
+    redis_pool = BlockingConnectionPool(**redis_config)
+    redis_cli = StrictRedis(connection_pool=redis_pool)
+except KeyError:
+    logger.error('Redis config not found. Use in-memory fake redis instead.')
+    from fakeredis.aioredis import FakeRedis
+    redis_cli = FakeRedis()
@@ -1,13 +1,14 @@
 # -*- coding: utf8 -*-
 
+import functools
 import re
 import sys
+import threading
 from sys import _getframe as gf
 from importlib import import_module
 from six import reraise
 from uuid import uuid4
 from datetime import datetime
-from typing import Mapping, Iterable
 
 import pytz
 from google.protobuf.message import Message as PbMessage
@@ -35,16 +36,23 @@ def get_current_info():
 class Singleton(type):
     """
     Usage:
-    class Foo(BaseFoo):
-        __metaclass__ = Singleton
+    class Foo(BaseFoo, metaclass=Singleton):
+        pass
     """
     _instances = {}
+    _lock = threading.Lock()
 
     def __call__(cls, *args, **kwargs):
         if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
+            with Singleton._lock:
+                if cls not in cls._instances:
+                    cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
         return cls._instances[cls]
 
+    def clear_instance(cls):
+        """Drop instance, the next call creates a new one"""
+        cls._instances.pop(cls, None)
+
 
 def import_string(dotted_path):
     """
@@ -107,21 +115,91 @@ def epoch2dt(epoch, tz=LOCAL_TZ):  # type: (float, tzinfo) -> datetime
     return datetime.fromtimestamp(epoch).replace(tzinfo=tz)
 
 
-def pb2dict(msg):
-    """Transform GRPC message to dict"""
-    if not isinstance(msg, PbMessage):
-        raise TypeError('Not a Protobuf message')
-    rtn = {}
-    for f in msg.DESCRIPTOR.fields:
-        v = getattr(msg, f.name)
-        if isinstance(v, PbMessage):
-            rtn[f.name] = pb2dict(v)
-        elif isinstance(v, Mapping):
-            rtn[f.name] = dict((k, pb2dict(v)) for k, v in v.items())
-        elif isinstance(v, Iterable) and not isinstance(v, str):
-            rtn[f.name] = [pb2dict(el) for el in v]
+# conversion plans of message types, keyed by descriptor
+_PB2DICT_PLANS = {}
+
+
+def _repeated(field) -> bool:
+    # `label` of field descriptor is removed since protobuf 7
+    is_repeated = getattr(field, 'is_repeated', None)
+    if is_repeated is None:
+        return field.label == field.LABEL_REPEATED
+    return is_repeated
+
+
+def _reaches(descriptor, target, seen=None) -> bool:
+    """Check if message type `target` is reachable from `descriptor` through singular message fields"""
+    seen = seen if seen is not None else set()
+    for f in descriptor.fields:
+        sub = f.message_type
+        if sub is None or _repeated(f) or sub in seen:
+            continue
+        if sub is target:
+            return True
+        seen.add(sub)
+        if _reaches(sub, target, seen):
+            return True
+    return False
+
+
+def _pb2dict_plan(descriptor):
+    """Compile conversion plan of message type once
+
+    Returns:
+        list of field name, converter of field value (None for scalar) and whether unset value is None
+    """
+    plan = _PB2DICT_PLANS.get(descriptor)
+    if plan is not None:
+        return plan
+    plan = []
+    for f in descriptor.fields:
+        sub = f.message_type
+        optional = False
+        if sub is None:
+            convert = list if _repeated(f) else None
+        elif sub.GetOptions().map_entry:
+            value_type = sub.fields_by_name['value'].message_type
+            if value_type is None:
+                convert = dict
+            else:
+                convert = functools.partial(_convert_map, descriptor=value_type)
+        elif _repeated(f):
+            convert = functools.partial(_convert_list, descriptor=sub)
         else:
-            rtn[f.name] = v
+            convert = functools.partial(_convert, descriptor=sub)
+            # unset field of recursive type would be converted endlessly
+            optional = _reaches(sub, sub)
+        plan.append((f.name, convert, optional))
+    _PB2DICT_PLANS[descriptor] = plan
+    return plan
+
 
+def _convert(msg, descriptor):
+    rtn = {}
+    for name, convert, optional in _PB2DICT_PLANS.get(descriptor) or _pb2dict_plan(descriptor):
+        if convert is None:
+            rtn[name] = getattr(msg, name)
+        elif optional and not msg.HasField(name):
+            rtn[name] = None
+        else:
+            rtn[name] = convert(getattr(msg, name))
     return rtn
 
+
+def _convert_list(values, descriptor):
+    return [_convert(v, descriptor) for v in values]
+
+
+def _convert_map(values, descriptor):
+    return {k: _convert(v, descriptor) for k, v in values.items()}
+
+
+def pb2dict(msg):
+    """Transform GRPC message to dict
+
+    Fields are converted by a plan compiled once per message type. Unset message fields are
+    converted with default values, except fields of recursive types which are None.
+    """
+    if not isinstance(msg, PbMessage):
+        raise TypeError('Not a Protobuf message')
+    return _convert(msg, msg.DESCRIPTOR)
@@ -0,0 +1,338 @@
+# -*- coding: utf8 -*-
+"""Read-through cache of function results on redis, with an optional in-process LRU tier in front of it
+
+Usage:
+    @cached(ttl=300)
+    def get_user(user_id):
+        ...
+
+    get_user.invalidate(user_id)
+
+Only one caller refills an expired key at a time: other callers of the process wait for its result, other
+processes wait for the value while one of them holds a lock of the key on redis.
+Redis errors are logged and the function is called without cache.
+"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple, Union
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+
+from {{ app_name }} import APP_NAME, logger
+from {{ app_name }}.driver.Redis import redis_cli
+
+
+SERIALIZERS = {
+    'json': (lambda value: json.dumps(value, separators=(',', ':')).encode(), json.loads),
+    'pickle': (functools.partial(pickle.dumps, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads),
+}
+MAX_KEY_LENGTH = 128  # longer arguments part of key is hashed
+POLL_INTERVAL = 0.01  # seconds between polls of a key refilled by another process
+UNAVAILABLE = object()  # result of redis commands failed with errors
+RELEASE_LOCK_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+
+
+class LRUCache(object):
+    """Thread safe in-process LRU cache of serialized values with TTL"""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class _Flight(object):
+    """Refill of a key in progress, waited for by other callers of the process"""
+
+    def __init__(self, done):
+        self.done = done
+        self.raw = None
+        self.error = None
+
+
+class Cache(object):
+    """Read-through cache of a function, see `cached`"""
+
+    def __init__(self, func: Callable, ttl: float, key: Callable=None, key_prefix: str=None,
+                 serializer: Union[str, Tuple[Callable, Callable]]='json', jitter: float=0.1,
+                 lock_timeout: float=10, local_size: int=0, local_ttl: float=5, cli=None):
+        self.func = func
+        self.ttl = ttl
+        self.key = key
+        self.key_prefix = key_prefix or '{}:cache:{}.{}'.format(APP_NAME, func.__module__, func.__qualname__)
+        self.dumps, self.loads = SERIALIZERS[serializer] if isinstance(serializer, str) else serializer
+        self.jitter = jitter
+        self.lock_timeout = lock_timeout
+        self.local = LRUCache(local_size, min(local_ttl, ttl)) if local_size > 0 else None
+        params = list(inspect.signature(func).parameters)
+        self.skip_self = bool(params) and params[0] in ('self', 'cls')
+        self.is_coroutine = asyncio.iscoroutinefunction(func)
+        if cli is None and self.is_coroutine:
+            from {{ app_name }}.driver.aio_redis import redis_cli as cli
+        self.cli = cli or redis_cli
+        self._release_lock = self.cli.register_script(RELEASE_LOCK_SCRIPT)
+        # refills in progress by key
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    def make_key(self, *args, **kwargs) -> str:
+        """Redis key of call, from `key` function if given, otherwise from repr of arguments"""
+        if self.key is not None:
+            part = str(self.key(*args, **kwargs))
+        else:
+            args = args[1:] if self.skip_self else args
+            part = ','.join([repr(arg) for arg in args] + ['{}={!r}'.format(*item) for item in sorted(kwargs.items())])
+        if len(part) > MAX_KEY_LENGTH:
+            part = hashlib.sha1(part.encode()).hexdigest()
+        return '{}:{}'.format(self.key_prefix, part)
+
+    def _expire_ms(self) -> int:
+        # spread expiry of keys filled at the same time
+        return int(self.ttl * (1 + random.uniform(0, self.jitter)) * 1000)
+
+    def _keep_local(self, key: str, raw: bytes) -> None:
+        if self.local:
+            self.local.set(key, raw)
+
+    def get(self, *args, **kwargs):
+        key = self.make_key(*args, **kwargs)
+        raw = self.local.get(key) if self.local else None
+        if raw is None:
+            raw = self._redis_call('get', key)
+            if raw is UNAVAILABLE:
+                return self.func(*args, **kwargs)
+            if raw is None:
+                return self._fill(key, args, kwargs)
+            self._keep_local(key, raw)
+        return self.loads(raw)
+
+    def _fill(self, key: str, args, kwargs):
+        """Refill key once for all threads of the process, the others wait for its result"""
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight(threading.Event())
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return self.loads(flight.raw)
+        try:
+            value, flight.raw = self._refill(key, args, kwargs)
+            return value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _refill(self, key: str, args, kwargs) -> Tuple[object, bytes]:
+        """Call function and cache its result, unless another process refills key in time
+
+        Returns:
+            result and its serialized value
+        """
+        lock_key, token = key + ':lock', uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        locked = self._redis_call('set', lock_key, token, nx=True, px=int(self.lock_timeout * 1000))
+        while locked is False and time.monotonic() < deadline:
+            # wait for value of another process, or take over its lock once released
+            time.sleep(POLL_INTERVAL)
+            raw = self._redis_call('get', key)
+            if raw is UNAVAILABLE:
+                locked = UNAVAILABLE
+            elif raw is not None:
+                self._keep_local(key, raw)
+                return self.loads(raw), raw
+            else:
+                locked = self._redis_call('set', lock_key, token, nx=True, px=int(self.lock_timeout * 1000))
+        try:
+            value = self.func(*args, **kwargs)
+            raw = self.dumps(value)
+            if locked is not UNAVAILABLE:
+                self._redis_call('set', key, raw, px=self._expire_ms())
+            self._keep_local(key, raw)
+            return value, raw
+        finally:
+            if locked is True:
+                self._redis_call(self._release_lock, keys=[lock_key], args=[token])
+
+    def _redis_call(self, command: Union[str, Callable], *args, **kwargs):
+        """Redis command, returns `UNAVAILABLE` on errors"""
+        try:
+            if isinstance(command, str):
+                command = getattr(self.cli, command)
+            rtn = command(*args, **kwargs)
+            # redis-py returns None instead of False for SET NX of taken key
+            return bool(rtn) if kwargs.get('nx') else rtn
+        except RedisError as e:
+            logger.warning('Cache of %s unavailable: %s', self.key_prefix, e)
+            return UNAVAILABLE
+
+    async def get_async(self, *args, **kwargs):
+        key = self.make_key(*args, **kwargs)
+        raw = self.local.get(key) if self.local else None
+        if raw is None:
+            raw = await self._redis_call_async('get', key)
+            if raw is UNAVAILABLE:
+                return await self.func(*args, **kwargs)
+            if raw is None:
+                return await self._fill_async(key, args, kwargs)
+            self._keep_local(key, raw)
+        return self.loads(raw)
+
+    async def _fill_async(self, key: str, args, kwargs):
+        # tasks of the event loop thread need no lock
+        flight = self._flights.get(key)
+        if flight is not None:
+            await flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return self.loads(flight.raw)
+        flight = self._flights[key] = _Flight(asyncio.Event())
+        try:
+            value, flight.raw = await self._refill_async(key, args, kwargs)
+            return value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            del self._flights[key]
+            flight.done.set()
+
+    async def _refill_async(self, key: str, args, kwargs) -> Tuple[object, bytes]:
+        lock_key, token = key + ':lock', uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        locked = await self._redis_call_async('set', lock_key, token, nx=True, px=int(self.lock_timeout * 1000))
+        while locked is False and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            raw = await self._redis_call_async('get', key)
+            if raw is UNAVAILABLE:
+                locked = UNAVAILABLE
+            elif raw is not None:
+                self._keep_local(key, raw)
+                return self.loads(raw), raw
+            else:
+                locked = await self._redis_call_async('set', lock_key, token, nx=True,
+                                                      px=int(self.lock_timeout * 1000))
+        try:
+            value = await self.func(*args, **kwargs)
+            raw = self.dumps(value)
+            if locked is not UNAVAILABLE:
+                await self._redis_call_async('set', key, raw, px=self._expire_ms())
+            self._keep_local(key, raw)
+            return value, raw
+        finally:
+            if locked is True:
+                await self._redis_call_async(self._release_lock, keys=[lock_key], args=[token])
+
+    async def _redis_call_async(self, command: Union[str, Callable], *args, **kwargs):
+        try:
+            if isinstance(command, str):
+                command = getattr(self.cli, command)
+            rtn = await command(*args, **kwargs)
+            return bool(rtn) if kwargs.get('nx') else rtn
+        except RedisError as e:
+            logger.warning('Cache of %s unavailable: %s', self.key_prefix, e)
+            return UNAVAILABLE
+
+    def invalidate(self, *args, **kwargs):
+        """Delete cached result of call, returns awaitable for coroutine functions
+
+        Note:
+            Local tiers of other processes keep the result for at most `local_ttl` seconds.
+        """
+        key = self.make_key(*args, **kwargs)
+        if self.local:
+            self.local.delete(key)
+        if self.is_coroutine:
+            return self._redis_call_async('delete', key)
+        return self._redis_call('delete', key)
+
+
+def cached(ttl: float, key: Callable=None, key_prefix: str=None,
+           serializer: Union[str, Tuple[Callable, Callable]]='json', jitter: float=0.1,
+           lock_timeout: float=10, local_size: int=0, local_ttl: float=5, cli=None):
+    """Read-through cache decorator of functions, methods and coroutine functions
+
+    Results are cached by arguments, so arguments of the default key need a stable repr. Handlers need
+    `key` as request and context change on each call:
+
+        @grpc_wrapper
+        class GreeterServicer(...):
+            @cached(ttl=60, key=lambda self, request, context: request.name, serializer='pickle')
+            def SayHello(self, request, context):
+                ...
+
+    Args:
+        ttl (float): seconds before cached result expires
+        key (callable): called with arguments of call, returns key part of call
+        key_prefix (str): prefix of keys, app name, module and name of function by default
+        serializer (str|tuple): 'json', 'pickle' or a pair of dumps and loads functions
+        jitter (float): max fraction of `ttl` added randomly, so that keys filled together expire apart
+        lock_timeout (float): seconds other processes wait for a refill before calling function themselves
+        local_size (int): max results in in-process LRU tier, 0 to disable it
+        local_ttl (float): seconds results kept in in-process LRU tier, at most `ttl`
+        cli (object): redis client, `driver.Redis.redis_cli` or `driver.aio_redis.redis_cli` for coroutines
+
+    Returns:
+        decorated function with `invalidate(*args, **kwargs)` and `cache_key(*args, **kwargs)`, called on
+        the class with instance as first argument for methods
+    """
+    def wrap(func):
+        cache = Cache(func, ttl, key, key_prefix, serializer, jitter, lock_timeout, local_size, local_ttl, cli)
+        if cache.is_coroutine:
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                return await cache.get_async(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return cache.get(*args, **kwargs)
+        wrapper.cache = cache
+        wrapper.invalidate = cache.invalidate
+        wrapper.cache_key = cache.make_key
+        return wrapper
+
+    return wrap
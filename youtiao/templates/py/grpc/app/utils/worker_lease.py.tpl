@@ -0,0 +1,187 @@
+# -*- coding: utf8 -*-
+"""Lease of worker ID on redis, claimed in one round trip and renewed by heartbeat
+
+Each worker ID in [0, max_id] is a key `<key_prefix>:<id>` holding the token of its holder with a TTL.
+On Redis Cluster, `key_prefix` needs a hash tag such as `{app:pid:0}`, so that keys of all IDs are in the
+slot of the claim script.
+"""
+
+import atexit
+import os
+import random
+import socket
+import threading
+from typing import Callable
+from uuid import uuid4
+
+from {{ app_name }} import logger
+
+
+REPLACE_RETRY_INTERVAL = 0.1  # first seconds between retries to replace a lost worker ID, doubled up to heartbeat
+# claim first free key, returns its index or -1 if all taken
+CLAIM_SCRIPT = '''
+for i, key in ipairs(KEYS) do
+    if redis.call('SET', key, ARGV[1], 'NX', 'PX', ARGV[2]) then
+        return i - 1
+    end
+end
+return -1
+'''
+# returns 1 if renewed, 2 if reclaimed after expiry, 0 if taken by another holder
+RENEW_SCRIPT = '''
+local holder = redis.call('GET', KEYS[1])
+if holder == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if not holder and redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 2
+end
+return 0
+'''
+RELEASE_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+
+
+class WorkerIdLease(object):
+    """Lease of a worker ID, renewed by a heartbeat thread until released
+
+    If another process takes the worker ID, the lease is marked `lost` and the heartbeat leases a new one at
+    once, passed to `on_change`. Failed replacements are retried with backoff until a new ID is leased.
+
+    Usage:
+        lease = WorkerIdLease(redis_cli, 'app:pid:0')
+        worker_id = lease.acquire()
+        ...
+        lease.release()  # also released at exit
+    """
+
+    def __init__(self, redis_cli, key_prefix: str, max_id: int=255, ttl: float=60, heartbeat: float=None,
+                 on_change: Callable[[int], None]=None):
+        """
+        Args:
+            redis_cli (object): redis client
+            key_prefix (str): prefix of keys of worker IDs
+            max_id (int): max worker ID
+            ttl (float): seconds before lease expires without renewal
+            heartbeat (float): seconds between renewals, a third of `ttl` by default
+            on_change (callable): called with new worker ID leased after the previous one was lost
+        """
+        self.redis_cli = redis_cli
+        self.key_prefix = key_prefix
+        self.max_id = max_id
+        self.ttl = ttl
+        self.heartbeat = heartbeat or ttl / 3
+        self.token = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid4().hex[:8])
+        self.on_change = on_change
+        self.worker_id = None
+        self.pid = None
+        # worker ID taken by another process, until a new one is leased
+        self.lost = False
+        self._claim = redis_cli.register_script(CLAIM_SCRIPT)
+        self._renew = redis_cli.register_script(RENEW_SCRIPT)
+        self._release = redis_cli.register_script(RELEASE_SCRIPT)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def key(self) -> str:
+        return self._key_of(self.worker_id)
+
+    def _key_of(self, worker_id: int) -> str:
+        return '{}:{}'.format(self.key_prefix, worker_id)
+
+    def _claim_id(self) -> int:
+        """Claim first free worker ID from a random one, returns -1 if all taken"""
+        start = random.randint(0, self.max_id)
+        ids = list(range(start, self.max_id + 1)) + list(range(start))
+        index = int(self._claim(keys=[self._key_of(i) for i in ids], args=[self.token, int(self.ttl * 1000)]))
+        return ids[index] if index >= 0 else -1
+
+    def acquire(self) -> int:
+        """Claim a free worker ID and start heartbeat
+
+        Raises:
+            RuntimeError: all worker IDs are taken
+        """
+        if self.worker_id is not None:
+            return self.worker_id
+        worker_id = self._claim_id()
+        if worker_id < 0:
+            raise RuntimeError('All {} worker IDs of {} are taken'.format(self.max_id + 1, self.key_prefix))
+        self.worker_id = worker_id
+        self.pid = os.getpid()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run_heartbeat, name='worker-id-lease', daemon=True)
+        self._thread.start()
+        atexit.register(self.release)
+        logger.info('Worker ID %i of %s leased', worker_id, self.key_prefix)
+        return worker_id
+
+    def renew(self) -> bool:
+        """Extend lease, reclaim worker ID if lease expired and it is still free
+
+        Returns:
+            whether worker ID is still held
+        """
+        rtn = int(self._renew(keys=[self.key], args=[self.token, int(self.ttl * 1000)]))
+        if rtn == 2:
+            logger.warning('Lease of worker ID %i expired and reclaimed', self.worker_id)
+        elif rtn == 0:
+            self.lost = True
+            logger.error('Lease of worker ID %i taken by another process', self.worker_id)
+        return rtn != 0
+
+    def _replace(self) -> bool:
+        """Lease a new worker ID in place of the lost one
+
+        Returns:
+            whether a new worker ID is leased
+        """
+        worker_id = self._claim_id()
+        if worker_id < 0:
+            logger.error('No free worker ID to replace lost worker ID %i', self.worker_id)
+            return False
+        lost_id, self.worker_id = self.worker_id, worker_id
+        # users switch to new worker ID before lease is usable again
+        if self.on_change is not None:
+            self.on_change(worker_id)
+        self.lost = False
+        logger.warning('Worker ID %i leased to replace lost worker ID %i', worker_id, lost_id)
+        return True
+
+    def _run_heartbeat(self) -> None:
+        interval, retries = self.heartbeat, 0
+        while not self._stopped.wait(interval):
+            try:
+                if not self.lost:
+                    self.renew()
+                # no ID can be generated while lease is lost, replaced without waiting for next heartbeat
+                if self.lost:
+                    self._replace()
+            except Exception as e:
+                # retried later, lease is kept if redis recovers within ttl
+                logger.error('Failed to renew lease of worker ID %i: %s', self.worker_id, e)
+            if self.lost:
+                interval = min(REPLACE_RETRY_INTERVAL * 2 ** retries, self.heartbeat)
+                retries += 1
+            else:
+                interval, retries = self.heartbeat, 0
+
+    def release(self) -> None:
+        """Stop heartbeat and free worker ID, no-op in processes forked from holder"""
+        if self.worker_id is None or os.getpid() != self.pid:
+            return
+        self._stopped.set()
+        try:
+            self._release(keys=[self.key], args=[self.token])
+        except Exception as e:
+            logger.error('Failed to release worker ID %i: %s', self.worker_id, e)
+        else:
+            logger.info('Worker ID %i of %s released', self.worker_id, self.key_prefix)
+        self.worker_id = None
+        atexit.unregister(self.release)
@@ -4,10 +4,14 @@ app:
     port: 8686
     max_worker: 5
     mode: grpc
+    asyncio: False  # serve with grpc.aio, required by coroutine handlers
+    max_concurrent_rpcs: 0  # max in-flight RPCs of asyncio server, 0 for unlimited
+    processes: 1  # worker processes sharing port with SO_REUSEPORT, pre-fork mode if more than 1
 logger:
     console:
         level: DEBUG
         format: "%(asctime)s %(levelname)-8s:%(name)s-%(message)s"
+    payload_max_length: 2048  # max characters of request message logged
 data_center: 0  # for snowflake ID generation
 sentry:
     enabled: False
@@ -30,6 +34,9 @@ redis:
     port: 6379
     password: ''
     database: 0
+    max_connections: 50  # size of connection pool
+    pool_timeout: 5  # seconds to wait for a free connection of pool
+    socket_timeout: 5  # seconds of connect and commands, keep above timeouts of blocking commands
 sqlite:
     user: root
     password: root
@@ -4,12 +4,15 @@ SQLAlchemy>=1.1.15
 psycopg2-binary>=2.7.4
 gevent>=1.2.2
 redis>=2.10.6
-fakeredis>=0.8.2
+fakeredis[lua]>=1.1.0
 six>=1.11.0
 pytz>=2017.2
-grpcio>=1.6.3
-grpcio-tools>=1.6.3
+grpcio>=1.32.0
+grpcio-tools>=1.32.0
 mysqlclient>=1.3.12
 Flask>=0.12.2
 Flask-Cors>=3.0.3
 flask-restplus>=0.10.1
+# optional async drivers of asyncio server, need SQLAlchemy[asyncio]>=1.4 and redis>=4.2
+# aiomysql>=0.1.1
+# asyncpg>=0.27.0
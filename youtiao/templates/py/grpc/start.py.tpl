@@ -8,7 +8,6 @@ sys.path.append(str(base_path))
 sys.path.append(os.path.dirname(base_path))
 sys.path.append(str(base_path.joinpath('proto')))
 
-from {{ app_name }}.Grpc import run
 from {{ app_name }} import APP_CONFIG
 
 app_config = APP_CONFIG.get('app')
@@ -17,6 +16,20 @@ port = int(app_config.get('port', 8686))
 max_worker = app_config.get('max_worker', 5)
 key_path = app_config.get('key_path')
 cert_path = app_config.get('cert_path')
+use_asyncio = bool(app_config.get('asyncio', False))
+max_concurrent_rpcs = int(app_config.get('max_concurrent_rpcs') or 0)
+processes = int(app_config.get('processes') or 1)
+
+
+def serve(index: int=0) -> None:
+    # imported in worker process, DB engines and snowflake worker ID are set up after fork
+    from {{ app_name }}.Grpc import run
+    run(host, port, max_worker, key_path, cert_path, use_asyncio, max_concurrent_rpcs)
+
 
 if __name__ == '__main__':
-    run(host, port, max_worker, key_path, cert_path)
+    if processes > 1:
+        from {{ app_name }}.utils.prefork import Supervisor
+        Supervisor(serve, processes).run()
+    else:
+        serve()
@@ -1,4 +1,4 @@
-FROM python:3.6
+FROM python:3.7
 COPY . /app/{{ app_name }}
 WORKDIR /app/{{ app_name }}
 RUN pip install -r requirements.txt -i https://mirrors.aliyun.com/pypi/simple/
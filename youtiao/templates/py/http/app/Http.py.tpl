@@ -4,6 +4,8 @@ import time
 import sys
 import os
 import re
+import signal
+import socket
 from enum import IntEnum
 from importlib import import_module
 
@@ -25,6 +27,9 @@ from flask_restplus import (
     Resource as RestplusResource,
 )
 from flask_restplus.utils import unpack
+import gevent
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIHandler, WSGIServer
 
 from {{ app_name }} import (
     APP_NAME,
@@ -38,6 +43,8 @@ app.wsgi_app = ProxyFix(app.wsgi_app)
 CORS(app, supports_credentials=True)
 
 API_DIR = os.path.join(os.path.dirname(__file__), 'api')
+# seconds for in-flight requests to finish when server stops
+STOP_GRACE_SECONDS = 5
 
 
 class HTTPStatus(IntEnum):
@@ -383,3 +390,66 @@ def init_api():
 
 init_api()
 
+
+class ConnectionHandler(WSGIHandler):
+    """Handle client connection without Nagle's algorithm
+
+    Keep-alive connections idle for `keepalive` seconds are closed, keep-alive is disabled if 0.
+    """
+    keepalive = 5
+
+    def handle(self):
+        # headers and body are sent separately, avoid delayed ACK on keep-alive connections
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return super(ConnectionHandler, self).handle()
+
+    def read_requestline(self):
+        # empty request line closes connection
+        with gevent.Timeout(self.keepalive or None, False):
+            return super(ConnectionHandler, self).read_requestline()
+        return ''
+
+    def start_response(self, status, headers, exc_info=None):
+        if not self.keepalive and not any(k.lower() == 'connection' for k, v in headers):
+            headers = list(headers) + [('Connection', 'close')]
+        return super(ConnectionHandler, self).start_response(status, headers, exc_info)
+
+
+def listen(host: str, port: int, backlog: int):
+    """Listening socket, shared by worker processes of pre-fork mode with SO_REUSEPORT"""
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def run(host: str, port: int, max_worker: int, key_path: str=None, cert_path: str=None,
+        backlog: int=1024, keepalive: int=5, access_log: bool=False) -> None:
+    """Serve with gevent WSGI server until SIGINT or SIGTERM
+
+    Args:
+        host (str): hostname
+        port (int): port
+        max_worker (int): max number of requests handled concurrently, each in a greenlet
+        key_path (str): optional absolute path of ssl key file for https setting
+        cert_path (str): optional absolute path of certificate file for https setting
+        backlog (int): max number of connections waiting to be accepted
+        keepalive (int): seconds to keep idle connection alive, 0 to close connection after each response
+        access_log (bool): log each request
+    """
+    ssl_args = {}
+    wording = 'with insecure channel'
+    if key_path and cert_path:
+        ssl_args = {'keyfile': key_path, 'certfile': cert_path}
+        wording = 'with SSL channel'
+    handler_class = type('ConnectionHandler', (ConnectionHandler, ), {'keepalive': keepalive})
+    srv = WSGIServer(listen(host, port, backlog), app, spawn=Pool(max_worker), handler_class=handler_class,
+                     log=logger if access_log else None, error_log=logger, **ssl_args)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        gevent.signal_handler(signum, lambda: gevent.spawn(srv.stop, STOP_GRACE_SECONDS))
+    logger.info('{{ app_name }} HTTP server %s started on %s:%i with %i workers!' % (wording, host, port, max_worker))
+    srv.serve_forever()
+    logger.info('{{ app_name }} HTTP server stopped')
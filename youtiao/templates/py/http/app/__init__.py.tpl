@@ -27,13 +27,17 @@ else:
 if not CONFIG_PATH.is_file():
     raise FileNotFoundError
 with CONFIG_PATH.open() as f:
-    APP_CONFIG = yaml.load(f)
+    APP_CONFIG = yaml.safe_load(f)
 
 # reload config by environment variables
 if os.environ.get('{{ app_name | upper }}_APP_HOST'):
     APP_CONFIG['app']['host'] = os.environ.get('{{ app_name | upper }}_APP_HOST')
 if os.environ.get('{{ app_name | upper }}_APP_PORT'):
     APP_CONFIG['app']['port'] = os.environ.get('{{ app_name | upper }}_APP_PORT')
+if os.environ.get('{{ app_name | upper }}_APP_MAX_WORKER'):
+    APP_CONFIG['app']['max_worker'] = int(os.environ.get('{{ app_name | upper }}_APP_MAX_WORKER'))
+if os.environ.get('{{ app_name | upper }}_APP_PROCESSES'):
+    APP_CONFIG['app']['processes'] = int(os.environ.get('{{ app_name | upper }}_APP_PROCESSES'))
 if os.environ.get('{{ app_name | upper }}_DATA_CENTER'):
     APP_CONFIG['data_center'] = int(os.environ.get('{{ app_name | upper }}_DATA_CENTER'))
 if os.environ.get('{{ app_name | upper }}_SENTRY_DSN'):
@@ -70,6 +74,8 @@ if os.environ.get('{{ app_name | upper }}_REDIS_PORT'):
     APP_CONFIG['redis']['port'] = os.environ.get('{{ app_name | upper }}_REDIS_PORT')
 if os.environ.get('{{ app_name | upper }}_REDIS_DB'):
     APP_CONFIG['redis']['database'] = os.environ.get('{{ app_name | upper }}_REDIS_DB')
+if os.environ.get('{{ app_name | upper }}_REDIS_MAX_CONNECTIONS'):
+    APP_CONFIG['redis']['max_connections'] = int(os.environ.get('{{ app_name | upper }}_REDIS_MAX_CONNECTIONS'))
 if os.environ.get('{{ app_name | upper }}_SQLITE_USER'):
     APP_CONFIG['sqlite']['user'] = os.environ.get('{{ app_name | upper }}_SQLITE_USER')
 if os.environ.get('{{ app_name | upper }}_SQLITE_PASSWORD'):
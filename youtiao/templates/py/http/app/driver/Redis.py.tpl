@@ -1,22 +1,61 @@
 # -*- coding: utf8 -*-
+"""Redis client on a sized connection pool
+
+When all `max_connections` connections are in use, callers wait up to `pool_timeout` seconds for a free one
+instead of failing. The pool drops connections inherited by forked processes by itself.
+"""
+
+from typing import Iterable, List, Sequence
 
 from {{ app_name }} import APP_CONFIG
 from {{ app_name }} import logger
 
 
+PIPELINE_BATCH_SIZE = 1000  # max commands sent in one round trip
+
+
 try:
     REDIS_CONFIG = APP_CONFIG['redis']
     redis_config = {}
     redis_config['host'] = REDIS_CONFIG.get('host', '')
     redis_config['port'] = int(REDIS_CONFIG.get('port', 0))
-    redis_config['db'] = int(REDIS_CONFIG.get('databse', 0))
+    redis_config['db'] = int(REDIS_CONFIG.get('database', 0))
     if REDIS_CONFIG.get('password'):
-        redis_config = REDIS_CONFIG['password']
+        redis_config['password'] = REDIS_CONFIG['password']
+    redis_config['max_connections'] = int(REDIS_CONFIG.get('max_connections') or 50)
+    redis_config['timeout'] = float(REDIS_CONFIG.get('pool_timeout') or 5)
+    redis_config['socket_timeout'] = float(REDIS_CONFIG.get('socket_timeout') or 5)
+    redis_config['socket_connect_timeout'] = float(REDIS_CONFIG.get('socket_timeout') or 5)
 
-    from redis import StrictRedis
-    redis_cli = StrictRedis(**redis_config)
+    from redis import BlockingConnectionPool, StrictRedis
+    redis_pool = BlockingConnectionPool(**redis_config)
+    redis_cli = StrictRedis(connection_pool=redis_pool)
 except KeyError:
     logger.error('Redis config not found. Use in-memory fake redis instead.')
     from fakeredis import FakeStrictRedis
     redis_cli = FakeStrictRedis()
 
+
+def pipeline_execute(commands: Iterable[Sequence], batch_size: int=PIPELINE_BATCH_SIZE,
+                     transaction: bool=False, raise_on_error: bool=True) -> List:
+    """Execute commands in pipelines of at most `batch_size` commands, one round trip per pipeline
+
+    Usage:
+        pipeline_execute([('set', 'a', 1), ('incr', 'b'), ('get', 'a')])  # [True, 1, b'1']
+
+    Args:
+        commands (iterable): name of redis client method followed by its arguments
+        batch_size (int): max commands sent in one round trip
+        transaction (bool): wrap each pipeline in MULTI/EXEC, commands are atomic within a batch only
+        raise_on_error (bool): raise first error of a batch, otherwise return errors as results
+    Returns:
+        results of commands in order
+    """
+    results = []
+    with redis_cli.pipeline(transaction=transaction) as pipe:
+        for i, command in enumerate(commands, 1):
+            getattr(pipe, command[0])(*command[1:])
+            if i % batch_size == 0:
+                results.extend(pipe.execute(raise_on_error=raise_on_error))
+        results.extend(pipe.execute(raise_on_error=raise_on_error))
+    return results
@@ -1,6 +1,7 @@
 # -*- coding: utf8 -*-
 
 import functools
+import os
 
 from threading import local
 from sqlalchemy import create_engine
@@ -101,7 +102,23 @@ def make_engine(scheme: str, user: str, password: str, host: str,
                              host=host, port=int(port), database=database)
     if charset:
         dsn += '?charset={}'.format(charset)
-    return create_engine(dsn, pool_size=10, max_overflow=-1, pool_recycle=1200)
+    engine = create_engine(dsn, pool_size=10, max_overflow=-1, pool_recycle=1200)
+    reset_pool_after_fork(engine)
+    return engine
+
+
+def reset_pool_after_fork(engine) -> None:
+    """Forked process opens its own connections
+
+    Connections inherited from parent process are dropped without being closed, which would close them
+    for parent too.
+
+    Args:
+        engine (object): SQLAlchemy DB engine
+    """
+    def reset_pool():
+        engine.pool = engine.pool.recreate()
+    os.register_at_fork(after_in_child=reset_pool)
 
 
 def make_session(engine):
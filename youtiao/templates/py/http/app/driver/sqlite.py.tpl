@@ -8,6 +8,7 @@ from {{ app_name }} import APP_BASE_DIR
 from {{ app_name }}.driver import (
     make_session,
     gen_commit_deco,
+    reset_pool_after_fork,
 )
 from {{ app_name }} import APP_CONFIG
 
@@ -22,6 +23,7 @@ except KeyError:
     raise KeyError('Sqlite config not found')
 
 engine = create_engine('sqlite+pysqlite:///{}/db.sqlite3'.format(APP_BASE_DIR), module=sqlite)
+reset_pool_after_fork(engine)
 session = make_session(engine)
 # DB commit decorator
 db_commit = gen_commit_deco(session)
@@ -0,0 +1,116 @@
+# -*- coding: utf8 -*-
+"""Pre-fork worker processes serving on the same port with SO_REUSEPORT
+
+The supervisor forks before the server and its drivers are imported, so that each worker sets up its own
+DB engines, snowflake worker ID and server after fork.
+"""
+
+import os
+import signal
+import sys
+import time
+from typing import Callable, Dict
+
+from {{ app_name }} import logger
+
+
+class Supervisor(object):
+    """Start worker processes, restart crashed ones and stop all on SIGINT or SIGTERM"""
+
+    def __init__(self, target: Callable[[int], None], processes: int, stop_timeout: float=10,
+                 restart_delay: float=1, max_restart_delay: float=30):
+        """
+        Args:
+            target (callable): function serving in worker process, called with worker index
+            processes (int): number of worker processes
+            stop_timeout (float): seconds to wait for workers to stop before killing them
+            restart_delay (float): seconds before restarting a crashed worker, doubled while it keeps crashing
+            max_restart_delay (float): max seconds before restarting a crashed worker
+        """
+        self.target = target
+        self.processes = processes
+        self.stop_timeout = stop_timeout
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.workers = {}  # type: Dict[int, int]
+        self.started_at = {}  # type: Dict[int, float]
+        self.delays = {}  # type: Dict[int, float]
+        # time to (re)start worker of index
+        self.restart_at = {}  # type: Dict[int, float]
+        self.stopping = False
+
+    def spawn(self, index: int) -> int:
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = index
+            self.started_at[index] = time.time()
+            return pid
+        # worker process, exits by SystemExit instead of returning to the supervisor loop, so that exit
+        # functions registered by worker run, e.g. release of snowflake worker ID lease
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self.target(index)
+        except SystemExit:
+            raise
+        except BaseException:
+            logger.exception('Worker %i crashed', index)
+            sys.exit(1)
+        sys.exit(0)
+
+    def stop(self, signum=None, frame=None) -> None:
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info('Stopping %i workers', len(self.workers))
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reap(self) -> None:
+        """Collect exited workers, restart them unless stopping"""
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                return
+            index = self.workers.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            # back off workers crashing right after start
+            delay = self.delays.get(index, self.restart_delay)
+            if time.time() - self.started_at[index] > self.max_restart_delay:
+                delay = self.restart_delay
+            logger.error('Worker %i (pid %i) exited with %i, restart in %.0fs', index, pid, code, delay)
+            self.delays[index] = min(delay * 2, self.max_restart_delay)
+            self.restart_at[index] = time.time() + delay
+
+    def run(self) -> None:
+        """Supervise workers until stopped"""
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        self.restart_at.update((index, 0) for index in range(self.processes))
+        logger.info('Supervisor %i starting %i workers', os.getpid(), self.processes)
+        stop_deadline = None
+        while self.workers or (self.restart_at and not self.stopping):
+            if not self.stopping:
+                now = time.time()
+                for index, at in list(self.restart_at.items()):
+                    if at <= now:
+                        del self.restart_at[index]
+                        self.spawn(index)
+            elif stop_deadline is None:
+                stop_deadline = time.time() + self.stop_timeout
+            elif time.time() > stop_deadline:
+                logger.error('Killing %i workers not stopped in %.0fs', len(self.workers), self.stop_timeout)
+                for pid in self.workers:
+                    os.kill(pid, signal.SIGKILL)
+                stop_deadline = float('inf')
+            try:
+                self.reap()
+            except ChildProcessError:
+                self.workers.clear()
+            time.sleep(0.1)
+        logger.info('Supervisor %i stopped', os.getpid())
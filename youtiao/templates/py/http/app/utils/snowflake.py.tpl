@@ -1,12 +1,15 @@
 # -*- coding: utf8 -*-
 
-from random import randint
+import os
+import threading
 import time
+from typing import List, Tuple
 
 from {{ app_name }}.driver.Redis import redis_cli
 from {{ app_name }} import APP_CONFIG
 from {{ app_name }} import APP_NAME, logger
 from {{ app_name }}.utils import Singleton
+from {{ app_name }}.utils.worker_lease import WorkerIdLease
 
 
 DC_N = APP_CONFIG.get('data_center')
@@ -14,24 +17,37 @@ if DC_N is None:
     logger.warn('Data center number not set, use 0 as defautl value. It may cause snowflake ID duplication problem.')
     DC_N = 0
 DC_N = int(DC_N)
-PID_EXPIRE = 60 * 60 * 24   # process ID expire in 1 day
+LEASE_TTL = int(APP_CONFIG.get('worker_id_ttl') or 60)  # seconds of worker ID lease, renewed by heartbeat
+MAX_WORKER_ID = 0xff  # 8 bits of worker ID
 REDIS_KEY_PREFIX = '{}:pid:{}'.format(APP_NAME, DC_N)
 EPOCH_TIMESTAMP = 550281600000
+MAX_SEQUENCE = 0xfff  # 12 bits of sequence number in each millisecond
 
 
-def _get_pid():
-    """Generate process ID"""
-    while 1:
-        pid = randint(0, 255)
-        k = '{}:{}'.format(REDIS_KEY_PREFIX, pid)
-        if redis_cli.setnx(k, 1):
-            redis_cli.expire(k, PID_EXPIRE)
-            return pid
+# worker ID lease of current process, released at exit
+worker_lease = None
 
 
-class SnowFlakeGenerator(object):
-    """Global unique SnowFlake ID Generator"""
-    __metaclass__ = Singleton
+def _get_pid() -> int:
+    """Lease worker ID of current process
+
+    Raises:
+        RuntimeError: all worker IDs of data center are taken
+    """
+    global worker_lease
+    worker_lease = WorkerIdLease(redis_cli, REDIS_KEY_PREFIX, MAX_WORKER_ID, LEASE_TTL, on_change=_replace_generator)
+    return worker_lease.acquire()
+
+
+def _now() -> int:
+    return time.time_ns() // 1000000
+
+
+class SnowFlakeGenerator(object, metaclass=Singleton):
+    """Global unique SnowFlake ID Generator
+
+    Thread safe. When the sequence of a millisecond is exhausted, it spins until next millisecond.
+    """
 
     def __init__(self, dc, worker):
         self.dc = dc
@@ -42,9 +58,15 @@ class SnowFlakeGenerator(object):
         self.sequence_overload = 0
         self.errors = 0
         self.generated_ids = 0
+        self._lock = threading.Lock()
 
-    def get_next_id(self):
-        curr_time = int(time.time() * 1000)
+    def _reserve(self, n: int) -> Tuple[int, int, int]:
+        """Reserve sequence numbers of current millisecond, called with lock held
+
+        Returns:
+            timestamp, first reserved sequence number and number of reserved sequence numbers, at most `n`
+        """
+        curr_time = _now()
 
         if curr_time < self.last_timestamp:
             # stop handling requests til we've caught back up
@@ -54,26 +76,99 @@ class SnowFlakeGenerator(object):
         if curr_time > self.last_timestamp:
             self.sequence = 0
             self.last_timestamp = curr_time
+        elif self.sequence > MAX_SEQUENCE:
+            # the sequence is overload, wait for next millisecond
+            self.sequence_overload += 1
+            while curr_time <= self.last_timestamp:
+                curr_time = _now()
+            self.sequence = 0
+            self.last_timestamp = curr_time
 
-        self.sequence += 1
+        start = self.sequence
+        count = min(n, MAX_SEQUENCE + 1 - start)
+        self.sequence += count
+        self.generated_ids += count
+        return curr_time, start, count
 
-        if self.sequence > 4095:
-            # the sequence is overload, just wait to next sequence
-            logger.warning('The sequence has been overload')
-            self.sequence_overload += 1
-            time.sleep(0.001)
-            return self.get_next_id()
+    def get_next_id(self) -> int:
+        with self._lock:
+            curr_time, sequence, _ = self._reserve(1)
+        return ((curr_time - EPOCH_TIMESTAMP) << 22) | (self.node_id << 12) | sequence
+
+    def next_ids(self, n: int) -> List[int]:
+        """Generate `n` IDs, reserving up to the rest of current millisecond in one lock acquisition
+
+        Raises:
+            ValueError: `n` is negative
+        """
+        if n < 0:
+            raise ValueError('Number of IDs must not be negative')
+        ids = []
+        while len(ids) < n:
+            with self._lock:
+                curr_time, start, count = self._reserve(n - len(ids))
+            base = ((curr_time - EPOCH_TIMESTAMP) << 22) | (self.node_id << 12)
+            ids.extend(range(base + start, base + start + count))
+        return ids
+
+
+# generator of current process, set up on first use
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def _reset_generator() -> None:
+    """Forked process leases its own worker ID instead of the one of parent"""
+    global _generator, _generator_lock, worker_lease
+    _generator = None
+    worker_lease = None
+    _generator_lock = threading.Lock()
+    SnowFlakeGenerator.clear_instance()
+
+
+os.register_at_fork(after_in_child=_reset_generator)
+
+
+def _replace_generator(worker_id: int) -> None:
+    """Generator of new worker ID leased after the previous one was lost"""
+    global _generator
+    with _generator_lock:
+        SnowFlakeGenerator.clear_instance()
+        _generator = SnowFlakeGenerator(DC_N, worker_id)
+
+
+def get_snowflake_generator() -> SnowFlakeGenerator:
+    """Generator of current process, worker ID is leased on first call
+
+    Raises:
+        RuntimeError: worker ID is taken by another process, until a new one is leased
+    """
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = SnowFlakeGenerator(DC_N, _get_pid())
+    if worker_lease is not None and worker_lease.lost:
+        raise RuntimeError('Worker ID {} taken by another process'.format(worker_lease.worker_id))
+    return _generator
 
-        generated_id = ((curr_time - EPOCH_TIMESTAMP) << 22) | (self.node_id << 12) | self.sequence
 
-        self.generated_ids += 1
-        return generated_id
+def __getattr__(name: str):
+    """`snowflake_generator` used to be created at import, now on first access
 
-snowflake_generator = SnowFlakeGenerator(DC_N, _get_pid())
+    Prefer `get_snowflake_generator()`, an imported `snowflake_generator` keeps the worker ID
+    leased at import even if the lease is lost and replaced later.
+    """
+    if name == 'snowflake_generator':
+        return get_snowflake_generator()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 def gen_snowflake_id() -> int:
     """Generate SnowFlake Unique ID"""
-    return snowflake_generator.get_next_id()
+    return get_snowflake_generator().get_next_id()
 
 
+def gen_snowflake_ids(n: int) -> List[int]:
+    """Generate `n` SnowFlake Unique IDs at once"""
+    return get_snowflake_generator().next_ids(n)
@@ -3,6 +3,12 @@ app:
     host: 127.0.0.1
     port: 8686
     mode: http
+    max_worker: 1000  # max concurrent requests of each process, handled in greenlets
+    processes: 1  # worker processes sharing port with SO_REUSEPORT, pre-fork mode if more than 1
+    backlog: 1024  # max connections waiting to be accepted
+    keepalive: 5  # seconds to keep idle connections alive, 0 to disable keep-alive
+    access_log: False
+    debug: False  # run flask development server with reloader and debugger instead
 logger:
     console:
         level: DEBUG
@@ -32,6 +38,9 @@ redis:
     port: 6379
     password: ''
     database: 0
+    max_connections: 50  # size of connection pool
+    pool_timeout: 5  # seconds to wait for a free connection of pool
+    socket_timeout: 5  # seconds of connect and commands, keep above timeouts of blocking commands
 sqlite:
     user: root
     password: root
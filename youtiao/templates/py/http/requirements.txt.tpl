@@ -2,9 +2,9 @@ raven>=6.2.1
 PyYAML>=3.12
 SQLAlchemy>=1.1.15
 psycopg2-binary>=2.7.4
-gevent>=1.2.2
+gevent>=1.5.0
 redis>=2.10.6
-fakeredis>=0.8.2
+fakeredis[lua]>=1.1.0
 six>=1.11.0
 pytz>=2017.2
 grpcio>=1.6.3
@@ -10,18 +10,36 @@ sys.path.append(os.path.dirname(base_path))
 
 from gevent import monkey
 monkey.patch_all()
-from {{ app_name }}.Http import app
 from {{ app_name }} import logger
 from {{ app_name }} import APP_CONFIG
 
 app_config = APP_CONFIG.get('app')
 host = app_config.get('host', '127.0.0.1')
 port = int(app_config.get('port', 8686))
-max_worker = app_config.get('max_worker', 5)
+max_worker = int(app_config.get('max_worker', 1000))
 key_path = app_config.get('key_path')
 cert_path = app_config.get('cert_path')
+processes = int(app_config.get('processes') or 1)
+backlog = int(app_config.get('backlog') or 1024)
+keepalive = int(app_config.get('keepalive', 5))
+access_log = bool(app_config.get('access_log', False))
+debug = bool(app_config.get('debug', False))
+
+
+def serve(index: int=0) -> None:
+    # imported in worker process, DB engines and snowflake worker ID are set up after fork
+    from {{ app_name }}.Http import run
+    run(host, port, max_worker, key_path, cert_path, backlog, keepalive, access_log)
+
 
 if __name__ == '__main__':
-    logger.debug('HTTP server started on {}:{}'.format(host, port))
-    app.run(host=host, port=int(port), debug=True, threaded=True)
+    if debug:
+        from {{ app_name }}.Http import app
+        logger.debug('HTTP development server started on {}:{}'.format(host, port))
+        app.run(host=host, port=port, debug=True, threaded=True)
+    elif processes > 1:
+        from {{ app_name }}.utils.prefork import Supervisor
+        Supervisor(serve, processes).run()
+    else:
+        serve()
 
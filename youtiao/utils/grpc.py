@@ -1,21 +1,243 @@
 # -*- coding: utf8 -*-
 
-from typing import Tuple
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List
 from pathlib import Path
-from pkg_resources import resource_filename
+from pkg_resources import get_distribution, resource_filename
 
 from grpc_tools import _protoc_compiler
 
 
-def protoc(proto_path: str, output_path: str) -> Tuple[Path, Path]:
-    """compile .proto file
+PROTOC_CACHE_FILENAME = '.protoc_cache.json'
+PROTO_IMPORT_RE = re.compile(r'^\s*import\s+(?:public\s+|weak\s+)?"([^"]+)"\s*;', re.MULTILINE)
+
+
+def file_hash(path: str) -> str:
+    """sha256 hex digest of file content"""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def proto_imports(proto_path: str, include_paths: List[str]) -> Dict[str, Path]:
+    """Resolve .proto file and its transitive imports against include paths
+
+    Args:
+        proto_path (str): proto file path
+        include_paths (list): directories searched for imported files, in protoc order
+
+    Returns:
+        dict of import name and resolved path, proto file itself included.
+        Imports which cannot be resolved are ignored and left to protoc to report.
+    """
+    resolved = {}
+    pending = [(str(proto_path), Path(proto_path))]
+    while pending:
+        name, path = pending.pop()
+        if name in resolved:
+            continue
+        resolved[name] = path
+        for import_name in PROTO_IMPORT_RE.findall(path.read_text()):
+            if import_name in resolved:
+                continue
+            for include_path in include_paths:
+                import_path = Path(include_path).joinpath(import_name)
+                if import_path.is_file():
+                    pending.append((import_name, import_path))
+                    break
+    return resolved
+
+
+def proto_groups(proto_paths: List[str], include_paths: List[str]) -> List[List[str]]:
+    """Group .proto files connected by imports
+
+    Args:
+        proto_paths (list): proto file paths
+        include_paths (list): directories searched for imported files, in protoc order
+
+    Returns:
+        list of groups of proto file paths, files importing each other directly or
+        transitively are in the same group
+    """
+    resolved_paths = {str(Path(p).resolve()): str(p) for p in proto_paths}
+    parents = {p: p for p in resolved_paths}
+
+    def find(p: str) -> str:
+        while parents[p] != p:
+            parents[p] = parents[parents[p]]
+            p = parents[p]
+        return p
+
+    for p in resolved_paths:
+        for import_path in proto_imports(p, include_paths).values():
+            import_path = str(import_path.resolve())
+            if import_path in parents:
+                parents[find(import_path)] = find(p)
+
+    groups = {}
+    for p, proto_path in sorted(resolved_paths.items()):
+        groups.setdefault(find(p), []).append(proto_path)
+    return list(groups.values())
+
+
+def proto_dependents(changed_paths: List[str], proto_paths: List[str], include_paths: List[str]) -> List[str]:
+    """Select .proto files which are changed or import changed files
+
+    Args:
+        changed_paths (list): changed file paths
+        proto_paths (list): proto file paths to select from
+        include_paths (list): directories searched for imported files, in protoc order
+
+    Returns:
+        list of proto file paths importing changed files directly or transitively, changed
+        proto files included
+    """
+    changed = {str(Path(p).resolve()) for p in changed_paths}
+    return [p for p in proto_paths
+            if any(str(path.resolve()) in changed for path in proto_imports(p, include_paths).values())]
+
+
+def proto_outputs(proto_path: str, include_paths: List[str], output_path: str) -> List[Path]:
+    """Paths of pb2 python file and pb2 grpc file generated by protoc
 
     Args:
         proto_path (str): proto file path
+        include_paths (list): include directories passed to protoc
+        output_path (str): output files directory
+
+    Returns:
+        list of generated file paths, empty if proto file is not under any include path
+    """
+    proto_path = Path(proto_path).resolve()
+    for include_path in include_paths:
+        try:
+            relative_path = proto_path.relative_to(Path(include_path).resolve())
+        except ValueError:
+            continue
+        module_path = Path(output_path).joinpath(relative_path.parent, relative_path.stem.replace('-', '_'))
+        return [Path('{}_pb2.py'.format(module_path)), Path('{}_pb2_grpc.py'.format(module_path))]
+    return []
+
+
+class ProtoCache(object):
+    """Persistent content-hash cache of compiled .proto files
+
+    Cache key of a proto file is computed from the content of the file and its transitive
+    imports, the include paths and the grpcio-tools version. Compilation is skipped when the
+    key is unchanged and generated files are identical to what was recorded after compilation.
+    """
+
+    def __init__(self, cache_path: str):
+        """
+        Args:
+            cache_path (str): path of json file persisting the cache
+        """
+        self.cache_path = Path(cache_path)
+        self.hits = 0
+        self.misses = 0
+        self.entries = {}
+        if self.cache_path.is_file():
+            try:
+                with self.cache_path.open() as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                # corrupted cache file, start from scratch
+                self.entries = {}
+        self.protoc_version = get_distribution('grpcio-tools').version
+
+    def key(self, proto_path: str, include_paths: List[str]) -> str:
+        """Compute cache key of proto file
+
+        Args:
+            proto_path (str): proto file path
+            include_paths (list): include directories passed to protoc
+
+        Returns:
+            sha256 hex digest
+        """
+        h = hashlib.sha256()
+        h.update(self.protoc_version.encode())
+        for include_path in include_paths:
+            h.update(str(include_path).encode())
+        for name, path in sorted(proto_imports(proto_path, include_paths).items()):
+            h.update(name.encode())
+            h.update(file_hash(str(path)).encode())
+        return h.hexdigest()
+
+    def is_current(self, proto_path: str, key: str) -> bool:
+        """Check if proto file compiled outputs are up to date, count cache hit or miss
+
+        Args:
+            proto_path (str): proto file path
+            key (str): cache key computed by `key`
+        """
+        entry = self.entries.get(str(Path(proto_path).resolve()))
+        # an entry without outputs is not trusted, protoc may have failed to write them
+        current = entry is not None and entry['key'] == key and bool(entry['outputs']) and all(
+            Path(output).is_file() and file_hash(output) == output_hash
+            for output, output_hash in entry['outputs'].items())
+        if current:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return current
+
+    def update(self, proto_path: str, key: str, outputs: List[Path]) -> None:
+        """Record compiled proto file
+
+        Args:
+            proto_path (str): proto file path
+            key (str): cache key computed by `key`
+            outputs (list): generated file paths
+        """
+        self.entries[str(Path(proto_path).resolve())] = {
+            'key': key,
+            'outputs': {str(output): file_hash(str(output)) for output in outputs if output.is_file()},
+        }
+
+    def save(self) -> None:
+        """Persist cache to json file"""
+        tmp_path = '{}.tmp'.format(self.cache_path)
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, str(self.cache_path))
+
+
+def run_protoc(proto_paths: List[str], include_paths: List[str], output_path: str) -> int:
+    """Run grpc_tools protoc compiler once for several .proto files
+
+    Args:
+        proto_paths (list): proto file paths
+        include_paths (list): include directories
         output_path (str): output files directory
 
     Returns:
-        tuple of paths for pb2 python file and pb2 grpc file
+        protoc exit code
+    """
+    args = [resource_filename('grpc_tools', 'protoc.py')]
+    args.extend('-I{}'.format(include_path) for include_path in include_paths)
+    args.extend([
+        '--python_out={}'.format(output_path),
+        '--grpc_python_out={}'.format(output_path),
+    ])
+    args.extend(proto_paths)
+    return _protoc_compiler.run_main([arg.encode() for arg in args])
+
+
+def protoc(proto_path: str, output_path: str, cache: ProtoCache=None) -> int:
+    """compile .proto file
+
+    Args:
+        proto_path (str): proto file path, the output directory is used as include path
+        output_path (str): output files directory
+        cache (ProtoCache): optional cache to skip compilation of unchanged proto file
+
+    Returns:
+        protoc exit code, 0 when compilation is skipped by cache
+
+    Raises:
+        FileNotFoundError
     """
     proto_path = str(proto_path)
     output_path = str(output_path)
@@ -23,13 +245,12 @@ def protoc(proto_path: str, output_path: str) -> Tuple[Path, Path]:
         raise FileNotFoundError('proto file not found')
     if not Path(output_path).is_dir():
         raise FileNotFoundError('output dir not found')
-    args = [
-        resource_filename('grpc_tools', 'protoc.py'),
-        '-I{}'.format(output_path),
-        '--python_out={}'.format(output_path),
-        '--grpc_python_out={}'.format(output_path),
-        proto_path,
-        '-I{}'.format(resource_filename('grpc_tools', '_proto')),
-    ]
-    return _protoc_compiler.run_main([arg.encode() for arg in args])
-
+    include_paths = [output_path, resource_filename('grpc_tools', '_proto')]
+    if cache is not None:
+        key = cache.key(proto_path, include_paths)
+        if cache.is_current(proto_path, key):
+            return 0
+    ret = run_protoc([proto_path], include_paths, output_path)
+    if cache is not None and ret == 0:
+        cache.update(proto_path, key, proto_outputs(proto_path, include_paths, output_path))
+    return ret
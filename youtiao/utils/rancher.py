@@ -1,26 +1,339 @@
 # -*- coding: utf8 -*-
 
+import base64
 import json
-from typing import Dict
-from time import sleep
-from copy import deepcopy
+import os
+import random
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterator, List, Set, Tuple
+from time import monotonic, sleep, time
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+
+RANCHER_CACHE_PATH = os.path.join(os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'youtiao',
+                                  'rancher.json')
+# resource ID in URL path such as 1a5, 1st12 or 1s230
+RANCHER_ID_RE = re.compile(r'^\d+[a-z]+\d+$')
+
+
+def backoff_delays(initial: float=0.1, maximum: float=2.0, factor: float=2.0) -> Iterator[float]:
+    """Exponential backoff delays with jitter
+
+    Args:
+        initial (float): first delay in second
+        maximum (float): max delay in second
+        factor (float): growth factor of delay
+
+    Returns:
+        Iterator of delays, each one randomly chosen between half and full of the exponential delay
+    """
+    delay = initial
+    while True:
+        yield random.uniform(delay / 2, delay)
+        delay = min(delay * factor, maximum)
+
+
+class ServiceEventStream(object):
+    """Service resource change events of rancher environment pushed through websocket"""
+
+    def __init__(self, endpoint_url: str, environment_id: str, auth: Tuple[str, str], timeout: float=10):
+        """
+        Args:
+            endpoint_url (str): rancher server API endpoint URL
+            environment_id (str): defined environment id in rancher
+            auth (tuple): rancher API access key and secret
+            timeout (float): connect timeout in second
+
+        Raises:
+            OSError
+            websocket.WebSocketException
+        """
+        if websocket is None:
+            raise OSError('websocket-client is not installed')
+        url = '{}/projects/{}/subscribe?eventNames=resource.change'.format(
+            endpoint_url.replace('http', 'ws', 1), environment_id)
+        token = base64.b64encode('{}:{}'.format(*auth).encode()).decode()
+        self.ws = websocket.create_connection(url, timeout=timeout, header=['Authorization: Basic {}'.format(token)])
+
+    def wait(self, service_id: str, timeout: float) -> Dict:
+        """Wait for next change of service
+
+        Args:
+            service_id (str): defined service id in rancher
+            timeout (float): max seconds to wait
+
+        Returns:
+            service info in json, None if service did not change before timeout
+
+        Raises:
+            OSError
+            websocket.WebSocketException: connection closed
+        """
+        deadline = monotonic() + timeout
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return None
+            self.ws.settimeout(remaining)
+            try:
+                message = self.ws.recv()
+            except websocket.WebSocketTimeoutException:
+                return None
+            event = json.loads(message)
+            if event.get('name') != 'resource.change' or event.get('resourceType') != 'service' \
+                    or event.get('resourceId') != service_id:
+                # ping or change of other resources
+                continue
+            resource = (event.get('data') or {}).get('resource')
+            if resource:
+                return resource
+
+    def close(self) -> None:
+        self.ws.close()
+
+
+class IdCache(object):
+    """Persistent cache of rancher resource IDs resolved by name
+
+    Entries expire after `ttl` seconds, and callers invalidate entries found stale, e.g. when
+    the resource was deleted and created again with the same name.
+    """
+
+    def __init__(self, cache_path: str=RANCHER_CACHE_PATH, ttl: float=86400):
+        """
+        Args:
+            cache_path (str): path of json file persisting the cache
+            ttl (float): seconds before an entry expires
+        """
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.isfile(cache_path):
+            try:
+                with open(cache_path) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                # corrupted cache file, start from scratch
+                self.entries = {}
+        now = time()
+        self.entries = {k: v for k, v in self.entries.items() if v['expires'] > now}
+
+    def get(self, key: str) -> str:
+        """Get cached ID, count cache hit or miss
+
+        Args:
+            key (str): resource key
+
+        Returns:
+            resource ID, None if not cached or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['expires'] > time():
+                self.hits += 1
+                return entry['id']
+            self.misses += 1
+            return None
+
+    def set(self, key: str, resource_id: str) -> None:
+        with self.lock:
+            self.entries[key] = {'id': resource_id, 'expires': time() + self.ttl}
+
+    def invalidate(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def save(self) -> None:
+        """Persist cache to json file"""
+        with self.lock:
+            os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(self.cache_path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.cache_path)
+
+
+def endpoint_name(endpoint_path: str, method: str, url: str, params: Dict=None) -> str:
+    """Endpoint name of rancher API request with resource IDs replaced
+
+    Args:
+        endpoint_path (str): path of rancher server API endpoint URL, e.g. `/v2-beta`
+        method (str): HTTP method
+        url (str): request URL
+        params (dict): query parameters
+
+    Returns:
+        endpoint name, e.g. `POST projects/{id}/services/{id}?action=upgrade`
+    """
+    path = urlsplit(url).path
+    if path.startswith(endpoint_path):
+        path = path[len(endpoint_path):]
+    path = '/'.join('{id}' if RANCHER_ID_RE.match(part) else part for part in path.strip('/').split('/'))
+    action = (params or {}).get('action')
+    return '{} {}{}'.format(method.upper(), path, '?action={}'.format(action) if action else '')
+
+
+class RequestMetrics(object):
+    """Count and latency of requests per rancher API endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)  # type: Dict[str, List[float]]
+        self.errors = defaultdict(int)  # type: Dict[str, int]
+
+    def record(self, endpoint: str, seconds: float, error: bool=False) -> None:
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if error:
+                self.errors[endpoint] += 1
+
+    def summary(self) -> List[Dict]:
+        """Metrics of each endpoint
+
+        Returns:
+            list of endpoint metrics, most time consuming first
+        """
+        with self.lock:
+            rows = []
+            for endpoint, latencies in self.latencies.items():
+                latencies = sorted(latencies)
+                rows.append({
+                    'endpoint': endpoint,
+                    'count': len(latencies),
+                    'errors': self.errors[endpoint],
+                    'total_ms': sum(latencies) * 1000,
+                    'mean_ms': sum(latencies) / len(latencies) * 1000,
+                    'p95_ms': latencies[int(len(latencies) * 0.95 - 0.5)] * 1000,
+                    'max_ms': latencies[-1] * 1000,
+                })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+
+class RancherSession(requests.Session):
+    """HTTP session of rancher API with sized connection pool, retries, default timeout and metrics
+
+    Idempotent requests are retried with exponential backoff on connection errors, read errors
+    and 502/503/504 responses. Actions sent with POST are only retried when connection failed,
+    as the request did not reach rancher.
+    """
+
+    def __init__(self, endpoint_url: str, key: str, secret: str, timeout: float=30, retries: int=3,
+                 backoff_factor: float=0.5, pool_size: int=10):
+        """
+        Args:
+            endpoint_url (str): rancher server API endpoint URL
+            key (str): rancher account or environment API access key
+            secret (str): rancher account or environment API secret corresponding to the access key
+            timeout (float): default read timeout in second of each request
+            retries (int): max number of retries of each request
+            backoff_factor (float): retry delays are backoff_factor * 2 ** (retry number - 1) seconds
+            pool_size (int): max number of connections kept alive, at least the number of threads
+                sharing the session
+        """
+        super().__init__()
+        self.endpoint_path = urlsplit(endpoint_url).path.rstrip('/')
+        self.auth = (key, secret)
+        self.timeout = (min(timeout, 5), timeout)
+        self.metrics = RequestMetrics()
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries, backoff_factor=backoff_factor,
+                      status_forcelist=(502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint_name(self.endpoint_path, method, url, kwargs.get('params'))
+        start = monotonic()
+        try:
+            r = super().request(method, url, **kwargs)
+        except requests.RequestException:
+            self.metrics.record(endpoint, monotonic() - start, error=True)
+            raise
+        self.metrics.record(endpoint, monotonic() - start, error=r.status_code >= 400)
+        return r
 
 
 class RancherClient(object):
-    def __init__(self, endpoint_url: str, key: str, secret: str):
+    def __init__(self, endpoint_url: str, key: str, secret: str, event_stream: bool=True,
+                 id_cache: IdCache=None, request_timeout: float=30, retries: int=3, pool_size: int=10):
         """
         Args:
             endpoint_url (str): rancher server API endpoint URL
             key (str): rancher account or environment API access key
             secret (str): rancher account or environment API secret corresponding to the access key
+            event_stream (bool): wait for service state change by subscribing rancher events,
+                fallback to polling if subscription fails
+            id_cache (IdCache): optional cache of environment, stack and service IDs
+            request_timeout (float): read timeout in second of each request
+            retries (int): max number of retries of idempotent requests
+            pool_size (int): max number of connections kept alive for concurrent use
         """
         self.endpoint_url = endpoint_url
-        self.s = requests.Session()
-        self.s.auth = (key, secret)
+        self.s = RancherSession(endpoint_url, key, secret, request_timeout, retries, pool_size=pool_size)
+        self.metrics = self.s.metrics
+        self.event_stream = event_stream
+        self.id_cache = id_cache
+        # number of resources per page of collection
+        self.page_size = 100
         # timeout in second for retry
         self.timeout = 60
+        # max interval in second between polls
+        self.sleep_step = 2
+        # interval in second to check service state when no event received
+        self.event_timeout = 10
+
+    def collection(self, path: str, params: Dict=None, limit: int=None) -> Iterator[Dict]:
+        """
+        Iterate resources of collection filtered by rancher server, following pagination.
+
+        Args:
+            path (str): collection path relative to endpoint URL
+            params (dict): resource field filters
+            limit (int): page size, default to `page_size`
+
+        Returns:
+            Iterator of resources in json
+        """
+        url = '{}/{}'.format(self.endpoint_url, path)
+        params = dict(params or {}, limit=limit or self.page_size)
+        while url:
+            r = self.s.get(url, params=params)
+            r.raise_for_status()
+            body = r.json()
+            yield from body['data']
+            # next page URL carries all query parameters
+            url = (body.get('pagination') or {}).get('next')
+            params = None
+
+    def cached_id(self, key: str) -> str:
+        if self.id_cache is None:
+            return None
+        return self.id_cache.get('{} {} {}'.format(self.endpoint_url, self.s.auth[0], key))
+
+    def cache_id(self, key: str, resource_id: str=None) -> None:
+        """Cache resource ID, or invalidate cached one if `resource_id` is None"""
+        if self.id_cache is None:
+            return
+        key = '{} {} {}'.format(self.endpoint_url, self.s.auth[0], key)
+        if resource_id is None:
+            self.id_cache.invalidate(key)
+        else:
+            self.id_cache.set(key, resource_id)
 
     def environment_id(self, name: str=None) -> str:
         """
@@ -32,15 +345,15 @@ class RancherClient(object):
         Returns:
             environment ID in string
         """
-        if not name:
-            r = self.s.get('{}/projects'.format(self.endpoint_url), params={'limit': 1000})
-        else:
-            r = self.s.get('{}/projects'.format(self.endpoint_url), params={'limit': 1000, 'name': name})
-        r.raise_for_status()
-        data = r.json()['data']
-        if data:
-            return data[0]['id']
-        return None
+        cache_key = 'environment:{}'.format(name or '')
+        environment_id = self.cached_id(cache_key)
+        if environment_id:
+            return environment_id
+        project = next(self.collection('projects', {'name': name} if name else None, limit=1), None)
+        if project is None:
+            return None
+        self.cache_id(cache_key, project['id'])
+        return project['id']
 
     def service_info(self, environment_id: str, stack_name: str, service_name: str) -> Dict:
         """
@@ -56,30 +369,107 @@ class RancherClient(object):
         """
         if not environment_id:
             raise Exception('Empty rancher environment ID')
-        r = self.s.get('{}/projects/{}/stacks'.format(self.endpoint_url, environment_id),
-                       params={'limit': 1000, 'name': stack_name})
-        r.raise_for_status()
-        data = r.json()['data']
+        stack_key = 'stack:{}:{}'.format(environment_id, stack_name)
+        service_key = 'service:{}:{}/{}'.format(environment_id, stack_name, service_name)
+        stack_id = self.cached_id(stack_key)
+        service_id = self.cached_id(service_key)
+        if stack_id and service_id:
+            try:
+                data = self.service(environment_id, service_id)
+            except Exception:
+                data = None
+            if data and data.get('name') == service_name and data.get('stackId') == stack_id:
+                return data
+            # deleted or renamed since cached
+            self.cache_id(stack_key, None)
+            self.cache_id(service_key, None)
 
-        if not data:
+        stack_info = next(self.collection('projects/{}/stacks'.format(environment_id),
+                                          {'name': stack_name}, limit=1), None)
+        if not stack_info:
             # stack not found
             raise Exception('Stack {} not found'.format(stack_name))
-            return None
+        self.cache_id(stack_key, stack_info['id'])
+
+        service_info = next(self.collection('projects/{}/services'.format(environment_id),
+                                            {'name': service_name, 'stackId': stack_info['id']}, limit=1), None)
+        if service_info:
+            self.cache_id(service_key, service_info['id'])
+        return service_info
 
-        stack_info = deepcopy(data[0])
+    def service(self, environment_id: str, service_id: str) -> Dict:
+        """
+        Get rancher service info by given environment id and service id.
+
+        Args:
+            environment_id (str): defined environment id in rancher
+            service_id (str): defined service id in rancher
 
-        r = self.s.get('{}/projects/{}/services'.format(self.endpoint_url, environment_id),
-                       params={'name': service_name})
+        Returns:
+            service info in json
+        """
+        r = self.s.get('{}/projects/{}/services/{}'.format(self.endpoint_url, environment_id, service_id))
         r.raise_for_status()
-        data = r.json()['data']
-        if not data:
-            # service not found
+        data = r.json()
+        if data.get('type') == 'error':
+            raise Exception(json.dumps(data))
+        return data
+
+    def subscribe(self, environment_id: str) -> ServiceEventStream:
+        """
+        Subscribe service change events of environment.
+
+        Args:
+            environment_id (str): defined environment id in rancher
+
+        Returns:
+            event stream, None if event stream is disabled or subscription fails
+        """
+        if not self.event_stream:
+            return None
+        try:
+            return ServiceEventStream(self.endpoint_url, environment_id, self.s.auth)
+        except Exception:
+            # websocket not installed or not reachable, e.g. behind a proxy
             return None
-        for service_info in data:
-            if service_info['stackId'] == stack_info['id']:
-                return service_info
-        return None
 
+    def wait_service_state(self, environment_id: str, service_id: str, states: Set[str],
+                           events: ServiceEventStream=None) -> Dict:
+        """
+        Wait until service is in one of given states. State changes are received from event
+        stream if given, otherwise service is polled with exponential backoff.
+
+        Args:
+            environment_id (str): defined environment id in rancher
+            service_id (str): defined service id in rancher
+            states (set): expected service states
+            events (ServiceEventStream): event stream subscribed before the state change
+
+        Returns:
+            service info in json
+        """
+        deadline = monotonic() + self.timeout
+        delays = backoff_delays(maximum=self.sleep_step)
+        data = self.service(environment_id, service_id)
+        while data['state'] not in states:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise Exception('Timeout of rancher finish upgrade service {}'.format(service_id))
+            if events is not None:
+                try:
+                    resource = events.wait(service_id, min(remaining, self.event_timeout))
+                except Exception:
+                    # stream closed, fallback to polling
+                    events = None
+                    continue
+                if resource is not None:
+                    data = resource
+                    continue
+            else:
+                sleep(min(next(delays), remaining))
+            # no event for a while or polling
+            data = self.service(environment_id, service_id)
+        return data
 
     def service_finish_upgrade(self, environment_id: str, service_id: str) -> Dict:
         """
@@ -92,43 +482,27 @@ class RancherClient(object):
         Returns:
             service info in json
         """
-        r = self.s.get('{}/projects/{}/services/{}'.format(self.endpoint_url, environment_id, service_id))
-        r.raise_for_status()
-        data = r.json()
-        if data.get('type') == 'error':
-            raise Exception(json.dumps(data))
-        if data['state'] == 'active':
-            return data
-
-        if data['state'] == 'upgrading':
-            retry = 0
-            while data['state'] != 'upgraded':
-                sleep(2)
-                retry += 2
-                if retry > self.timeout:
-                    raise Exception('Timeout of rancher finish upgrade service {}'.format(service_id))
-                r = self.s.get('{}/projects/{}/services/{}'.format(self.endpoint_url, environment_id, service_id))
-                r.raise_for_status()
-                data = r.json()
-
-        if data['state'] != 'upgraded':
-            raise Exception('Unable to finish upgrade service in state of {}'.format(data['state']))
-        r = self.s.post('{}/projects/{}/services/{}/'.format(self.endpoint_url, environment_id, service_id),
-                        params={'action': 'finishupgrade'})
-        r.raise_for_status()
+        # subscribe before reading state so that no change is missed
+        events = self.subscribe(environment_id)
+        try:
+            data = self.service(environment_id, service_id)
+            if data['state'] == 'active':
+                return data
 
-        # wait till service finish upgrading
-        retry = 0
-        while data['state'] != 'active':
-            sleep(2)
-            retry += 2
-            if retry > self.timeout:
-                raise Exception('Timeout of rancher finish upgrade service {}'.format(service_id))
-            r = self.s.get('{}/projects/{}/services/{}'.format(self.endpoint_url, environment_id, service_id))
+            if data['state'] == 'upgrading':
+                data = self.wait_service_state(environment_id, service_id, {'upgraded'}, events)
+
+            if data['state'] != 'upgraded':
+                raise Exception('Unable to finish upgrade service in state of {}'.format(data['state']))
+            r = self.s.post('{}/projects/{}/services/{}/'.format(self.endpoint_url, environment_id, service_id),
+                            params={'action': 'finishupgrade'})
             r.raise_for_status()
-            data = r.json()
 
-        return data
+            # wait till service finish upgrading
+            return self.wait_service_state(environment_id, service_id, {'active'}, events)
+        finally:
+            if events is not None:
+                events.close()
 
     def service_upgrade(self, environment_id: str, service_id: str, batch_size: int=1,
                         batch_interval: int=2, sidekicks: bool=False, start_before_stopping: bool=False) -> Dict:
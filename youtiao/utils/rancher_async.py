@@ -0,0 +1,474 @@
+# -*- coding: utf8 -*-
+"""asyncio counterpart of `youtiao.utils.rancher.RancherClient`
+
+Requires aiohttp, installed with the `async` extra of youtiao::
+
+    pip install youtiao[async]
+"""
+
+import asyncio
+import json
+from collections import defaultdict
+from time import monotonic
+from typing import Dict, Set
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from youtiao.utils.rancher import IdCache, RequestMetrics, backoff_delays, endpoint_name
+
+
+# responses of rancher behind a load balancer which are worth retrying
+RETRY_STATUSES = (502, 503, 504)
+
+
+class AsyncServiceEvents(object):
+    """Service resource change events of rancher environment shared by all waiters
+
+    A single websocket subscription per environment dispatches events to the queues of
+    services being waited for.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, url: str):
+        """
+        Args:
+            session (ClientSession): aiohttp session with rancher credentials
+            url (str): websocket URL of environment subscription
+        """
+        self.session = session
+        self.url = url
+        self.queues = defaultdict(set)  # type: Dict[str, Set[asyncio.Queue]]
+        self.ws = None
+        self.task = None
+        self.closed = False
+
+    async def start(self) -> None:
+        """Connect websocket and start dispatching events
+
+        Raises:
+            aiohttp.ClientError
+        """
+        self.ws = await self.session.ws_connect(self.url)
+        self.task = asyncio.ensure_future(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        try:
+            async for msg in self.ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                event = json.loads(msg.data)
+                if event.get('name') != 'resource.change' or event.get('resourceType') != 'service':
+                    # ping or change of other resources
+                    continue
+                resource = (event.get('data') or {}).get('resource')
+                for queue in self.queues.get(event.get('resourceId'), ()):
+                    queue.put_nowait(resource)
+        finally:
+            self.closed = True
+            # wake up waiters to fallback to polling
+            for queues in self.queues.values():
+                for queue in queues:
+                    queue.put_nowait(None)
+
+    def watch(self, service_id: str) -> asyncio.Queue:
+        """Queue receiving service info on each change of service, `None` when stream is closed"""
+        queue = asyncio.Queue()
+        if self.closed:
+            queue.put_nowait(None)
+        self.queues[service_id].add(queue)
+        return queue
+
+    def unwatch(self, service_id: str, queue: asyncio.Queue) -> None:
+        self.queues[service_id].discard(queue)
+        if not self.queues[service_id]:
+            del self.queues[service_id]
+
+    async def close(self) -> None:
+        if self.ws is not None:
+            await self.ws.close()
+        if self.task is not None:
+            await self.task
+
+
+class AsyncRancherClient(object):
+    """Rancher client running on asyncio event loop with a shared connection pool
+
+    Usage::
+
+        async with AsyncRancherClient(url, key, secret) as rancher_cli:
+            env_id = await rancher_cli.environment_id()
+    """
+
+    def __init__(self, endpoint_url: str, key: str, secret: str, event_stream: bool=True,
+                 id_cache: IdCache=None, request_timeout: float=30, retries: int=3, pool_size: int=100):
+        """
+        Args:
+            endpoint_url (str): rancher server API endpoint URL
+            key (str): rancher account or environment API access key
+            secret (str): rancher account or environment API secret corresponding to the access key
+            event_stream (bool): wait for service state change by subscribing rancher events,
+                fallback to polling if subscription fails
+            id_cache (IdCache): optional cache of environment, stack and service IDs
+            request_timeout (float): read timeout in second of each request
+            retries (int): max number of retries of idempotent requests
+            pool_size (int): max number of concurrent connections
+        """
+        self.endpoint_url = endpoint_url
+        self.endpoint_path = urlsplit(endpoint_url).path.rstrip('/')
+        self.key = key
+        self.secret = secret
+        self.event_stream = event_stream
+        self.id_cache = id_cache
+        self.request_timeout = request_timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self.metrics = RequestMetrics()
+        self.session = None
+        self.events = {}  # type: Dict[str, asyncio.Future]
+        # timeout in second for retry
+        self.timeout = 60
+        # max interval in second between polls
+        self.sleep_step = 2
+        # interval in second to check service state when no event received
+        self.event_timeout = 10
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _session(self) -> aiohttp.ClientSession:
+        # created in the running event loop
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                auth=aiohttp.BasicAuth(self.key, self.secret),
+                timeout=aiohttp.ClientTimeout(connect=min(self.request_timeout, 5),
+                                              sock_read=self.request_timeout),
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+            )
+        return self.session
+
+    async def close(self) -> None:
+        for future in self.events.values():
+            events = await future
+            if events is not None:
+                await events.close()
+        self.events = {}
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def request(self, method: str, url: str, params: Dict=None, json: Dict=None) -> Dict:
+        """
+        Send rancher API request. Idempotent requests are retried with backoff on connection
+        errors, read errors and 502/503/504 responses, POST actions only on connection errors.
+
+        Args:
+            method (str): HTTP method
+            url (str): request URL
+            params (dict): query parameters
+            json (dict): request body
+
+        Returns:
+            response in json
+
+        Raises:
+            aiohttp.ClientError
+            asyncio.TimeoutError
+        """
+        idempotent = method.upper() != 'POST'
+        delays = backoff_delays(initial=0.5, maximum=8)
+        endpoint = endpoint_name(self.endpoint_path, method, url, params)
+        start = monotonic()
+        retry = 0
+        while True:
+            try:
+                async with self._session().request(method, url, params=params, json=json) as resp:
+                    if resp.status in RETRY_STATUSES and idempotent and retry < self.retries:
+                        retry += 1
+                        await asyncio.sleep(next(delays))
+                        continue
+                    resp.raise_for_status()
+                    data = await resp.json(content_type=None)
+            except aiohttp.ClientConnectorError:
+                if retry >= self.retries:
+                    self.metrics.record(endpoint, monotonic() - start, error=True)
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not idempotent or retry >= self.retries or isinstance(e, aiohttp.ClientResponseError):
+                    self.metrics.record(endpoint, monotonic() - start, error=True)
+                    raise
+            else:
+                self.metrics.record(endpoint, monotonic() - start)
+                return data
+            retry += 1
+            await asyncio.sleep(next(delays))
+
+    async def first(self, path: str, params: Dict=None) -> Dict:
+        """
+        Get first resource of collection filtered by rancher server.
+
+        Args:
+            path (str): collection path relative to endpoint URL
+            params (dict): resource field filters
+
+        Returns:
+            resource in json, None if collection is empty
+        """
+        body = await self.request('GET', '{}/{}'.format(self.endpoint_url, path), dict(params or {}, limit=1))
+        return body['data'][0] if body['data'] else None
+
+    def cached_id(self, key: str) -> str:
+        if self.id_cache is None:
+            return None
+        return self.id_cache.get('{} {} {}'.format(self.endpoint_url, self.key, key))
+
+    def cache_id(self, key: str, resource_id: str=None) -> None:
+        """Cache resource ID, or invalidate cached one if `resource_id` is None"""
+        if self.id_cache is None:
+            return
+        key = '{} {} {}'.format(self.endpoint_url, self.key, key)
+        if resource_id is None:
+            self.id_cache.invalidate(key)
+        else:
+            self.id_cache.set(key, resource_id)
+
+    async def environment_id(self, name: str=None) -> str:
+        """
+        Get rancher environement ID. If using account key, return the environment ID specified by `name`.
+
+        Args:
+            name (str): name for the environment requested (only useful for account key)
+
+        Returns:
+            environment ID in string
+        """
+        cache_key = 'environment:{}'.format(name or '')
+        environment_id = self.cached_id(cache_key)
+        if environment_id:
+            return environment_id
+        project = await self.first('projects', {'name': name} if name else None)
+        if project is None:
+            return None
+        self.cache_id(cache_key, project['id'])
+        return project['id']
+
+    async def service_info(self, environment_id: str, stack_name: str, service_name: str) -> Dict:
+        """
+        Get rancher service info by given environment id and service name.
+
+        Args:
+            environment_id (str): defined environment id in rancher
+            stack_name (str): defined stack name in rancher
+            service_name (str): defined service name in rancher
+
+        Returns:
+            service info in json
+        """
+        if not environment_id:
+            raise Exception('Empty rancher environment ID')
+        stack_key = 'stack:{}:{}'.format(environment_id, stack_name)
+        service_key = 'service:{}:{}/{}'.format(environment_id, stack_name, service_name)
+        stack_id = self.cached_id(stack_key)
+        service_id = self.cached_id(service_key)
+        if stack_id and service_id:
+            try:
+                data = await self.service(environment_id, service_id)
+            except Exception:
+                data = None
+            if data and data.get('name') == service_name and data.get('stackId') == stack_id:
+                return data
+            # deleted or renamed since cached
+            self.cache_id(stack_key, None)
+            self.cache_id(service_key, None)
+
+        stack_info = await self.first('projects/{}/stacks'.format(environment_id), {'name': stack_name})
+        if not stack_info:
+            # stack not found
+            raise Exception('Stack {} not found'.format(stack_name))
+        self.cache_id(stack_key, stack_info['id'])
+
+        service_info = await self.first('projects/{}/services'.format(environment_id),
+                                        {'name': service_name, 'stackId': stack_info['id']})
+        if service_info:
+            self.cache_id(service_key, service_info['id'])
+        return service_info
+
+    async def service(self, environment_id: str, service_id: str) -> Dict:
+        """
+        Get rancher service info by given environment id and service id.
+
+        Args:
+            environment_id (str): defined environment id in rancher
+            service_id (str): defined service id in rancher
+
+        Returns:
+            service info in json
+        """
+        data = await self.request('GET', '{}/projects/{}/services/{}'.format(
+            self.endpoint_url, environment_id, service_id))
+        if data.get('type') == 'error':
+            raise Exception(json.dumps(data))
+        return data
+
+    async def subscribe(self, environment_id: str) -> AsyncServiceEvents:
+        """
+        Subscribe service change events of environment, shared by all waits in the environment.
+
+        Args:
+            environment_id (str): defined environment id in rancher
+
+        Returns:
+            event stream, None if event stream is disabled or subscription fails
+        """
+        if not self.event_stream:
+            return None
+        future = self.events.get(environment_id)
+        if future is not None and future.done() and future.result() is not None and future.result().closed:
+            # reconnect closed stream
+            future = None
+        if future is None:
+            future = self.events[environment_id] = asyncio.ensure_future(self._connect_events(environment_id))
+        return await future
+
+    async def _connect_events(self, environment_id: str) -> AsyncServiceEvents:
+        url = '{}/projects/{}/subscribe?eventNames=resource.change'.format(
+            self.endpoint_url.replace('http', 'ws', 1), environment_id)
+        events = AsyncServiceEvents(self._session(), url)
+        try:
+            await events.start()
+        except Exception:
+            # websocket not reachable, e.g. behind a proxy
+            return None
+        return events
+
+    async def wait_service_state(self, environment_id: str, service_id: str, states: Set[str],
+                                 events: AsyncServiceEvents=None) -> Dict:
+        """
+        Wait until service is in one of given states. State changes are received from event
+        stream if given, otherwise service is polled with exponential backoff.
+
+        Args:
+            environment_id (str): defined environment id in rancher
+            service_id (str): defined service id in rancher
+            states (set): expected service states
+            events (AsyncServiceEvents): environment event stream
+
+        Returns:
+            service info in json
+        """
+        deadline = monotonic() + self.timeout
+        delays = backoff_delays(maximum=self.sleep_step)
+        # watch before reading state so that no change is missed
+        queue = events.watch(service_id) if events is not None else None
+        try:
+            data = await self.service(environment_id, service_id)
+            while data['state'] not in states:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    raise Exception('Timeout of rancher finish upgrade service {}'.format(service_id))
+                if queue is not None:
+                    try:
+                        resource = await asyncio.wait_for(queue.get(), min(remaining, self.event_timeout))
+                    except asyncio.TimeoutError:
+                        resource = None
+                    else:
+                        if resource is None:
+                            # stream closed, fallback to polling
+                            events.unwatch(service_id, queue)
+                            queue = None
+                            continue
+                        data = resource
+                        continue
+                else:
+                    await asyncio.sleep(min(next(delays), remaining))
+                # no event for a while or polling
+                data = await self.service(environment_id, service_id)
+            return data
+        finally:
+            if queue is not None:
+                events.unwatch(service_id, queue)
+
+    async def service_finish_upgrade(self, environment_id: str, service_id: str) -> Dict:
+        """
+        Finish service upgrade when service is in `upgraded` state.
+
+        Args:
+            environment_id (str): defined environment id in rancher
+            service_id (str): defined environment id in rancher
+
+        Returns:
+            service info in json
+        """
+        events = await self.subscribe(environment_id)
+        data = await self.service(environment_id, service_id)
+        if data['state'] == 'active':
+            return data
+
+        if data['state'] == 'upgrading':
+            data = await self.wait_service_state(environment_id, service_id, {'upgraded'}, events)
+
+        if data['state'] != 'upgraded':
+            raise Exception('Unable to finish upgrade service in state of {}'.format(data['state']))
+        await self.request('POST', '{}/projects/{}/services/{}/'.format(self.endpoint_url, environment_id, service_id),
+                           params={'action': 'finishupgrade'})
+
+        # wait till service finish upgrading
+        return await self.wait_service_state(environment_id, service_id, {'active'}, events)
+
+    async def service_upgrade(self, environment_id: str, service_id: str, batch_size: int=1,
+                              batch_interval: int=2, sidekicks: bool=False,
+                              start_before_stopping: bool=False) -> Dict:
+        """
+        Upgrade service
+
+        Args:
+            environment_id (str): defined environment id in rancher
+            service_id (str): defined environment id in rancher
+            batch_size (int): number of containers to upgrade at once
+            batch_interval (int): interval (in second) between upgrade batches
+            sidekicks (bool): upgrade sidekicks services at the same time
+            start_before_stopping (bool): start new containers before stopping the old ones
+
+        Returns:
+            service info in json
+        """
+        data = await self.service(environment_id, service_id)
+        if data['state'] != 'active':
+            raise Exception('Service {} in state of {}, cannot upgrade'.format(service_id, data['state']))
+
+        upgrade_input = {'inServiceStrategy': {
+            'batchSize': batch_size,
+            'intervalMillis': batch_interval * 1000,
+            'startFirst': start_before_stopping,
+            'launchConfig': data['launchConfig'],
+            'secondaryLaunchConfigs': [],
+        }}
+        if sidekicks:
+            upgrade_input['inServiceStrategy']['secondaryLaunchConfigs'] = data['secondaryLaunchConfigs']
+
+        return await self.request('POST', '{}/projects/{}/services/{}/'.format(
+            self.endpoint_url, environment_id, service_id), params={'action': 'upgrade'}, json=upgrade_input)
+
+
+async def deploy_service(rancher_cli: AsyncRancherClient, environment_id: str, stack_name: str,
+                         service_name: str, **options) -> Dict:
+    """Upgrade service and wait till upgrade finished
+
+    Args:
+        rancher_cli (AsyncRancherClient): rancher client
+        environment_id (str): defined environment id in rancher
+        stack_name (str): defined stack name in rancher
+        service_name (str): defined service name in rancher
+        options: upgrade options of `AsyncRancherClient.service_upgrade`
+
+    Returns:
+        service info in json
+    """
+    service_info = await rancher_cli.service_info(environment_id, stack_name, service_name)
+    if not service_info:
+        raise Exception('Service {} not found in rancher'.format(service_name))
+    await rancher_cli.service_finish_upgrade(environment_id, service_info['id'])
+    await rancher_cli.service_upgrade(environment_id, service_info['id'], **options)
+    return await rancher_cli.service_finish_upgrade(environment_id, service_info['id'])
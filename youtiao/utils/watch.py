@@ -0,0 +1,198 @@
+# -*- coding: utf8 -*-
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from typing import Dict, Iterator, List, Set, Tuple
+
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+class InotifyWatcher(object):
+    """Watch directory trees for file changes with Linux inotify"""
+
+    mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, paths: List[str], suffix: str=''):
+        """
+        Args:
+            paths (list): directories watched recursively
+            suffix (str): only report files with this filename suffix
+
+        Raises:
+            OSError: inotify is not available, or watch limit is reached
+        """
+        self.suffix = suffix
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}  # type: Dict[int, str]
+        try:
+            for path in paths:
+                self._add_tree(path)
+        except BaseException:
+            # e.g. watch limit reached, fd would leak as caller gets no watcher to close
+            os.close(self.fd)
+            raise
+
+    def _add_tree(self, path: str) -> Set[str]:
+        """Watch directory tree, returns files with suffix already in it
+
+        Raises:
+            OSError: watch limit reached
+        """
+        files = set()
+        for dir_path, _, filenames in os.walk(path):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(dir_path), self.mask)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOENT:
+                    # removed since listed
+                    continue
+                raise OSError(error, 'inotify_add_watch failed on {}'.format(dir_path))
+            self.watches[wd] = dir_path
+            # written before watch was added, or moved in with directory
+            files.update(os.path.join(dir_path, fn) for fn in filenames if fn.endswith(self.suffix))
+        return files
+
+    def poll(self, timeout: float) -> Set[str]:
+        """Wait for file changes
+
+        Args:
+            timeout (float): max seconds to wait
+
+        Returns:
+            set of changed file paths, empty if nothing changed before timeout
+
+        Raises:
+            OSError: watch limit reached by new directory
+        """
+        changed = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+            dir_path = self.watches.get(wd)
+            if dir_path is None or not name:
+                continue
+            path = os.path.join(dir_path, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # watch new sub directory, created with `mkdir -p` and copy or moved in
+                    changed |= self._add_tree(path)
+                continue
+            if path.endswith(self.suffix):
+                changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+    """Watch directory trees for file changes by comparing file stats periodically"""
+
+    def __init__(self, paths: List[str], suffix: str='', interval: float=1.0):
+        """
+        Args:
+            paths (list): directories watched recursively
+            suffix (str): only report files with this filename suffix
+            interval (float): seconds between scans
+        """
+        self.paths = paths
+        self.suffix = suffix
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for path in self.paths:
+            for dir_path, _, filenames in os.walk(path):
+                for fn in filenames:
+                    if not fn.endswith(self.suffix):
+                        continue
+                    file_path = os.path.join(dir_path, fn)
+                    try:
+                        st = os.stat(file_path)
+                    except FileNotFoundError:
+                        continue
+                    snapshot[file_path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def poll(self, timeout: float) -> Set[str]:
+        """Wait for file changes
+
+        Args:
+            timeout (float): max seconds to wait
+
+        Returns:
+            set of changed file paths, empty if nothing changed before timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {p for p in set(snapshot) | set(self.snapshot) if snapshot.get(p) != self.snapshot.get(p)}
+            self.snapshot = snapshot
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self) -> None:
+        pass
+
+
+def make_watcher(paths: List[str], suffix: str=''):
+    """Create inotify watcher, fallback to polling watcher if inotify is not available
+
+    Args:
+        paths (list): directories watched recursively
+        suffix (str): only report files with this filename suffix
+    """
+    try:
+        return InotifyWatcher(paths, suffix)
+    except (OSError, AttributeError, TypeError):
+        # not on Linux or inotify limit reached
+        return PollingWatcher(paths, suffix)
+
+
+def watch_changes(watcher, debounce: float=0.2) -> Iterator[Set[str]]:
+    """Debounced file changes
+
+    Args:
+        watcher (object): InotifyWatcher or PollingWatcher
+        debounce (float): a batch of changes ends when nothing changed for this seconds
+
+    Returns:
+        Iterator of sets of changed file paths
+    """
+    while True:
+        changed = watcher.poll(60)
+        if not changed:
+            continue
+        while True:
+            more = watcher.poll(debounce)
+            if not more:
+                break
+            changed |= more
+        yield changed